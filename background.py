@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[..., Awaitable[Any]]
+
+
+class BackgroundTasks:
+    """Ограниченная очередь фоновых задач для обработчиков
+
+    Обработчик кладет задачу и сразу отвечает пользователю, а отправку
+    выполняют воркеры. Упавшая задача только логируется, упавший воркер
+    перезапускается, а stop() дожидается выполнения всего, что уже в очереди.
+    """
+
+    def __init__(self, max_pending: int = 1000, workers: int = 4):
+        if workers < 1:
+            raise ValueError("число фоновых воркеров должно быть положительным")
+        self.max_pending = max_pending
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._start_lock = asyncio.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self):
+        async with self._start_lock:
+            if self._queue is not None:
+                return
+            self._stopping = False
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._tasks = [self._spawn_worker() for _ in range(self.workers)]
+
+    def _spawn_worker(self) -> asyncio.Task:
+        task = asyncio.create_task(self._worker())
+        task.add_done_callback(self._on_worker_done)
+        return task
+
+    def _on_worker_done(self, task: asyncio.Task):
+        if task.cancelled() or self._stopping:
+            return
+        logger.error(f"Фоновый воркер остановился: {task.exception()!r}, перезапускаю")
+        self._tasks.remove(task)
+        self._tasks.append(self._spawn_worker())
+
+    async def submit(self, job: Job, *args, name: str = None):
+        """Ставит job(*args) в очередь; ждет только если очередь переполнена"""
+        if self._stopping:
+            raise RuntimeError("фоновая очередь остановлена")
+        await self.start()
+        self.submitted += 1
+        await self._queue.put((job, args, name or getattr(job, '__name__', repr(job))))
+
+    async def _worker(self):
+        while True:
+            job, args, name = await self._queue.get()
+            try:
+                await job(*args)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Фоновая задача {name} завершилась ошибкой: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """Ждет выполнения всех задач, поставленных к этому моменту"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Перестает принимать задачи, дожидается очереди и останавливает воркеров"""
+        if self._queue is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Фоновая очередь не разобрана за {timeout} с, осталось задач: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def metrics(self) -> dict:
+        return {
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
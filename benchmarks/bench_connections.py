@@ -0,0 +1,80 @@
+"""Сравнение задержки одного запроса: новое соединение на каждый вызов против общего набора.
+
+Запуск: python benchmarks/bench_connections.py [--reports 10000] [--calls 500]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+
+QUERY = '''
+    select current_stage, plans, problems, created_at
+    from reports
+    where user_id = ? and created_at >= ?
+    order by created_at desc
+'''
+
+
+async def seed(db: Database, reports: int, students: int):
+    for user_id in range(1, students + 1):
+        await db.add_user(user_id, username=f"student{user_id}")
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.executemany(
+            "insert into reports (user_id, current_stage, plans, problems) values (?, ?, ?, ?)",
+            [((i % students) + 1, "stage", "plans", "problems") for i in range(reports)],
+        )
+        await connection.commit()
+
+
+async def per_call_connect(db_path: str, user_id: int):
+    async with aiosqlite.connect(db_path) as connection:
+        cursor = await connection.execute(QUERY, (user_id, "1970-01-01 00:00:00"))
+        return await cursor.fetchall()
+
+
+async def shared_connection(db: Database, user_id: int):
+    async with db._connection() as connection:
+        cursor = await connection.execute(QUERY, (user_id, "1970-01-01 00:00:00"))
+        return await cursor.fetchall()
+
+
+async def measure(label: str, call, calls: int, students: int):
+    timings = []
+    for i in range(calls):
+        started = time.perf_counter()
+        await call((i % students) + 1)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{label:<24} mean={statistics.mean(timings):.3f}ms p50={statistics.median(timings):.3f}ms p99={p99:.3f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=10_000)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database()
+        db.db_path = str(Path(tmp) / "reports.db")
+        await db.init_db()
+        await seed(db, args.reports, args.students)
+        print(f"reports={args.reports} students={args.students} calls={args.calls}")
+        await measure("connect() per call", lambda user_id: per_call_connect(db.db_path, user_id), args.calls, args.students)
+        await measure("persistent connection", lambda user_id: shared_connection(db, user_id), args.calls, args.students)
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
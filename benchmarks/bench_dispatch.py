@@ -0,0 +1,152 @@
+"""Стоимость выбора обработчика на одно обновление при всех зарегистрированных обработчиках.
+
+Сравнивает прежнюю схему (лямбда-фильтр на каждую кнопку и Command на каждую
+команду, проверяются по очереди) с routing.Router, который находит обработчик
+одним поиском в словаре. Набор кнопок, команд и обработчиков состояний берется
+из настоящих модулей handlers; сами обработчики пустые, поэтому измеряется
+только диспетчеризация aiogram.
+
+Запуск: python benchmarks/bench_dispatch.py [--updates 20000]
+"""
+import argparse
+import asyncio
+import math
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from handlers.admin_handlers import register_admin_handlers  # noqa: E402
+from handlers.curator_handlers import register_curator_handlers  # noqa: E402
+from handlers.student_handlers import register_student_handlers  # noqa: E402
+from routing import CALLBACK_FACTORIES, router_for  # noqa: E402
+from states import AdminStates, CuratorStates, ReportStates  # noqa: E402
+
+LEGACY_CALLBACK_PREFIXES = ('stage_', 'plans_', 'read_', 'view_reports_')
+STATES = [
+    *ReportStates.__all_states__, *CuratorStates.__all_states__, *AdminStates.__all_states__,
+]
+
+
+class CapturingDispatcher:
+    def message(self, *filters, **kwargs):
+        return lambda handler: handler
+
+    def callback_query(self, *filters, **kwargs):
+        return lambda handler: handler
+
+
+def collect_routes():
+    """Кнопки и команды, которые регистрируют модули handlers"""
+    dispatcher = CapturingDispatcher()
+    services = SimpleNamespace()
+    register_student_handlers(dispatcher, services, services)
+    register_curator_handlers(dispatcher, services, services)
+    register_admin_handlers(dispatcher, services, services)
+    router = router_for(dispatcher)
+    return list(router.texts), list(router.commands)
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+def legacy_dispatcher(texts, commands) -> Dispatcher:
+    dp = Dispatcher()
+    for command in commands:
+        dp.message.register(noop, Command(command))
+    for state in STATES:
+        dp.message.register(noop, state)
+    for label in texts:
+        dp.message.register(noop, lambda message, label=label: message.text == label)
+    for prefix in LEGACY_CALLBACK_PREFIXES:
+        dp.callback_query.register(noop, lambda c, prefix=prefix: c.data.startswith(prefix))
+    dp.message.register(noop)
+    return dp
+
+
+def router_dispatcher(texts, commands) -> Dispatcher:
+    dp = Dispatcher()
+    router = router_for(dp)
+    router.text(*texts)(noop)
+    router.command(*commands)(noop)
+    for factory in CALLBACK_FACTORIES.values():
+        router.callback(factory)(noop)
+    for state in STATES:
+        dp.message.register(noop, state)
+    dp.message.register(noop)
+    return dp
+
+
+def make_updates(count: int, texts, commands):
+    user = User(id=1, is_bot=False, first_name="User")
+    chat = Chat(id=1, type="private")
+    rng = random.Random(1)
+    updates = []
+    for update_id in range(count):
+        kind = rng.random()
+        if kind < 0.2:
+            callback = CallbackQuery(id=str(update_id), from_user=user, chat_instance="1",
+                                     data=f"read:{update_id}")
+            updates.append(Update(update_id=update_id, callback_query=callback))
+            continue
+        if kind < 0.6:
+            text = rng.choice(texts)
+        elif kind < 0.9:
+            text = f"/{rng.choice(commands)}"
+        else:
+            text = "произвольный текст"
+        message = Message(message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text=text)
+        updates.append(Update(update_id=update_id, message=message))
+    return updates
+
+
+def percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+async def measure(name: str, dp: Dispatcher, bot: Bot, updates):
+    timings = []
+    for update in updates:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        timings.append(time.perf_counter() - started)
+    print(
+        f"{name:<7} p50={percentile(timings, 50) * 1e6:7.1f}us p99={percentile(timings, 99) * 1e6:7.1f}us "
+        f"mean={sum(timings) / len(timings) * 1e6:7.1f}us"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+    texts, commands = collect_routes()
+    print(f"кнопок: {len(texts)}, команд: {len(commands)}, состояний: {len(STATES)}")
+    updates = make_updates(args.updates, texts, commands)
+    # Прежние обработчики ждут callback data в формате read_<id>
+    legacy_updates = [
+        update.model_copy(update={'callback_query': update.callback_query.model_copy(
+            update={'data': update.callback_query.data.replace(':', '_')})})
+        if update.callback_query else update
+        for update in updates
+    ]
+    bot = Bot(token="1:benchmark")
+    try:
+        await measure("legacy", legacy_dispatcher(texts, commands), bot, legacy_updates)
+        await measure("router", router_dispatcher(texts, commands), bot, updates)
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Задержка get/set состояний FSM (p50/p99): MemoryStorage против SQLiteStorage.
+
+Для SQLiteStorage измеряются горячий путь (сессия в LRU-кэше), холодное чтение
+(кэш пуст, сессия читается из базы) и запись накопленных изменений пачкой.
+
+Запуск: python benchmarks/bench_fsm_storage.py [--sessions 5000] [--rounds 3]
+"""
+import argparse
+import asyncio
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+from fsm_storage import SQLiteStorage  # noqa: E402
+
+STATE = "ReportStates:waiting_for_plans"
+
+
+def percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def session_data(user_id: int) -> dict:
+    # Примерно как у отчета: выбранный этап, план и контекст из базы
+    return {
+        "current_stage": "Этап 3: Алгоритмы",
+        "plans": "Разобрать задачи на графы и повторить динамическое программирование " * 2,
+        "report_context": {"curator_id": 1, "last_stage": "Этап 2", "has_previous_reports": True,
+                           "username": f"user{user_id}", "first_name": "Имя", "last_name": "Фамилия"},
+    }
+
+
+async def timed(samples: list, call):
+    started = time.perf_counter()
+    result = await call
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+async def measure(name: str, storage, keys, rounds: int):
+    timings = {"set_state": [], "set_data": [], "get_state": [], "get_data": []}
+    for _ in range(rounds):
+        for key in keys:
+            await timed(timings["set_state"], storage.set_state(key, STATE))
+            await timed(timings["set_data"], storage.set_data(key, session_data(key.user_id)))
+            await timed(timings["get_state"], storage.get_state(key))
+            await timed(timings["get_data"], storage.get_data(key))
+    report(name, timings)
+
+
+def report(name: str, timings: dict):
+    line = "  ".join(
+        f"{operation} p50={percentile(samples, 50) * 1e6:7.1f}us p99={percentile(samples, 99) * 1e6:7.1f}us"
+        for operation, samples in timings.items()
+    )
+    print(f"{name:<14} {line}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(args.sessions)]
+
+    await measure("memory", MemoryStorage(), keys, args.rounds)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database()
+        db.db_path = str(Path(tmp) / "reports.db")
+        await db.init_db()
+        storage = SQLiteStorage(db, cache_size=args.sessions, flush_batch_size=args.sessions + 1)
+        await measure("sqlite (hot)", storage, keys, args.rounds)
+
+        started = time.perf_counter()
+        flushed = await storage.flush()
+        elapsed = time.perf_counter() - started
+        print(f"{'flush':<14} {flushed} сессий за {elapsed * 1000:.1f}ms ({elapsed / flushed * 1e6:.1f}us на сессию)")
+
+        # Холодное чтение: новый процесс с пустым кэшем
+        cold = SQLiteStorage(db, cache_size=args.sessions)
+        timings = {"get_state": [], "get_data": []}
+        for key in keys:
+            await timed(timings["get_state"], cold.get_state(key))
+            await timed(timings["get_data"], cold.get_data(key))
+        report("sqlite (cold)", timings)
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
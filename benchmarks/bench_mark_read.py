@@ -0,0 +1,160 @@
+"""Задержка ответа на кнопку «прочитано» (p50/p99) под параллельной нагрузкой.
+
+Сравнивает прежний порядок (отметка, отчет, профиль, затем ответ на callback)
+с текущим обработчиком, который отвечает сразу и делает один запрос.
+
+Запуск: python benchmarks/bench_mark_read.py [--reports 2000] [--concurrency 32] [--send-latency 0.05]
+"""
+import argparse
+import asyncio
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from background import BackgroundTasks  # noqa: E402
+from database import Database  # noqa: E402
+from handlers.curator_handlers import register_curator_handlers  # noqa: E402
+from routing import ReadReportCallback, router_for  # noqa: E402
+
+CURATOR_ID = 1
+
+
+class CapturingDispatcher:
+    def __init__(self):
+        self.callbacks = {}
+
+    def message(self, *filters, **kwargs):
+        return lambda handler: handler
+
+    def callback_query(self, *filters, **kwargs):
+        def decorator(handler):
+            self.callbacks[handler.__name__] = handler
+            return handler
+        return decorator
+
+
+class TimedCallback:
+    """CallbackQuery, который запоминает момент ответа и изменения сообщения"""
+
+    def __init__(self, report_id: int, send_latency: float):
+        self.from_user = SimpleNamespace(id=CURATOR_ID)
+        self.data = ReadReportCallback(report_id=report_id).pack()
+        self.send_latency = send_latency
+        self.answered_at = None
+        self.message = SimpleNamespace(text="Отчет", edit_text=self._edit_text)
+
+    async def answer(self, text="", **kwargs):
+        await asyncio.sleep(self.send_latency)
+        self.answered_at = time.perf_counter()
+
+    async def _edit_text(self, text, **kwargs):
+        await asyncio.sleep(self.send_latency)
+
+
+async def seed(db_path: str, reports: int):
+    students = range(100, 100 + max(1, reports // 10))
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.execute(
+            "insert into users (user_id, username, user_type) values (?, 'curator', 'curator')", (CURATOR_ID,)
+        )
+        await connection.executemany(
+            "insert into users (user_id, username, first_name, last_name) values (?, ?, 'Name', ?)",
+            [(user_id, f"user{user_id}", f"Last{user_id}") for user_id in students],
+        )
+        await connection.executemany(
+            "insert into curator_student_relations (curator_id, student_id) values (?, ?)",
+            [(CURATOR_ID, user_id) for user_id in students],
+        )
+        await connection.executemany(
+            "insert into reports (user_id, current_stage, plans, problems) values (?, 'stage', 'plans', 'problems')",
+            [(students[index % len(students)],) for index in range(reports)],
+        )
+        await connection.commit()
+
+
+def percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+async def legacy_handler(db: Database, callback: TimedCallback):
+    report_id = ReadReportCallback.unpack(callback.data).report_id
+    await db.mark_report_as_read(report_id, CURATOR_ID)
+    report = await db.get_report_by_id(report_id)
+    await callback.answer("✅ Отчет отмечен как прочитанный!")
+    await db.get_user_profile(report['user_id'])
+    await callback.message.edit_text("✅ *ПРОЧИТАНО*")
+
+
+async def measure(name: str, handle, report_ids, concurrency: int, send_latency: float):
+    semaphore = asyncio.Semaphore(concurrency)
+    to_answer, total = [], []
+
+    async def one(report_id: int):
+        async with semaphore:
+            callback = TimedCallback(report_id, send_latency)
+            started = time.perf_counter()
+            await handle(callback)
+            to_answer.append(callback.answered_at - started)
+            total.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(report_id) for report_id in report_ids))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<8} answer p50={percentile(to_answer, 50) * 1000:7.2f}ms p99={percentile(to_answer, 99) * 1000:7.2f}ms  "
+        f"total p50={percentile(total, 50) * 1000:7.2f}ms p99={percentile(total, 99) * 1000:7.2f}ms  "
+        f"throughput={len(report_ids) / elapsed:7.1f}/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--send-latency", type=float, default=0.0,
+                        help="имитация задержки запроса к Telegram, секунды")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "reports.db")
+        db = Database()
+        db.db_path = db_path
+        await db.init_db()
+        await db.close()
+        await seed(db_path, args.reports)
+
+        db = Database()
+        db.db_path = db_path
+        await db.init_db()
+
+        async def notify(student_id, report):
+            await asyncio.sleep(args.send_latency)
+
+        notification_service = SimpleNamespace(
+            notify_student_report_read=notify,
+            background=BackgroundTasks(max_pending=args.reports + 1),
+        )
+        dispatcher = CapturingDispatcher()
+        register_curator_handlers(dispatcher, db, notification_service)
+        mark_report_read = router_for(dispatcher).handlers["mark_report_read"]
+
+        async def handler(callback: TimedCallback):
+            await mark_report_read(callback, ReadReportCallback.unpack(callback.data))
+
+        half = args.reports // 2
+        await measure("legacy", lambda callback: legacy_handler(db, callback),
+                      range(1, half + 1), args.concurrency, args.send_latency)
+        await measure("fast-ack", handler, range(half + 1, args.reports + 1), args.concurrency, args.send_latency)
+        await notification_service.background.stop()
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Пропускная способность чтения в зависимости от размера набора читающих соединений.
+
+Запуск: python benchmarks/bench_read_pool.py [--students 5000] [--requests 64]
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+
+
+async def seed(db_path: str, students: int):
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.executemany(
+            "insert into users (user_id, username, first_name, last_name, user_type) values (?, ?, 'Name', ?, ?)",
+            [(user_id, f"user{user_id}", f"Last{user_id}", 'curator' if user_id <= 50 else 'student')
+             for user_id in range(1, students + 1)],
+        )
+        await connection.executemany(
+            "insert into curator_student_relations (curator_id, student_id) values (?, ?)",
+            [((user_id % 50) + 1, user_id) for user_id in range(51, students + 1)],
+        )
+        await connection.commit()
+
+
+async def run(db_path: str, pool_size: int, requests: int):
+    db = Database()
+    db.db_path = db_path
+    db.read_pool_size = pool_size
+    await db.init_db()
+    started = time.perf_counter()
+    await asyncio.gather(*(db.get_all_students_with_curators() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    metrics = db.read_pool_metrics()
+    print(
+        f"pool={pool_size:<2} elapsed={elapsed * 1000:8.1f}ms throughput={requests / elapsed:7.1f}/s "
+        f"avg_wait={metrics['avg_wait_ms']:7.1f}ms max_wait={metrics['max_wait_ms']:7.1f}ms"
+    )
+    await db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "reports.db")
+        db = Database()
+        db.db_path = db_path
+        await db.init_db()
+        await db.close()
+        await seed(db_path, args.students)
+        for size in args.sizes:
+            await run(db_path, size, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Выбор получателей напоминания: цикл N+1 против одного anti-join запроса.
+
+Запуск: python benchmarks/bench_reminder_recipients.py [--sizes 1000 10000 50000]
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+
+
+async def seed(db_path: str, students: int):
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.executemany(
+            "insert into users (user_id, username, user_type) values (?, ?, 'student')",
+            [(user_id, f"student{user_id}") for user_id in range(1, students + 1)],
+        )
+        # Половина учеников уже отчиталась на этой неделе, у всех есть старые отчеты
+        await connection.executemany(
+            "insert into reports (user_id, current_stage, plans, problems, created_at) "
+            "values (?, 'stage', 'plans', 'problems', datetime('now', '-30 days'))",
+            [(user_id,) for user_id in range(1, students + 1)],
+        )
+        await connection.executemany(
+            "insert into reports (user_id, current_stage, plans, problems) values (?, 'stage', 'plans', 'problems')",
+            [(user_id,) for user_id in range(1, students + 1, 2)],
+        )
+        await connection.commit()
+
+
+async def n_plus_one(db: Database):
+    result = []
+    for user in await db.get_all_active_users():
+        if not await db.get_reports_for_current_week(user['user_id']):
+            result.append(user['user_id'])
+    return result
+
+
+async def run(students: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database()
+        db.db_path = str(Path(tmp) / "reports.db")
+        await db.init_db()
+        await seed(db.db_path, students)
+        # Отчеты вставлены в обход save_report, поэтому журнал недель строим заново
+        await db.check_week_status_consistency(repair=True)
+
+        started = time.perf_counter()
+        looped = await n_plus_one(db)
+        loop_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        joined = await db.get_weekly_reminder_recipients()
+        join_ms = (time.perf_counter() - started) * 1000
+
+        assert sorted(looped) == joined
+        print(f"students={students:<6} recipients={len(joined):<6} n+1={loop_ms:9.1f}ms anti-join={join_ms:7.1f}ms")
+        await db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        await run(size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
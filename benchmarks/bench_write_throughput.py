@@ -0,0 +1,53 @@
+"""Пропускная способность записи: 1000 одновременных отчетов с групповой фиксацией и без нее.
+
+Запуск: python benchmarks/bench_write_throughput.py [--submissions 1000]
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+
+
+async def run(submissions: int, max_batch: int, batch_window: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database()
+        db.db_path = str(Path(tmp) / "reports.db")
+        db.write_max_batch = max_batch
+        db.write_batch_window = batch_window
+        await db.init_db()
+        for user_id in range(1, submissions + 1):
+            await db.add_user(user_id, username=f"student{user_id}")
+
+        batches_before = db._writer.committed_batches
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            db.save_report(user_id, "stage", "plans", "problems")
+            for user_id in range(1, submissions + 1)
+        ))
+        elapsed = time.perf_counter() - started
+
+        commits = db._writer.committed_batches - batches_before
+        print(
+            f"max_batch={max_batch:<4} window={batch_window * 1000:.0f}ms "
+            f"elapsed={elapsed * 1000:8.1f}ms throughput={submissions / elapsed:8.0f}/s "
+            f"commits={commits}"
+        )
+        await db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions", type=int, default=1000)
+    args = parser.parse_args()
+    await run(args.submissions, max_batch=1, batch_window=0)
+    await run(args.submissions, max_batch=100, batch_window=0.005)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
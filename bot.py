@@ -2,16 +2,17 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, Message
 from database import Database
-from notifications import NotificationService
-from scheduler import Scheduler
+from fsm_storage import SQLiteStorage
+from notifications import INTERACTIVE_KINDS, NotificationService
+from routing import router_for
+from scheduler import default_job_schedules
 from handlers.student_handlers import register_student_handlers
 from handlers.curator_handlers import register_curator_handlers
 from handlers.admin_handlers import register_admin_handlers
+import config
 from config import BOT_TOKEN
 
 
@@ -20,15 +21,25 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
 db = Database()
-notification_service = NotificationService(bot, db)
-scheduler = Scheduler(notification_service)
+storage = SQLiteStorage(
+    db,
+    cache_size=int(config.FSM_CACHE_SIZE),
+    cache_ttl=float(config.FSM_CACHE_TTL_SECONDS),
+    session_ttl=float(config.FSM_SESSION_TTL_SECONDS),
+    flush_interval=float(config.FSM_FLUSH_INTERVAL_SECONDS),
+    flush_batch_size=int(config.FSM_FLUSH_BATCH_SIZE),
+)
+dp = Dispatcher(storage=storage)
+# Бот доставляет только уведомления в ответ на действия пользователей;
+# задачи по расписанию и массовые рассылки выполняет worker.py
+notification_service = NotificationService(bot, db, outbox_kinds=INTERACTIVE_KINDS)
 
+# Кнопки, команды и callback-кнопки идут через один обработчик, который стоит первым
+router_for(dp)
 register_student_handlers(dp, db, notification_service)
 register_curator_handlers(dp, db, notification_service)
-register_admin_handlers(dp, db, notification_service)
+register_admin_handlers(dp, db, notification_service, default_job_schedules())
 
 async def get_role_based_help(user_id: int) -> tuple[str, ReplyKeyboardMarkup]:
     """Возвращает help-сообщение и клавиатуру в зависимости от роли пользователя"""
@@ -49,6 +60,7 @@ async def get_role_based_help(user_id: int) -> tuple[str, ReplyKeyboardMarkup]:
             "`/activate_curator` - активировать куратора\n"
             "`/students_without_curators` - ученики без кураторов\n"
             "`/admin_stats` - статистика\n"
+            "`/jobs` - задачи планировщика\n"
             "`/help` - помощь"
         )
         keyboard = ReplyKeyboardMarkup(
@@ -70,6 +82,7 @@ async def get_role_based_help(user_id: int) -> tuple[str, ReplyKeyboardMarkup]:
             "`/my_students` - мои ученики\n"
             "`/all_students` - все ученики и их кураторы\n"
             "`/reports` - непрочитанные отчеты\n"
+            "`/digest` - режим уведомлений о новых отчетах\n"
             "`/help` - помощь"
         )
         keyboard = ReplyKeyboardMarkup(
@@ -100,30 +113,38 @@ async def get_role_based_help(user_id: int) -> tuple[str, ReplyKeyboardMarkup]:
     
     return help_text, keyboard
 
-# Обработчик случайных сообщений
+# Обработчик случайных сообщений; регистрируется последним, /help обрабатывает student_handlers
 @dp.message()
-async def random_message_handler(message):
+async def random_message_handler(message: Message):
     user_id = message.from_user.id
     
     help_text, keyboard = await get_role_based_help(user_id)
     await message.answer(help_text, reply_markup=keyboard)
 
-# Обработчик команды /help
-@dp.message(Command("help"))
-async def help_handler(message: Message):
-    user_id = message.from_user.id
-    help_text, keyboard = await get_role_based_help(user_id)
-    await message.answer(help_text, reply_markup=keyboard)
-
 async def main():
     await db.init_db()
     
-    reminder_task = asyncio.create_task(scheduler.start_weekly_reminders())
+    storage_task = asyncio.create_task(storage.run())
+    outbox_task = asyncio.create_task(notification_service.outbox.run())
+    # Граф связей в памяти читают обработчики бота, поэтому сверка идет здесь, а не в worker
+    reconcile_task = asyncio.create_task(
+        db.run_relation_reconciliation(float(config.RELATION_RECONCILE_INTERVAL_SECONDS))
+    )
+    stats_task = asyncio.create_task(
+        notification_service.run_delivery_stats(float(config.DELIVERY_STATS_FLUSH_INTERVAL_SECONDS))
+    )
     
     try:
         await dp.start_polling(bot)
     finally:
-        reminder_task.cancel()
+        reconcile_task.cancel()
+        outbox_task.cancel()
+        await notification_service.background.stop(timeout=float(config.BACKGROUND_SHUTDOWN_TIMEOUT_SECONDS))
+        stats_task.cancel()
+        await notification_service.flush_delivery_stats()
+        storage_task.cancel()
+        await storage.close()
+        await db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+Clock = Callable[[], float]
+Sleep = Callable[[float], Awaitable[Any]]
+
+
+class TokenBucket:
+    """Глобальный лимит отправок: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Clock = time.monotonic,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError("скорость рассылки должна быть положительной")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов всем отправителям, например по RetryAfter"""
+        now = self._clock()
+        self._refill(now)
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + seconds)
+
+    async def acquire(self):
+        # Ожидающие обслуживаются по очереди, иначе после паузы они разом разберут все токены
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await self._sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                # Допуск на погрешность float, иначе ожидание может выродиться в ноль
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return
+                await self._sleep((1 - self._tokens) / self.rate)
+
+
+class ChatPacer:
+    """Не чаще одного сообщения в interval секунд в один чат"""
+
+    def __init__(
+        self,
+        interval: float,
+        clock: Clock = time.monotonic,
+        sleep: Sleep = asyncio.sleep,
+        max_tracked: int = 10000,
+    ):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._max_tracked = max_tracked
+        self._next_slot: Dict[Hashable, float] = {}
+
+    async def wait(self, chat_id: Hashable):
+        now = self._clock()
+        if len(self._next_slot) > self._max_tracked:
+            self._next_slot = {chat: slot for chat, slot in self._next_slot.items() if slot > now}
+        slot = max(now, self._next_slot.get(chat_id, now))
+        self._next_slot[chat_id] = slot + self.interval
+        if slot > now:
+            await self._sleep(slot - now)
+
+
+class BroadcastResult(NamedTuple):
+    total: int
+    done: int
+    delivered: int
+    failed: int
+    elapsed: float
+
+
+class Broadcaster:
+    """Массовая рассылка ограниченным числом воркеров с учетом лимитов Telegram"""
+
+    def __init__(
+        self,
+        rate: float,
+        chat_interval: float,
+        workers: int,
+        progress_every: int = 100,
+        clock: Clock = time.monotonic,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        if workers < 1:
+            raise ValueError("число воркеров рассылки должно быть положительным")
+        self.bucket = TokenBucket(rate, clock=clock, sleep=sleep)
+        self.pacer = ChatPacer(chat_interval, clock=clock, sleep=sleep)
+        self.workers = workers
+        self.progress_every = progress_every
+        self._clock = clock
+
+    async def throttle(self, chat_id: Hashable):
+        """Ждет разрешения на одну отправку в чат; вызывается перед каждой попыткой"""
+        await self.pacer.wait(chat_id)
+        await self.bucket.acquire()
+
+    async def run(
+        self,
+        items: Iterable[Any],
+        deliver: Callable[[Any], Awaitable[bool]],
+        name: str = "рассылка",
+        on_progress: Optional[Callable[[BroadcastResult], Any]] = None,
+    ) -> BroadcastResult:
+        """Вызывает deliver для каждого элемента; deliver возвращает True, если сообщение доставлено"""
+        items = list(items)
+        pending = iter(items)
+        started = self._clock()
+        counters = {'done': 0, 'delivered': 0, 'failed': 0}
+
+        def snapshot() -> BroadcastResult:
+            return BroadcastResult(len(items), counters['done'], counters['delivered'],
+                                   counters['failed'], self._clock() - started)
+
+        async def worker():
+            for item in pending:
+                try:
+                    delivered = await deliver(item)
+                except Exception as e:
+                    logger.error(f"{name}: ошибка доставки {item!r}: {e}")
+                    delivered = False
+                counters['done'] += 1
+                counters['delivered' if delivered else 'failed'] += 1
+                if counters['done'] % self.progress_every == 0 and counters['done'] < len(items):
+                    progress = snapshot()
+                    logger.info(f"{name}: {progress.done}/{progress.total}, ошибок {progress.failed}")
+                    if on_progress is not None:
+                        on_progress(progress)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(items)))))
+        result = snapshot()
+        if items:
+            logger.info(
+                f"{name}: завершено {result.done}/{result.total}, доставлено {result.delivered}, "
+                f"ошибок {result.failed} за {result.elapsed:.1f} с"
+            )
+            if on_progress is not None:
+                on_progress(result)
+        return result
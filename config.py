@@ -5,3 +5,83 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 DATABASE_PATH = os.path.join('data', 'reports.db')
+
+# Профиль производительности SQLite, применяется к каждому соединению
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'wal')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'normal')
+SQLITE_BUSY_TIMEOUT_MS = os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')
+SQLITE_MMAP_SIZE = os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = os.getenv('SQLITE_CACHE_SIZE_KB', '16384')
+SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'memory')
+
+# Групповая фиксация записей: окно накопления пачки и ее максимальный размер
+DB_WRITE_BATCH_WINDOW_MS = os.getenv('DB_WRITE_BATCH_WINDOW_MS', '5')
+DB_WRITE_MAX_BATCH = os.getenv('DB_WRITE_MAX_BATCH', '100')
+# Писатель фиксирует пачку одним fsync, поэтому может позволить себе полную синхронизацию
+SQLITE_WRITER_SYNCHRONOUS = os.getenv('SQLITE_WRITER_SYNCHRONOUS', 'full')
+
+# Набор соединений только для чтения, работающий параллельно с писателем в режиме WAL
+DB_READ_POOL_SIZE = os.getenv('DB_READ_POOL_SIZE', '4')
+DB_READ_TIMEOUT_MS = os.getenv('DB_READ_TIMEOUT_MS', '5000')
+
+# Кэш типов и профилей пользователей в памяти процесса
+USER_CACHE_TTL_SECONDS = os.getenv('USER_CACHE_TTL_SECONDS', '300')
+USER_CACHE_MAX_SIZE = os.getenv('USER_CACHE_MAX_SIZE', '10000')
+
+# Период сверки графа связей куратор-ученик с базой
+RELATION_RECONCILE_INTERVAL_SECONDS = os.getenv('RELATION_RECONCILE_INTERVAL_SECONDS', '3600')
+
+# Лимиты массовых рассылок: Telegram допускает около 30 сообщений в секунду
+# в целом и примерно одно сообщение в секунду в один чат
+BROADCAST_RATE_PER_SECOND = os.getenv('BROADCAST_RATE_PER_SECOND', '30')
+BROADCAST_CHAT_INTERVAL_SECONDS = os.getenv('BROADCAST_CHAT_INTERVAL_SECONDS', '1')
+BROADCAST_WORKERS = os.getenv('BROADCAST_WORKERS', '8')
+
+# Повторы отправки сообщений при временных ошибках Telegram
+SEND_MAX_ATTEMPTS = os.getenv('SEND_MAX_ATTEMPTS', '5')
+SEND_RETRY_BASE_DELAY_SECONDS = os.getenv('SEND_RETRY_BASE_DELAY_SECONDS', '1')
+SEND_RETRY_MAX_DELAY_SECONDS = os.getenv('SEND_RETRY_MAX_DELAY_SECONDS', '60')
+SEND_RETRY_DEADLINE_SECONDS = os.getenv('SEND_RETRY_DEADLINE_SECONDS', '900')
+
+# Очередь исходящих уведомлений
+OUTBOX_BATCH_SIZE = os.getenv('OUTBOX_BATCH_SIZE', '100')
+OUTBOX_POLL_INTERVAL_SECONDS = os.getenv('OUTBOX_POLL_INTERVAL_SECONDS', '30')
+# Через сколько секунд строка в sending считается брошенной упавшим процессом;
+# должно быть больше SEND_RETRY_DEADLINE_SECONDS, иначе живая доставка уйдет повторно
+OUTBOX_STALE_SECONDS = os.getenv('OUTBOX_STALE_SECONDS', '1800')
+# Период записи статистики доставки в delivery_counters
+DELIVERY_STATS_FLUSH_INTERVAL_SECONDS = os.getenv('DELIVERY_STATS_FLUSH_INTERVAL_SECONDS', '60')
+
+# Окно напоминаний ученикам: каждому напоминание приходит в свое время внутри окна,
+# начиная с запуска задачи по расписанию; 0 — всем сразу
+REMINDER_WINDOW_MINUTES = os.getenv('REMINDER_WINDOW_MINUTES', '180')
+
+# Сводки новых отчетов для кураторов в режимах interval и daily
+CURATOR_DIGEST_DAILY_HOUR = os.getenv('CURATOR_DIGEST_DAILY_HOUR', '18')
+CURATOR_DIGEST_CHUNK_SIZE = os.getenv('CURATOR_DIGEST_CHUNK_SIZE', '10')
+CURATOR_DIGEST_FLUSH_INTERVAL_SECONDS = os.getenv('CURATOR_DIGEST_FLUSH_INTERVAL_SECONDS', '60')
+
+# Фоновая очередь уведомлений из обработчиков
+BACKGROUND_QUEUE_SIZE = os.getenv('BACKGROUND_QUEUE_SIZE', '1000')
+BACKGROUND_WORKERS = os.getenv('BACKGROUND_WORKERS', '4')
+BACKGROUND_SHUTDOWN_TIMEOUT_SECONDS = os.getenv('BACKGROUND_SHUTDOWN_TIMEOUT_SECONDS', '30')
+
+# Расписания задач планировщика в формате cron (минута час день месяц день_недели)
+WEEKLY_REMINDER_CRON = os.getenv('WEEKLY_REMINDER_CRON', '0 10 * * 1')
+DAILY_REMINDER_CRON = os.getenv('DAILY_REMINDER_CRON', '0 10 * * 0,2-6')
+CURATOR_MISSING_REPORTS_CRON = os.getenv('CURATOR_MISSING_REPORTS_CRON', '0 14 * * 3')
+# Запуск, опоздавший больше чем на столько секунд, пропускается; пропущенное за время
+# простоя в пределах этого окна наверстывается при старте
+SCHEDULER_MISFIRE_GRACE_SECONDS = os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', '3600')
+
+# Аренда лидерства: задачи планировщика выполняет только реплика, держащая аренду.
+# Если лидер пропал, другая реплика забирает аренду не позже чем через TTL + период продления
+SCHEDULER_LEASE_TTL_SECONDS = os.getenv('SCHEDULER_LEASE_TTL_SECONDS', '30')
+SCHEDULER_LEASE_RENEW_SECONDS = os.getenv('SCHEDULER_LEASE_RENEW_SECONDS', '10')
+
+# Хранилище состояний FSM: кэш в памяти, запись в базу пачками и удаление брошенных сессий
+FSM_CACHE_SIZE = os.getenv('FSM_CACHE_SIZE', '10000')
+FSM_CACHE_TTL_SECONDS = os.getenv('FSM_CACHE_TTL_SECONDS', '300')
+FSM_SESSION_TTL_SECONDS = os.getenv('FSM_SESSION_TTL_SECONDS', '604800')
+FSM_FLUSH_INTERVAL_SECONDS = os.getenv('FSM_FLUSH_INTERVAL_SECONDS', '1')
+FSM_FLUSH_BATCH_SIZE = os.getenv('FSM_FLUSH_BATCH_SIZE', '500')
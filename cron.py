@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from typing import FrozenSet
+
+# Границы полей: минута, час, день месяца, месяц, день недели (0 и 7 — воскресенье)
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"некорректный шаг в cron-выражении: {part}")
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(value) for value in spec.split('-', 1))
+        else:
+            start = int(spec)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"значение вне диапазона {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Расписание в формате cron: "минута час день месяц день_недели"
+
+    Поддерживаются *, списки, диапазоны и шаги. Как и в cron, если заданы
+    и день месяца, и день недели, достаточно совпадения любого из них.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron-выражение должно состоять из 5 полей: {expression!r}")
+        self.expression = expression
+        parsed = [_parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # В cron воскресенье — 0 или 7, в datetime.weekday() понедельник — 0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время срабатывания строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Пропускаем целые месяцы, дни и часы, поэтому цикл короткий даже для редких расписаний
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron-выражение никогда не срабатывает: {self.expression!r}")
+
+    def __str__(self) -> str:
+        return self.expression
+
+
+class IntervalSchedule:
+    """Срабатывание через равные промежутки времени"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("интервал должен быть положительным")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __str__(self) -> str:
+        return f"каждые {self.seconds:g} с"
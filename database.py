@@ -1,98 +1,393 @@
+import asyncio
+import json
+import logging
 import os
-import aiosqlite
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+import config
+from cache import MISSING, TTLCache
 from config import DATABASE_PATH
+from digests import DIGEST_IMMEDIATE, DIGEST_INTERVAL, DIGEST_MODES
+from db_connections import (
+    ConnectionManager,
+    DatabaseWriter,
+    WriteOperation,
+    build_pragmas,
+    build_read_pool_settings,
+    build_reader_pragmas,
+    build_writer_pragmas,
+    build_writer_settings,
+    open_connection,
+)
+from migrations import apply_migrations
+from relations import RelationGraph
+
+logger = logging.getLogger(__name__)
+
+class WeekAlreadySubmitted(Exception):
+    """Отчет за эту неделю у ученика уже есть"""
+
+
+# Напоминания об отчете за неделю: не нужны, если ученик отчитался, пока они ждали отправки
+REPORT_REMINDER_KINDS = ('weekly_reminder', 'daily_reminder')
+
+
+def current_week_start(now: Optional[datetime] = None) -> datetime:
+    """Начало текущей календарной недели (понедельник, 00:00)"""
+    today = (now or datetime.now()).date()
+    # 0 = понедельник, 6 = воскресенье
+    week_start = today - timedelta(days=today.weekday())
+    return datetime.combine(week_start, datetime.min.time())
+
+
+def week_key(week_start: datetime) -> str:
+    """Ключ недели в журнале student_week_status"""
+    return week_start.strftime('%Y-%m-%d')
+
 
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
+        # Ошибка в профиле SQLite должна остановить запуск, а не всплыть на первом запросе
+        self.pragmas = build_pragmas(
+            journal_mode=config.SQLITE_JOURNAL_MODE,
+            synchronous=config.SQLITE_SYNCHRONOUS,
+            busy_timeout_ms=config.SQLITE_BUSY_TIMEOUT_MS,
+            mmap_size=config.SQLITE_MMAP_SIZE,
+            cache_size_kb=config.SQLITE_CACHE_SIZE_KB,
+            temp_store=config.SQLITE_TEMP_STORE,
+        )
+        self.writer_pragmas = build_writer_pragmas(self.pragmas, config.SQLITE_WRITER_SYNCHRONOUS)
+        self.reader_pragmas = build_reader_pragmas(self.pragmas)
+        self.read_pool_size, self.read_timeout = build_read_pool_settings(
+            config.DB_READ_POOL_SIZE, config.DB_READ_TIMEOUT_MS
+        )
+        self.write_batch_window, self.write_max_batch = build_writer_settings(
+            config.DB_WRITE_BATCH_WINDOW_MS, config.DB_WRITE_MAX_BATCH
+        )
+        self._connections: Optional[ConnectionManager] = None
+        self._writer: Optional[DatabaseWriter] = None
+        # Тип и профиль пользователя нужны почти на каждое входящее сообщение
+        self.user_cache = TTLCache(
+            maxsize=int(config.USER_CACHE_MAX_SIZE),
+            ttl=float(config.USER_CACHE_TTL_SECONDS),
+        )
+        self.relations = RelationGraph()
+        self._admin_id_source: Optional[str] = None
+        self._admin_id: Optional[int] = None
+
+    def _read_pool(self) -> ConnectionManager:
+        if self._connections is None:
+            self._connections = ConnectionManager(
+                self.db_path,
+                size=self.read_pool_size,
+                pragmas=self.reader_pragmas,
+                read_only=True,
+                checkout_timeout=self.read_timeout,
+            )
+        return self._connections
+
+    def _write_actor(self) -> DatabaseWriter:
+        if self._writer is None:
+            self._writer = DatabaseWriter(
+                self.db_path,
+                pragmas=self.writer_pragmas,
+                batch_window=self.write_batch_window,
+                max_batch=self.write_max_batch,
+            )
+        return self._writer
+
+    def _connection(self):
+        """Выдает соединение только для чтения из набора, открытого в init_db"""
+        return self._read_pool().acquire()
+
+    def read_pool_metrics(self) -> dict:
+        if self._connections is None:
+            return {}
+        return self._connections.metrics()
+
+    def cache_stats(self) -> dict:
+        return self.user_cache.stats()
+
+    async def _write(self, operation: WriteOperation):
+        """Передает запись единственному писателю и ждет ее фиксации"""
+        return await self._write_actor().submit(operation)
+
+    async def _execute_write(self, sql: str, parameters=()) -> int:
+        """Выполняет одну пишущую команду через писателя и возвращает число затронутых строк"""
+        async def operation(db):
+            cursor = await db.execute(sql, parameters)
+            return cursor.rowcount
+        return await self._write(operation)
+
+    async def close(self):
+        if self._writer is not None:
+            await self._writer.stop()
+            self._writer = None
+        if self._connections is not None:
+            await self._connections.close()
+            self._connections = None
 
     async def init_db(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                create table if not exists users (
-                    id integer primary key,
-                    user_id integer unique not null,
-                    username text,
-                    first_name text,
-                    last_name text,
-                    is_active boolean default true,
-                    user_type text default 'student',
-                    created_at timestamp default current_timestamp
-                )
-            ''')
-            
-            await db.execute('''
-                create table if not exists reports (
-                    id integer primary key autoincrement,
-                    user_id integer not null,
-                    current_stage text not null,
-                    plans text not null,
-                    plans_completed boolean,
-                    plans_failure_reason text,
-                    problems text not null,
-                    is_read_by_curator boolean default false,
-                    created_at timestamp default current_timestamp,
-                    foreign key (user_id) references users (user_id)
-                )
-            ''')
-            
-            await db.execute('''
-                create table if not exists curator_student_relations (
-                    id integer primary key autoincrement,
-                    curator_id integer not null,
-                    student_id integer not null,
-                    created_at timestamp default current_timestamp,
-                    foreign key (curator_id) references users (user_id),
-                    foreign key (student_id) references users (user_id),
-                    unique(curator_id, student_id)
-                )
-            ''')
-            
-            await db.commit()
+        db = await open_connection(self.db_path, self.writer_pragmas)
+        try:
+            await apply_migrations(db)
+        finally:
+            await db.close()
+        await self._write_actor().start()
+        await self._read_pool().open()
+        self.relations.load(*await self._read_relation_graph())
+
+    async def _read_relation_graph(self):
+        async with self._connection() as db:
+            cursor = await db.execute('select curator_id, student_id from curator_student_relations')
+            relations = [(row[0], row[1]) for row in await cursor.fetchall()]
+            cursor = await db.execute('select user_id from users where is_active = 0')
+            inactive_users = [row[0] for row in await cursor.fetchall()]
+        return relations, inactive_users
+
+    async def reconcile_relation_graph(self, repair: bool = False) -> dict:
+        """Сверяет граф связей в памяти с таблицами и при repair=True загружает его заново"""
+        relations, inactive_users = await self._read_relation_graph()
+        drift = self.relations.diff(relations, inactive_users)
+        if any(drift.values()):
+            logger.warning(f"Граф связей расходится с базой: {drift}")
+            if repair:
+                self.relations.load(relations, inactive_users)
+        return drift
+
+    async def run_relation_reconciliation(self, interval: float):
+        """Периодически сверяет граф связей этого процесса с базой и чинит расхождения"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_relation_graph(repair=True)
+            except Exception as e:
+                logger.error(f"Ошибка сверки графа связей: {e}")
+
+    def _invalidate_user(self, user_id: int):
+        self.user_cache.invalidate(('type', user_id))
+        self.user_cache.invalidate(('profile', user_id))
 
     async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None, user_type: str = 'student'):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                insert or replace into users (user_id, username, first_name, last_name, user_type)
-                values (?, ?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name, user_type))
-            await db.commit()
+        await self._execute_write('''
+            insert or replace into users (user_id, username, first_name, last_name, user_type)
+            values (?, ?, ?, ?, ?)
+        ''', (user_id, username, first_name, last_name, user_type))
+        self._invalidate_user(user_id)
+        # insert or replace возвращает is_active к значению по умолчанию
+        # и сбрасывает отметку о недоступности: /start снова включает рассылки
+        self.relations.set_active(user_id, True)
 
     async def get_user_profile(self, user_id: int) -> Optional[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self.user_cache.get(('profile', user_id))
+        if cached is not MISSING:
+            return dict(cached) if cached else None
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select user_id, username, first_name, last_name
                 from users
                 where user_id = ?
             ''', (user_id,))
             row = await cursor.fetchone()
-            if row:
-                return {'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]}
-            return None
+        profile = None
+        if row:
+            profile = {'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]}
+        self.user_cache.set(('profile', user_id), profile)
+        return dict(profile) if profile else None
+
+    async def get_user_profiles(self, user_ids: List[int]) -> Dict[int, dict]:
+        """Профили нескольких пользователей: из кэша, а промахи одним запросом"""
+        profiles = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.user_cache.get(('profile', user_id))
+            if cached is MISSING:
+                missing.append(user_id)
+            elif cached:
+                profiles[user_id] = dict(cached)
+        if missing:
+            async with self._connection() as db:
+                cursor = await db.execute('''
+                    select user_id, username, first_name, last_name
+                    from users
+                    where user_id in (select value from json_each(?))
+                ''', (json.dumps(missing),))
+                rows = await cursor.fetchall()
+            found = {row[0]: {'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]} for row in rows}
+            for user_id in missing:
+                profile = found.get(user_id)
+                self.user_cache.set(('profile', user_id), profile)
+                if profile:
+                    profiles[user_id] = dict(profile)
+        return profiles
 
     async def get_all_active_users(self) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select user_id, username, first_name, last_name 
                 from users 
-                where is_active = true and user_type = 'student'
+                where is_active = true and user_type = 'student' and unreachable_at is null
             ''')
             rows = await cursor.fetchall()
             return [{'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]} for row in rows]
 
-    async def save_report(self, user_id: int, current_stage: str, plans: str, problems: str, plans_completed: bool = None, plans_failure_reason: str = None):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                insert into reports (user_id, current_stage, plans, problems, plans_completed, plans_failure_reason)
-                values (?, ?, ?, ?, ?, ?)
-            ''', (user_id, current_stage, plans, problems, plans_completed, plans_failure_reason))
-            await db.commit()
+    async def save_report(self, user_id: int, current_stage: str, plans: str, problems: str, plans_completed: bool = None, plans_failure_reason: str = None) -> int:
+        """Сохраняет отчет; WeekAlreadySubmitted, если за эту неделю отчет уже есть"""
+        async def operation(db):
+            return await self._insert_report(
+                db, user_id, current_stage, plans, problems, plans_completed, plans_failure_reason
+            )
+        return await self._write(operation)
+
+    @staticmethod
+    async def _insert_report(db, user_id: int, current_stage: str, plans: str, problems: str,
+                             plans_completed: Optional[bool], plans_failure_reason: Optional[str]) -> int:
+        cursor = await db.execute('''
+            insert into reports (user_id, current_stage, plans, problems, plans_completed, plans_failure_reason)
+            values (?, ?, ?, ?, ?, ?)
+        ''', (user_id, current_stage, plans, problems, plans_completed, plans_failure_reason))
+        report_id = cursor.lastrowid
+        # Журнал недель обновляется в той же транзакции, что и сам отчет. Его ключ
+        # (ученик, неделя) и есть ограничение «один отчет в неделю»: если строка не
+        # добавилась, исключение откатывает и сам отчет
+        cursor = await db.execute('''
+            insert or ignore into student_week_status (user_id, week_start, report_id, submitted_at)
+            select user_id, date(created_at, 'localtime', 'weekday 0', '-6 days'), id, created_at
+            from reports
+            where id = ?
+        ''', (report_id,))
+        if cursor.rowcount == 0:
+            raise WeekAlreadySubmitted(f"у ученика {user_id} уже есть отчет за эту неделю")
+        return report_id
+
+    async def get_report_context(self, user_id: int, week_start: Optional[datetime] = None) -> dict:
+        """Все, что нужно для заполнения отчета, одним запросом: активный куратор,
+        последний этап, наличие прошлых отчетов, отчет за неделю и профиль ученика"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select
+                    (select csr.curator_id from curator_student_relations csr
+                     where csr.student_id = :user_id and not exists (
+                         select 1 from users c where c.user_id = csr.curator_id and c.is_active = 0
+                     )
+                     order by csr.curator_id limit 1),
+                    (select current_stage from reports
+                     where user_id = :user_id order by created_at desc limit 1),
+                    exists (select 1 from reports where user_id = :user_id),
+                    (select submitted_at from student_week_status
+                     where user_id = :user_id and week_start = :week_start),
+                    (select username from users where user_id = :user_id),
+                    (select first_name from users where user_id = :user_id),
+                    (select last_name from users where user_id = :user_id)
+            ''', {'user_id': user_id, 'week_start': week_key(week_start or current_week_start())})
+            row = await cursor.fetchone()
+        return {
+            'curator_id': row[0], 'last_stage': row[1], 'has_previous_reports': bool(row[2]),
+            'week_submitted_at': row[3], 'username': row[4], 'first_name': row[5], 'last_name': row[6]
+        }
+
+    async def submit_report(self, user_id: int, current_stage: str, plans: str, problems: str,
+                            plans_completed: bool = None, plans_failure_reason: str = None,
+                            curator_payload: Optional[dict] = None) -> dict:
+        """Сохраняет отчет и в той же транзакции фиксирует уведомление куратору:
+        сообщение curator_payload в outbox или событие для сводки, если куратор
+        получает отчеты сводкой. Куратор определяется по таблице на момент записи.
+        Если отчет за неделю уже есть, ничего не записывается и already_submitted=True"""
+        async def operation(db):
+            report_id = await self._insert_report(
+                db, user_id, current_stage, plans, problems, plans_completed, plans_failure_reason
+            )
+            cursor = await db.execute('''
+                select csr.curator_id, coalesce(s.mode, ?)
+                from curator_student_relations csr
+                left join curator_digest_settings s on s.curator_id = csr.curator_id
+                where csr.student_id = ? and not exists (
+                    select 1 from users c where c.user_id = csr.curator_id and c.is_active = 0
+                )
+                order by csr.curator_id
+                limit 1
+            ''', (DIGEST_IMMEDIATE, user_id))
+            row = await cursor.fetchone()
+            curator_id, buffered = None, False
+            if row is not None:
+                curator_id, mode = row
+                if mode != DIGEST_IMMEDIATE:
+                    buffered = True
+                    await db.execute(
+                        'insert or ignore into curator_report_events (curator_id, report_id) values (?, ?)',
+                        (curator_id, report_id)
+                    )
+                elif curator_payload is not None:
+                    await self._insert_outbox(
+                        db, [(f"new_report:{report_id}", 'new_report', curator_id, curator_payload)]
+                    )
+            return {'report_id': report_id, 'curator_id': curator_id, 'buffered': buffered, 'already_submitted': False}
+        try:
+            return await self._write(operation)
+        except WeekAlreadySubmitted:
+            return {'report_id': None, 'curator_id': None, 'buffered': False, 'already_submitted': True}
+
+    async def get_week_status(self, user_id: int, week_start: Optional[datetime] = None) -> Optional[dict]:
+        """Возвращает отчет, закрывший неделю ученика, или None, если отчета за неделю нет"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select report_id, submitted_at
+                from student_week_status
+                where user_id = ? and week_start = ?
+            ''', (user_id, week_key(week_start or current_week_start())))
+            row = await cursor.fetchone()
+            if row:
+                return {'report_id': row[0], 'submitted_at': row[1]}
+            return None
+
+    async def check_week_status_consistency(self, repair: bool = False) -> dict:
+        """Сверяет журнал недель с таблицей отчетов и при repair=True перестраивает его"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                with expected as (
+                    select user_id, week_start, report_id, submitted_at
+                    from (
+                        select user_id, date(created_at, 'localtime', 'weekday 0', '-6 days') as week_start,
+                               id as report_id, created_at as submitted_at,
+                               row_number() over (
+                                   partition by user_id, date(created_at, 'localtime', 'weekday 0', '-6 days')
+                                   order by created_at, id
+                               ) as position
+                        from reports
+                    )
+                    where position = 1
+                )
+                select 'missing', e.user_id, e.week_start, e.report_id
+                from expected e
+                left join student_week_status w on w.user_id = e.user_id and w.week_start = e.week_start
+                where w.report_id is null or w.report_id != e.report_id
+                union all
+                select 'stale', w.user_id, w.week_start, w.report_id
+                from student_week_status w
+                left join expected e on e.user_id = w.user_id and e.week_start = w.week_start
+                where e.report_id is null or e.report_id != w.report_id
+            ''')
+            rows = await cursor.fetchall()
+            drift = {'missing': [], 'stale': []}
+            for kind, user_id, week_start, report_id in rows:
+                drift[kind].append({'user_id': user_id, 'week_start': week_start, 'report_id': report_id})
+
+        if repair and rows:
+            async def rebuild(db):
+                await db.execute('delete from student_week_status')
+                await db.execute('''
+                    insert or ignore into student_week_status (user_id, week_start, report_id, submitted_at)
+                    select user_id, date(created_at, 'localtime', 'weekday 0', '-6 days'), id, created_at
+                    from reports
+                    order by created_at, id
+                ''')
+            await self._write(rebuild)
+        return drift
 
     async def get_user_reports(self, user_id: int) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select current_stage, plans, problems, plans_completed, plans_failure_reason, created_at 
                 from reports 
@@ -106,7 +401,7 @@ class Database:
             } for row in rows]
 
     async def get_last_report_date(self, user_id: int) -> Optional[datetime]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select created_at 
                 from reports 
@@ -121,14 +416,8 @@ class Database:
 
     async def get_reports_for_current_week(self, user_id: int) -> List[dict]:
         """Получает отчеты пользователя за текущую календарную неделю"""
-        # Находим начало текущей недели (понедельник)
-        today = datetime.now().date()
-        days_since_monday = today.weekday()  # 0 = понедельник, 6 = воскресенье
-        week_start = today - timedelta(days=days_since_monday)
-        week_start_datetime = datetime.combine(week_start, datetime.min.time())
-        
-        week_start_str = week_start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-        async with aiosqlite.connect(self.db_path) as db:
+        week_start_str = current_week_start().strftime('%Y-%m-%d %H:%M:%S')
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select current_stage, plans, problems, created_at 
                 from reports 
@@ -138,14 +427,48 @@ class Database:
             rows = await cursor.fetchall()
             return [{'current_stage': row[0], 'plans': row[1], 'problems': row[2], 'created_at': row[3]} for row in rows]
 
-    async def get_students_missing_weekly_reports(self) -> List[dict]:
-        today = datetime.now().date()
-        days_since_monday = today.weekday()
-        week_start = today - timedelta(days=days_since_monday)
-        week_start_datetime = datetime.combine(week_start, datetime.min.time())
+    async def get_weekly_reminder_recipients(self, week_start: Optional[datetime] = None) -> List[int]:
+        """Возвращает ID активных учеников без отчета за неделю одним запросом"""
+        recipients, _ = await self.get_weekly_reminder_audience(week_start)
+        return recipients
+
+    async def get_weekly_reminder_audience(self, week_start: Optional[datetime] = None) -> Tuple[List[int], int]:
+        """Получатели напоминания за неделю и число учеников без отчета, исключенных
+        из рассылки как недоступные; одним запросом"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select u.user_id, u.unreachable_at is not null
+                from users u
+                where u.user_type = 'student' and u.is_active = true
+                  and not exists (
+                      select 1 from student_week_status w
+                      where w.user_id = u.user_id and w.week_start = ?
+                  )
+                order by u.user_id
+            ''', (week_key(week_start or current_week_start()),))
+            rows = await cursor.fetchall()
+            recipients = [row[0] for row in rows if not row[1]]
+            return recipients, len(rows) - len(recipients)
+
+    async def get_report_hours(self, user_ids: List[int]) -> Dict[int, Dict[int, int]]:
+        """Сколько отчетов каждый ученик прислал в каждый час суток (по местному времени)"""
+        if not user_ids:
+            return {}
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select user_id, cast(strftime('%H', created_at, 'localtime') as integer) as hour, count(*)
+                from reports
+                where user_id in (select value from json_each(?))
+                group by user_id, hour
+            ''', (json.dumps(user_ids),))
+            rows = await cursor.fetchall()
+        hours: Dict[int, Dict[int, int]] = {}
+        for user_id, hour, count in rows:
+            hours.setdefault(user_id, {})[hour] = count
+        return hours
 
-        week_start_str = week_start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_students_missing_weekly_reports(self) -> List[dict]:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select
                     csr.curator_id,
@@ -157,13 +480,12 @@ class Database:
                     s.first_name,
                     s.last_name
                 from curator_student_relations csr
-                join users c on csr.curator_id = c.user_id and c.is_active = true
+                join users c on csr.curator_id = c.user_id and c.is_active = true and c.unreachable_at is null
                 join users s on csr.student_id = s.user_id and s.is_active = true
-                left join reports r on r.user_id = s.user_id and r.created_at >= ?
-                group by csr.curator_id, c.username, c.first_name, c.last_name, s.user_id, s.username, s.first_name, s.last_name
-                having max(r.created_at) is null
+                left join student_week_status w on w.user_id = s.user_id and w.week_start = ?
+                where w.user_id is null
                 order by csr.curator_id, s.first_name, s.last_name
-            ''', (week_start_str,))
+            ''', (week_key(current_week_start()),))
             rows = await cursor.fetchall()
             return [
                 {
@@ -181,7 +503,7 @@ class Database:
 
     async def get_last_stage_choice(self, user_id: int) -> Optional[str]:
         """Получает последний выбранный этап пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select current_stage 
                 from reports 
@@ -196,7 +518,7 @@ class Database:
 
     async def has_previous_reports(self, user_id: int) -> bool:
         """Проверяет, есть ли у пользователя предыдущие отчеты"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select count(*) 
                 from reports 
@@ -206,46 +528,32 @@ class Database:
             return row[0] > 0
 
     async def add_curator_student_relation(self, curator_id: int, student_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                insert or ignore into curator_student_relations (curator_id, student_id)
-                values (?, ?)
-            ''', (curator_id, student_id))
-            await db.commit()
+        await self._execute_write('''
+            insert or ignore into curator_student_relations (curator_id, student_id)
+            values (?, ?)
+        ''', (curator_id, student_id))
+        self.relations.add(curator_id, student_id)
 
     async def get_curator_students(self, curator_id: int) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                select u.user_id, u.username, u.first_name, u.last_name
-                from users u
-                join curator_student_relations csr on u.user_id = csr.student_id
-                where csr.curator_id = ? and u.is_active = true
-            ''', (curator_id,))
-            rows = await cursor.fetchall()
-            return [{'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]} for row in rows]
+        student_ids = self.relations.students_of(curator_id)
+        profiles = await self.get_user_profiles(student_ids)
+        return [profiles[student_id] for student_id in student_ids if student_id in profiles]
 
     async def get_student_curator(self, student_id: int) -> Optional[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute('''
-                select u.user_id, u.username, u.first_name, u.last_name
-                from users u
-                join curator_student_relations csr on u.user_id = csr.curator_id
-                where csr.student_id = ? and u.is_active = true
-            ''', (student_id,))
-            row = await cursor.fetchone()
-            if row:
-                return {'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]}
+        curator_id = self.relations.curator_of(student_id)
+        if curator_id is None:
             return None
+        return await self.get_user_profile(curator_id)
 
     async def get_unread_reports_for_curator(self, curator_id: int) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select r.id, r.user_id, r.current_stage, r.plans, r.problems, r.created_at,
                        u.first_name, u.last_name, u.username
                 from reports r
                 join users u on r.user_id = u.user_id
                 join curator_student_relations csr on u.user_id = csr.student_id
-                where csr.curator_id = ? and r.is_read_by_curator = false
+                where csr.curator_id = ? and r.is_read_by_curator = 0
                 order by r.created_at desc
             ''', (curator_id,))
             rows = await cursor.fetchall()
@@ -255,35 +563,49 @@ class Database:
                 'student_name': f"{row[6]} {row[7]}" if row[6] and row[7] else row[8] or f"ID: {row[1]}"
             } for row in rows]
 
-    async def mark_report_as_read(self, report_id: int, curator_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                update reports 
-                set is_read_by_curator = true 
-                where id = ? and user_id in (
-                    select student_id from curator_student_relations 
-                    where curator_id = ?
+    async def mark_report_as_read(self, report_id: int, curator_id: int) -> Optional[dict]:
+        """Отмечает отчет прочитанным, если его автор закреплен за куратором,
+        и одним запросом возвращает отчет с профилем ученика (или None)"""
+        async def operation(db):
+            cursor = await db.execute('''
+                update reports
+                set is_read_by_curator = true
+                where id = ? and exists (
+                    select 1 from curator_student_relations csr
+                    where csr.curator_id = ? and csr.student_id = reports.user_id
                 )
+                returning id, user_id, current_stage, plans, problems, created_at,
+                    (select username from users u where u.user_id = reports.user_id),
+                    (select first_name from users u where u.user_id = reports.user_id),
+                    (select last_name from users u where u.user_id = reports.user_id)
             ''', (report_id, curator_id))
-            await db.commit()
+            return await cursor.fetchone()
+        row = await self._write(operation)
+        if row is None:
+            return None
+        return {
+            'id': row[0], 'user_id': row[1], 'current_stage': row[2],
+            'plans': row[3], 'problems': row[4], 'created_at': row[5],
+            'username': row[6], 'first_name': row[7], 'last_name': row[8]
+        }
 
     async def get_report_by_id(self, report_id: int) -> Optional[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
-                select user_id, current_stage, plans, problems, created_at
+                select id, user_id, current_stage, plans, problems, created_at
                 from reports 
                 where id = ?
             ''', (report_id,))
             row = await cursor.fetchone()
             if row:
                 return {
-                    'user_id': row[0], 'current_stage': row[1], 
-                    'plans': row[2], 'problems': row[3], 'created_at': row[4]
+                    'id': row[0], 'user_id': row[1], 'current_stage': row[2],
+                    'plans': row[3], 'problems': row[4], 'created_at': row[5]
                 }
             return None
 
     async def get_all_student_reports_for_curator(self, curator_id: int, student_id: int) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select r.id, r.user_id, r.current_stage, r.plans, r.problems, r.plans_completed, 
                        r.plans_failure_reason, r.is_read_by_curator, r.created_at,
@@ -303,7 +625,7 @@ class Database:
             } for row in rows]
 
     async def get_all_students_with_curators(self) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select 
                     u.user_id, u.username, u.first_name, u.last_name,
@@ -323,15 +645,20 @@ class Database:
             } for row in rows]
 
     async def get_user_type(self, user_id: int) -> str:
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self.user_cache.get(('type', user_id))
+        if cached is not MISSING:
+            return cached
+        async with self._connection() as db:
             cursor = await db.execute(
                 'select user_type from users where user_id = ?', (user_id,)
             )
             row = await cursor.fetchone()
-            return row[0] if row else 'student'
+        user_type = row[0] if row else 'student'
+        self.user_cache.set(('type', user_id), user_type)
+        return user_type
 
     async def get_all_curators(self) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select user_id, username, first_name, last_name, created_at
                 from users 
@@ -345,11 +672,11 @@ class Database:
             } for row in rows]
 
     async def get_curator_stats(self, curator_id: int) -> dict:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select count(distinct csr.student_id) as student_count,
                        count(r.id) as total_reports,
-                       count(case when r.is_read_by_curator = false then 1 end) as unread_reports
+                       count(case when r.is_read_by_curator = 0 then 1 end) as unread_reports
                 from curator_student_relations csr
                 left join reports r on csr.student_id = r.user_id
                 where csr.curator_id = ?
@@ -361,34 +688,123 @@ class Database:
                 'unread_reports': row[2] or 0
             }
 
+    async def get_all_curator_stats(self) -> List[dict]:
+        """Возвращает активных кураторов вместе со статистикой по каждому одним запросом"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select c.user_id, c.username, c.first_name, c.last_name, c.created_at,
+                       coalesce(s.student_count, 0),
+                       coalesce(s.total_reports, 0),
+                       coalesce(s.unread_reports, 0)
+                from users c
+                left join (
+                    select csr.curator_id,
+                           count(distinct csr.student_id) as student_count,
+                           count(r.id) as total_reports,
+                           count(case when r.is_read_by_curator = 0 then 1 end) as unread_reports
+                    from curator_student_relations csr
+                    left join reports r on csr.student_id = r.user_id
+                    group by csr.curator_id
+                ) s on s.curator_id = c.user_id
+                where c.user_type = 'curator' and c.is_active = true
+                order by c.first_name, c.last_name
+            ''')
+            rows = await cursor.fetchall()
+            return [{
+                'user_id': row[0], 'username': row[1], 'first_name': row[2],
+                'last_name': row[3], 'created_at': row[4],
+                'student_count': row[5], 'total_reports': row[6], 'unread_reports': row[7]
+            } for row in rows]
+
+    async def get_system_counters(self) -> dict:
+        """Возвращает общие счетчики системы для админской статистики одним запросом"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select
+                    (select count(*) from users
+                     where user_type = 'curator' and is_active = true),
+                    (select count(*) from users
+                     where user_type = 'student' and is_active = true),
+                    (select count(*) from users u
+                     where u.user_type = 'student' and u.is_active = true
+                       and exists (select 1 from curator_student_relations csr where csr.student_id = u.user_id)),
+                    (select count(*) from reports),
+                    (select count(*) from reports where is_read_by_curator = 0),
+                    (select count(*) from users where unreachable_at is not null),
+                    (select coalesce(sum(value), 0) from delivery_counters where name = 'avoided_sends'),
+                    (select coalesce(sum(value), 0) from delivery_counters where name = 'delivery_delivered'),
+                    (select coalesce(sum(value), 0) from delivery_counters
+                     where name in ('delivery_fatal', 'delivery_exhausted')),
+                    (select coalesce(sum(value), 0) from delivery_counters where name = 'delivery_attempts')
+            ''')
+            row = await cursor.fetchone()
+            return {
+                'total_curators': row[0],
+                'total_students': row[1],
+                'students_with_curators': row[2],
+                'students_without_curators': row[1] - row[2],
+                'total_reports': row[3],
+                'unread_reports': row[4],
+                'unreachable_users': row[5],
+                'avoided_sends': row[6],
+                'delivered_messages': row[7],
+                'failed_messages': row[8],
+                'delivery_attempts': row[9]
+            }
+
+    async def mark_user_unreachable(self, user_id: int, reason: str) -> bool:
+        """Исключает пользователя из рассылок до его следующего /start"""
+        updated = await self._execute_write('''
+            update users
+            set unreachable_at = current_timestamp, unreachable_reason = ?
+            where user_id = ? and unreachable_at is null
+        ''', (reason, user_id))
+        return updated > 0
+
+    async def increment_counter(self, name: str, amount: int = 1):
+        await self._execute_write('''
+            insert into delivery_counters (name, value) values (?, ?)
+            on conflict (name) do update set value = value + excluded.value
+        ''', (name, amount))
+
+    async def increment_counters(self, amounts: Dict[str, int]):
+        """Увеличивает несколько счетчиков одной транзакцией"""
+        async def operation(db):
+            await db.executemany('''
+                insert into delivery_counters (name, value) values (?, ?)
+                on conflict (name) do update set value = value + excluded.value
+            ''', list(amounts.items()))
+        await self._write(operation)
+
     async def remove_curator_student_relation(self, curator_id: int, student_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                delete from curator_student_relations 
-                where curator_id = ? and student_id = ?
-            ''', (curator_id, student_id))
-            await db.commit()
+        await self._execute_write('''
+            delete from curator_student_relations 
+            where curator_id = ? and student_id = ?
+        ''', (curator_id, student_id))
+        self.relations.remove(curator_id, student_id)
 
     async def deactivate_curator(self, curator_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                update users 
-                set is_active = false 
-                where user_id = ? and user_type = 'curator'
-            ''', (curator_id,))
-            await db.commit()
+        updated = await self._execute_write('''
+            update users 
+            set is_active = false 
+            where user_id = ? and user_type = 'curator'
+        ''', (curator_id,))
+        self._invalidate_user(curator_id)
+        if updated:
+            self.relations.set_active(curator_id, False)
 
     async def activate_curator(self, curator_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                update users 
-                set is_active = true 
-                where user_id = ? and user_type = 'curator'
-            ''', (curator_id,))
-            await db.commit()
+        updated = await self._execute_write('''
+            update users 
+            set is_active = true 
+            where user_id = ? and user_type = 'curator'
+        ''', (curator_id,))
+        self._invalidate_user(curator_id)
+        if updated:
+            self.relations.set_active(curator_id, True)
 
     async def get_students_without_curators(self) -> List[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute('''
                 select u.user_id, u.username, u.first_name, u.last_name
                 from users u
@@ -400,18 +816,303 @@ class Database:
             return [{'user_id': row[0], 'username': row[1], 'first_name': row[2], 'last_name': row[3]} for row in rows]
 
     async def assign_student_to_curator(self, student_id: int, curator_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                insert or replace into curator_student_relations (curator_id, student_id)
-                values (?, ?)
-            ''', (curator_id, student_id))
-            await db.commit()
+        await self._execute_write('''
+            insert or replace into curator_student_relations (curator_id, student_id)
+            values (?, ?)
+        ''', (curator_id, student_id))
+        self.relations.add(curator_id, student_id)
 
     async def is_admin(self, user_id: int) -> bool:
         admin_id_value = os.getenv('ADMIN_ID')
-        if not admin_id_value:
-            return False
-        try:
-            return user_id == int(admin_id_value)
-        except ValueError:
-            return False
+        # Разбираем ADMIN_ID заново, только если значение переменной изменилось
+        if admin_id_value != self._admin_id_source:
+            self._admin_id_source = admin_id_value
+            try:
+                self._admin_id = int(admin_id_value) if admin_id_value else None
+            except ValueError:
+                self._admin_id = None
+        return self._admin_id is not None and user_id == self._admin_id
+
+    async def enqueue_notifications(self, notifications: List[tuple]) -> int:
+        """Ставит уведомления (ключ, вид, чат, payload[, not_before]) в outbox одной вставкой;
+        уже поставленные с тем же ключом пропускаются. not_before (UTC, как current_timestamp)
+        откладывает доставку. Возвращает число новых"""
+        if not notifications:
+            return 0
+
+        async def operation(db):
+            return await self._insert_outbox(db, notifications)
+        return await self._write(operation)
+
+    @staticmethod
+    async def _insert_outbox(db, notifications: List[tuple]) -> int:
+        cursor = await db.executemany('''
+            insert or ignore into outbox (idempotency_key, kind, chat_id, payload, not_before)
+            values (?, ?, ?, ?, ?)
+        ''', [
+            (idempotency_key, kind, chat_id, json.dumps(payload, ensure_ascii=False), not_before[0] if not_before else None)
+            for idempotency_key, kind, chat_id, payload, *not_before in notifications
+        ])
+        return cursor.rowcount
+
+    @staticmethod
+    def _outbox_kind_filter(kinds: Optional[Sequence[str]], exclude: bool) -> tuple:
+        """Условие на вид уведомления: только kinds или, при exclude=True, все, кроме них"""
+        kinds_json = json.dumps(list(kinds)) if kinds is not None else None
+        return (
+            '(? is null or (kind in (select value from json_each(?))) = ?)',
+            (kinds_json, kinds_json, 0 if exclude else 1),
+        )
+
+    async def claim_outbox_batch(self, limit: int, kinds: Optional[Sequence[str]] = None,
+                                 exclude: bool = False) -> List[dict]:
+        """Переводит до limit ожидающих уведомлений, срок которых наступил, в статус sending и возвращает их.
+        Напоминания об отчете тем, кто уже отчитался за неделю, получают статус skipped"""
+        kind_filter, kind_params = self._outbox_kind_filter(kinds, exclude)
+
+        async def operation(db):
+            # Напоминание могло ждать своего срока, пока ученик уже отправил отчет за эту неделю
+            cursor = await db.execute(f'''
+                update outbox
+                set status = 'skipped', updated_at = current_timestamp
+                where status = 'pending'
+                  and (not_before is null or not_before <= current_timestamp)
+                  and kind in (select value from json_each(?))
+                  and {kind_filter}
+                  and exists (
+                      select 1 from student_week_status w
+                      where w.user_id = outbox.chat_id
+                        and w.week_start = date(outbox.created_at, 'localtime', 'weekday 0', '-6 days')
+                  )
+            ''', (json.dumps(REPORT_REMINDER_KINDS), *kind_params))
+            if cursor.rowcount:
+                logger.info(f"Пропущено напоминаний ученикам, уже отправившим отчет: {cursor.rowcount}")
+            cursor = await db.execute(f'''
+                update outbox
+                set status = 'sending', attempts = attempts + 1, updated_at = current_timestamp
+                where id in (
+                    select id from outbox
+                    where status = 'pending'
+                      and (not_before is null or not_before <= current_timestamp)
+                      and {kind_filter}
+                    order by id
+                    limit ?
+                )
+                returning id, kind, chat_id, payload
+            ''', (*kind_params, limit))
+            return await cursor.fetchall()
+        rows = await self._write(operation)
+        return sorted(
+            ({'id': row[0], 'kind': row[1], 'chat_id': row[2], 'payload': json.loads(row[3])} for row in rows),
+            key=lambda item: item['id']
+        )
+
+    async def finish_outbox_batch(self, sent_ids: List[int], failed_ids: List[int]):
+        async def operation(db):
+            for status, ids in (('sent', sent_ids), ('failed', failed_ids)):
+                await db.executemany(
+                    "update outbox set status = ?, updated_at = current_timestamp where id = ?",
+                    [(status, outbox_id) for outbox_id in ids]
+                )
+        await self._write(operation)
+
+    async def reset_stale_outbox(self, kinds: Optional[Sequence[str]] = None, exclude: bool = False,
+                                 stale_after: float = 0) -> int:
+        """Возвращает в очередь уведомления, которые остались в sending после падения процесса.
+        Строки, взятые меньше stale_after секунд назад, может еще доставлять живой процесс.
+        Фильтр по видам тот же, что у claim_outbox_batch: чужие уведомления не трогаются"""
+        kind_filter, kind_params = self._outbox_kind_filter(kinds, exclude)
+        return await self._execute_write(f'''
+            update outbox
+            set status = 'pending', updated_at = current_timestamp
+            where status = 'sending'
+              and updated_at <= datetime('now', ?)
+              and {kind_filter}
+        ''', (f'-{stale_after} seconds', *kind_params))
+
+    async def get_outbox_due_in(self, kinds: Optional[Sequence[str]] = None,
+                                exclude: bool = False) -> Optional[float]:
+        """Через сколько секунд наступит срок ближайшего отложенного уведомления"""
+        kind_filter, kind_params = self._outbox_kind_filter(kinds, exclude)
+        async with self._connection() as db:
+            cursor = await db.execute(f'''
+                select (julianday(min(not_before)) - julianday('now')) * 86400
+                from outbox
+                where status = 'pending' and not_before > current_timestamp and {kind_filter}
+            ''', kind_params)
+            row = await cursor.fetchone()
+            return row[0]
+
+    async def get_outbox_counts(self) -> Dict[str, int]:
+        async with self._connection() as db:
+            cursor = await db.execute('select status, count(*) from outbox group by status')
+            rows = await cursor.fetchall()
+            return {row[0]: row[1] for row in rows}
+
+    async def claim_job_run(self, job_name: str, slot: str, started_at: datetime) -> bool:
+        """Занимает слот задачи; False, если этот слот уже успешно выполнен.
+        Слот, оставшийся в running после падения или завершившийся ошибкой, занимается заново"""
+        return bool(await self._execute_write('''
+            insert into job_runs (job_name, slot, status, started_at)
+            values (?, ?, 'running', ?)
+            on conflict (job_name, slot) do update set
+                status = 'running',
+                attempts = job_runs.attempts + 1,
+                started_at = excluded.started_at,
+                finished_at = null,
+                items = null,
+                error = null
+            where job_runs.status != 'ok'
+        ''', (job_name, slot, started_at.isoformat(sep=' ', timespec='seconds'))))
+
+    async def finish_job_run(self, job_name: str, slot: str, status: str, finished_at: datetime,
+                             items: Optional[int] = None, error: Optional[str] = None):
+        await self._execute_write('''
+            update job_runs
+            set status = ?, finished_at = ?, items = ?, error = ?
+            where job_name = ? and slot = ?
+        ''', (status, finished_at.isoformat(sep=' ', timespec='seconds'), items, error, job_name, slot))
+
+    async def get_latest_job_runs(self) -> Dict[str, dict]:
+        """Последний запуск каждой задачи из журнала"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select job_name, slot, status, attempts, started_at, finished_at, items, error
+                from job_runs
+                where id in (select max(id) from job_runs group by job_name)
+            ''')
+            rows = await cursor.fetchall()
+            return {row[0]: {
+                'slot': row[1], 'status': row[2], 'attempts': row[3], 'started_at': row[4],
+                'finished_at': row[5], 'items': row[6], 'error': row[7]
+            } for row in rows}
+
+    async def acquire_lease(self, name: str, holder: str, now: float, ttl: float) -> bool:
+        """Берет или продлевает аренду name; True, если она теперь у holder.
+        Чужую аренду можно забрать только после ее истечения"""
+        return bool(await self._execute_write('''
+            insert into leases (name, holder, expires_at, heartbeat_at)
+            values (?, ?, ?, ?)
+            on conflict (name) do update set
+                holder = excluded.holder,
+                expires_at = excluded.expires_at,
+                heartbeat_at = excluded.heartbeat_at
+            where leases.holder = excluded.holder or leases.expires_at <= excluded.heartbeat_at
+        ''', (name, holder, now + ttl, now)))
+
+    async def release_lease(self, name: str, holder: str) -> bool:
+        return bool(await self._execute_write(
+            'delete from leases where name = ? and holder = ?', (name, holder)
+        ))
+
+    async def get_lease(self, name: str) -> Optional[dict]:
+        async with self._connection() as db:
+            cursor = await db.execute(
+                'select holder, expires_at, heartbeat_at from leases where name = ?', (name,)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            return {'holder': row[0], 'expires_at': row[1], 'heartbeat_at': row[2]}
+
+    async def get_fsm_record(self, key: str, fresh_after: float) -> Optional[dict]:
+        """Состояние и данные FSM по ключу; сессии, не менявшиеся с fresh_after, считаются истекшими"""
+        async with self._connection() as db:
+            cursor = await db.execute(
+                'select state, data from fsm_states where key = ? and updated_at > ?', (key, fresh_after)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            return {'state': row[0], 'data': json.loads(row[1]) if row[1] else {}}
+
+    async def save_fsm_records(self, records: List[tuple]):
+        """Записывает пачку (ключ, состояние, данные, updated_at) одной транзакцией.
+        Запись без состояния и данных удаляется. Более новая запись другого процесса не перезаписывается"""
+        upserts = [
+            (key, state, json.dumps(data, ensure_ascii=False, separators=(',', ':')) if data else None, updated_at)
+            for key, state, data, updated_at in records if state is not None or data
+        ]
+        deletes = [(key, updated_at) for key, state, data, updated_at in records if state is None and not data]
+
+        async def operation(db):
+            if upserts:
+                await db.executemany('''
+                    insert into fsm_states (key, state, data, updated_at)
+                    values (?, ?, ?, ?)
+                    on conflict (key) do update set
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                    where excluded.updated_at >= fsm_states.updated_at
+                ''', upserts)
+            if deletes:
+                await db.executemany('delete from fsm_states where key = ? and updated_at <= ?', deletes)
+        await self._write(operation)
+
+    async def delete_expired_fsm_records(self, before: float) -> int:
+        """Удаляет сессии FSM, не менявшиеся с момента before"""
+        return await self._execute_write('delete from fsm_states where updated_at < ?', (before,))
+
+    async def get_digest_settings(self, curator_id: int) -> dict:
+        """Режим уведомлений куратора о новых отчетах; по умолчанию сразу"""
+        cached = self.user_cache.get(('digest', curator_id))
+        if cached is not MISSING:
+            return dict(cached)
+        async with self._connection() as db:
+            cursor = await db.execute(
+                'select mode, interval_minutes from curator_digest_settings where curator_id = ?',
+                (curator_id,)
+            )
+            row = await cursor.fetchone()
+        settings = {'mode': row[0], 'interval_minutes': row[1]} if row else {'mode': DIGEST_IMMEDIATE, 'interval_minutes': None}
+        self.user_cache.set(('digest', curator_id), settings)
+        return dict(settings)
+
+    async def set_digest_settings(self, curator_id: int, mode: str, interval_minutes: Optional[int] = None):
+        if mode not in DIGEST_MODES:
+            raise ValueError(f"неизвестный режим сводки: {mode}")
+        if mode == DIGEST_INTERVAL and (interval_minutes is None or interval_minutes < 1):
+            raise ValueError("для режима interval нужен интервал в минутах")
+        await self._execute_write('''
+            insert into curator_digest_settings (curator_id, mode, interval_minutes, updated_at)
+            values (?, ?, ?, current_timestamp)
+            on conflict (curator_id) do update set
+                mode = excluded.mode,
+                interval_minutes = excluded.interval_minutes,
+                updated_at = excluded.updated_at
+        ''', (curator_id, mode, interval_minutes if mode == DIGEST_INTERVAL else None))
+        self.user_cache.invalidate(('digest', curator_id))
+
+    async def get_pending_digest_events(self) -> List[dict]:
+        """Все неотправленные события сводок вместе с отчетом, учеником и настройками куратора"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                select e.id, e.curator_id, e.created_at, coalesce(s.mode, 'immediate'), s.interval_minutes,
+                       r.id, r.current_stage, r.created_at,
+                       r.user_id, u.username, u.first_name, u.last_name
+                from curator_report_events e
+                join reports r on r.id = e.report_id
+                left join users u on u.user_id = r.user_id
+                left join curator_digest_settings s on s.curator_id = e.curator_id
+                where e.flushed_at is null
+                order by e.curator_id, e.id
+            ''')
+            rows = await cursor.fetchall()
+            return [{
+                'event_id': row[0], 'curator_id': row[1], 'created_at': row[2],
+                'mode': row[3], 'interval_minutes': row[4],
+                'report_id': row[5], 'current_stage': row[6], 'report_created_at': row[7],
+                'student_id': row[8], 'username': row[9], 'first_name': row[10], 'last_name': row[11]
+            } for row in rows]
+
+    async def commit_digest(self, event_ids: List[int], notifications: List[tuple]) -> int:
+        """Ставит сводку в outbox и отмечает ее события отправленными в одной транзакции"""
+        async def operation(db):
+            added = await self._insert_outbox(db, notifications)
+            await db.executemany(
+                'update curator_report_events set flushed_at = current_timestamp where id = ?',
+                [(event_id,) for event_id in event_ids]
+            )
+            return added
+        return await self._write(operation)
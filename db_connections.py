@@ -0,0 +1,334 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = {'delete', 'truncate', 'persist', 'memory', 'wal', 'off'}
+SYNCHRONOUS_MODES = {'off', 'normal', 'full', 'extra'}
+TEMP_STORE_MODES = {'default', 'file', 'memory'}
+
+Pragma = Tuple[str, object]
+
+
+def _parse_non_negative_int(name: str, value) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} должен быть целым числом, получено {value!r}")
+    if number < 0:
+        raise ValueError(f"{name} не может быть отрицательным, получено {number}")
+    return number
+
+
+def _parse_choice(name: str, value, choices: set) -> str:
+    normalized = str(value).strip().lower()
+    if normalized not in choices:
+        raise ValueError(f"{name} должен быть одним из {sorted(choices)}, получено {value!r}")
+    return normalized
+
+
+def build_pragmas(journal_mode, synchronous, busy_timeout_ms, mmap_size, cache_size_kb, temp_store) -> List[Pragma]:
+    """Проверяет настройки профиля SQLite и возвращает список PRAGMA для каждого соединения"""
+    return [
+        ('journal_mode', _parse_choice('SQLITE_JOURNAL_MODE', journal_mode, JOURNAL_MODES)),
+        ('synchronous', _parse_choice('SQLITE_SYNCHRONOUS', synchronous, SYNCHRONOUS_MODES)),
+        ('busy_timeout', _parse_non_negative_int('SQLITE_BUSY_TIMEOUT_MS', busy_timeout_ms)),
+        ('mmap_size', _parse_non_negative_int('SQLITE_MMAP_SIZE', mmap_size)),
+        # Отрицательное значение cache_size задает размер кэша в килобайтах, а не в страницах
+        ('cache_size', -_parse_non_negative_int('SQLITE_CACHE_SIZE_KB', cache_size_kb)),
+        ('temp_store', _parse_choice('SQLITE_TEMP_STORE', temp_store, TEMP_STORE_MODES)),
+    ]
+
+
+def build_writer_settings(batch_window_ms, max_batch) -> Tuple[float, int]:
+    """Проверяет настройки групповой фиксации и возвращает окно в секундах и размер пачки"""
+    window = _parse_non_negative_int('DB_WRITE_BATCH_WINDOW_MS', batch_window_ms) / 1000
+    size = _parse_non_negative_int('DB_WRITE_MAX_BATCH', max_batch)
+    if size < 1:
+        raise ValueError(f"DB_WRITE_MAX_BATCH должен быть положительным, получено {size}")
+    return window, size
+
+
+def build_read_pool_settings(pool_size, timeout_ms) -> Tuple[int, float]:
+    """Проверяет настройки набора читающих соединений и возвращает размер и таймаут в секундах"""
+    size = _parse_non_negative_int('DB_READ_POOL_SIZE', pool_size)
+    if size < 1:
+        raise ValueError(f"DB_READ_POOL_SIZE должен быть положительным, получено {size}")
+    timeout = _parse_non_negative_int('DB_READ_TIMEOUT_MS', timeout_ms) / 1000
+    return size, timeout
+
+
+def build_writer_pragmas(pragmas: Sequence[Pragma], synchronous) -> List[Pragma]:
+    """Профиль соединения писателя: общий профиль со своим режимом synchronous"""
+    mode = _parse_choice('SQLITE_WRITER_SYNCHRONOUS', synchronous, SYNCHRONOUS_MODES)
+    return [(name, mode if name == 'synchronous' else value) for name, value in pragmas]
+
+
+async def apply_pragmas(connection: aiosqlite.Connection, pragmas: Sequence[Pragma]):
+    for name, value in pragmas:
+        # Значения проверены в build_pragmas, PRAGMA не поддерживает параметры запроса
+        cursor = await connection.execute(f"pragma {name} = {value}")
+        row = await cursor.fetchone()
+        await cursor.close()
+        if name == 'journal_mode' and row and str(row[0]).lower() != value:
+            logger.warning(f"SQLite не переключился в режим журнала {value}, используется {row[0]}")
+
+
+async def open_connection(db_path: str, pragmas: Sequence[Pragma] = (), read_only: bool = False) -> aiosqlite.Connection:
+    if read_only:
+        # Соединение только для чтения: SQLite сам отклонит любую попытку записи
+        connection = aiosqlite.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    else:
+        connection = aiosqlite.connect(db_path)
+    # Незакрытое соединение не должно удерживать процесс при завершении
+    connection.daemon = True
+    await connection
+    try:
+        await apply_pragmas(connection, pragmas)
+    except Exception:
+        await connection.close()
+        raise
+    return connection
+
+
+def build_reader_pragmas(pragmas: Sequence[Pragma]) -> List[Pragma]:
+    """Профиль читающего соединения: режим журнала задает писатель, запись запрещена"""
+    return [(name, value) for name, value in pragmas if name != 'journal_mode'] + [('query_only', 1)]
+
+
+class ConnectionPoolTimeout(Exception):
+    """Свободное соединение не появилось за отведенное время"""
+
+
+class ConnectionManager:
+    """Ограниченный набор долгоживущих соединений с SQLite.
+
+    Соединения выдаются в порядке очереди ожидающих, ожидание ограничено
+    checkout_timeout секундами. Набор считает метрики использования,
+    времени ожидания и отказов выдачи.
+    """
+
+    def __init__(self, db_path: str, size: int = 1, pragmas: Sequence[Pragma] = (),
+                 read_only: bool = False, checkout_timeout: Optional[float] = None):
+        if size < 1:
+            raise ValueError("размер набора соединений должен быть положительным")
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = list(pragmas)
+        self.read_only = read_only
+        self.checkout_timeout = checkout_timeout
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._open_lock = asyncio.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self._idle is not None
+
+    async def open(self):
+        # Первые запросы могут прийти одновременно, а открыть набор нужно один раз
+        async with self._open_lock:
+            if self.is_open:
+                return
+            idle = asyncio.Queue()
+            for _ in range(self.size):
+                connection = await self._connect()
+                self._connections.append(connection)
+                idle.put_nowait(connection)
+            self._idle = idle
+
+    async def _connect(self) -> aiosqlite.Connection:
+        return await open_connection(self.db_path, self.pragmas, read_only=self.read_only)
+
+    async def close(self):
+        if not self.is_open:
+            return
+        connections, self._connections = self._connections, []
+        self._idle = None
+        for connection in connections:
+            try:
+                await connection.close()
+            except Exception as e:
+                logger.error(f"Не удалось закрыть соединение с базой данных: {e}")
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Выдает соединение в монопольное пользование на время блока"""
+        if not self.is_open:
+            await self.open()
+        idle = self._idle
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self._waiting += 1
+        try:
+            connection = await asyncio.wait_for(idle.get(), self.checkout_timeout)
+        except asyncio.TimeoutError:
+            self._checkout_failures += 1
+            raise ConnectionPoolTimeout(
+                f"нет свободного соединения с базой данных за {self.checkout_timeout} с"
+            )
+        finally:
+            self._waiting -= 1
+        waited = loop.time() - started
+        self._checkouts += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        self._in_use += 1
+        try:
+            yield connection
+        finally:
+            self._in_use -= 1
+            if connection.in_transaction:
+                # Незавершенная транзакция не должна достаться следующему владельцу
+                await connection.rollback()
+            idle.put_nowait(connection)
+
+    def metrics(self) -> dict:
+        return {
+            'size': self.size,
+            'in_use': self._in_use,
+            'utilization': self._in_use / self.size,
+            'waiting': self._waiting,
+            'checkouts': self._checkouts,
+            'checkout_failures': self._checkout_failures,
+            'avg_wait_ms': (self._total_wait / self._checkouts * 1000) if self._checkouts else 0.0,
+            'max_wait_ms': self._max_wait * 1000,
+        }
+
+
+WriteOperation = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class DatabaseWriter:
+    """Единственный писатель: выполняет записи на выделенном соединении пачками.
+
+    Операции из очереди собираются в пачку в течение batch_window секунд
+    (не больше max_batch штук) и фиксируются одним коммитом. Каждая операция
+    выполняется в своей точке сохранения, поэтому ошибка одной операции не
+    откатывает остальные. Ожидание submit завершается только после коммита.
+    """
+
+    def __init__(self, db_path: str, pragmas: Sequence[Pragma] = (), batch_window: float = 0.005, max_batch: int = 100):
+        if max_batch < 1:
+            raise ValueError("размер пачки записей должен быть положительным")
+        self.db_path = db_path
+        self.pragmas = list(pragmas)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.committed_batches = 0
+        self.committed_writes = 0
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        # Первые записи могут прийти одновременно, а писатель должен быть один
+        async with self._start_lock:
+            if self.is_running:
+                return
+            self._connection = await open_connection(self.db_path, self.pragmas)
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дожидается фиксации уже принятых записей и закрывает соединение"""
+        if not self.is_running:
+            return
+        task, self._task = self._task, None
+        await self._queue.put(None)
+        await task
+        connection, self._connection = self._connection, None
+        await connection.close()
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        if not self.is_running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                try:
+                    # Одиночную запись не задерживаем: окно ждем, только если идет поток записей
+                    if timeout > 0 and (len(batch) > 1 or not self._queue.empty()):
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+        # Записи, принятые до остановки, все равно фиксируем
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                await self._commit_batch([item])
+
+    async def _commit_batch(self, batch):
+        db = self._connection
+        outcomes = []
+        try:
+            await db.execute('begin immediate')
+            for index, (operation, _) in enumerate(batch):
+                savepoint = f"write_{index}"
+                await db.execute(f"savepoint {savepoint}")
+                try:
+                    result = await operation(db)
+                except Exception as e:
+                    await db.execute(f"rollback to savepoint {savepoint}")
+                    await db.execute(f"release savepoint {savepoint}")
+                    outcomes.append((False, e))
+                else:
+                    await db.execute(f"release savepoint {savepoint}")
+                    outcomes.append((True, result))
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Не удалось зафиксировать пачку из {len(batch)} записей: {e}")
+            try:
+                if db.in_transaction:
+                    await db.rollback()
+            except Exception as rollback_error:
+                logger.error(f"Не удалось откатить пачку записей: {rollback_error}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.committed_batches += 1
+        self.committed_writes += len(batch)
+        for (_, future), (succeeded, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
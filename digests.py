@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from routing import ReadReportCallback
+from text_utils import escape_markdown
+
+DIGEST_IMMEDIATE = 'immediate'
+DIGEST_INTERVAL = 'interval'
+DIGEST_DAILY = 'daily'
+DIGEST_MODES = (DIGEST_IMMEDIATE, DIGEST_INTERVAL, DIGEST_DAILY)
+
+# Начало заголовка сводки: по нему обработчик кнопки отличает сводку от сообщения с одним отчетом
+DIGEST_TITLE_MARK = "🗂"
+
+# Длинный этап в сводке обрезаем: полный текст куратор видит в /reports
+STAGE_PREVIEW_LENGTH = 100
+
+
+def utc_to_local(value: str) -> datetime:
+    """Переводит current_timestamp из SQLite (UTC) в локальное время процесса"""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def digest_due_at(mode: str, interval_minutes: Optional[int], oldest_event: datetime, daily_hour: int) -> datetime:
+    """Момент, когда накопленные с oldest_event отчеты пора отправить куратору"""
+    if mode == DIGEST_INTERVAL:
+        return oldest_event + timedelta(minutes=interval_minutes or 0)
+    if mode == DIGEST_DAILY:
+        due = oldest_event.replace(hour=daily_hour, minute=0, second=0, microsecond=0)
+        return due if due > oldest_event else due + timedelta(days=1)
+    return oldest_event
+
+
+def _student_name(event: dict) -> str:
+    if event['first_name'] and event['last_name']:
+        return f"{event['first_name']} {event['last_name']}"
+    return event['username'] or f"ID: {event['student_id']}"
+
+
+def build_digest_messages(events: List[dict], chunk_size: int) -> List[Tuple[int, str, dict]]:
+    """Разбивает отчеты одного куратора на сообщения по chunk_size штук
+
+    Возвращает (id первого события, текст, inline-клавиатура) для каждой части;
+    кнопки ведут в тот же обработчик ReadReportCallback, что и /reports.
+    """
+    messages = []
+    parts = (len(events) + chunk_size - 1) // chunk_size
+    for part, start in enumerate(range(0, len(events), chunk_size), start=1):
+        chunk = events[start:start + chunk_size]
+        title = f"{DIGEST_TITLE_MARK} *Новые отчеты: {len(events)}*"
+        if parts > 1:
+            title += f" (часть {part} из {parts})"
+        lines = [title, ""]
+        keyboard = []
+        for index, event in enumerate(chunk, start=start + 1):
+            name = _student_name(event)
+            stage = event['current_stage']
+            if len(stage) > STAGE_PREVIEW_LENGTH:
+                stage = stage[:STAGE_PREVIEW_LENGTH] + "…"
+            date = utc_to_local(event['report_created_at']).strftime('%d.%m %H:%M')
+            lines.append(f"*{index}. {escape_markdown(name)}* ({date})")
+            lines.append(f"🎯 {escape_markdown(stage)}")
+            keyboard.append([{'text': f"✅ {index}. {name}", 'callback_data': ReadReportCallback(report_id=event['report_id']).pack()}])
+        lines.append("")
+        lines.append("Полные отчеты: `/reports`")
+        messages.append((chunk[0]['event_id'], "\n".join(lines), {'inline_keyboard': keyboard}))
+    return messages
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from cache import MISSING, TTLCache
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+Session = Tuple[Optional[str], Dict[str, Any]]
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states с кэшем в памяти
+
+    Состояние и данные сессии хранятся одной строкой, данные — компактным JSON.
+    Изменения сразу попадают в LRU-кэш, а в базу пишутся пачками раз в
+    flush_interval секунд или при накоплении flush_batch_size сессий; при
+    падении процесса теряются изменения только за последний интервал.
+
+    Сессии, не менявшиеся session_ttl секунд, считаются брошенными: при чтении
+    они пусты и периодически удаляются из таблицы. При нескольких процессах
+    источником истины остается база: более старая запись не перезаписывает
+    более новую, а кэш другого процесса устаревает не дольше чем на cache_ttl.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0,
+        session_ttl: float = 7 * 24 * 3600,
+        flush_interval: float = 1.0,
+        flush_batch_size: int = 500,
+        expire_interval: float = 600.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db = db
+        self.cache = TTLCache(cache_size, cache_ttl, clock=clock)
+        self.session_ttl = session_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.expire_interval = expire_interval
+        self._clock = clock
+        # Изменения, еще не записанные в базу: ключ -> (состояние, данные, время изменения)
+        self._dirty: Dict[str, tuple] = {}
+        self._flushing: Dict[str, tuple] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._expired_at = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        thread_id = '' if key.thread_id is None else key.thread_id
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{thread_id}:{key.destiny}"
+
+    def _pending(self, name: str) -> Optional[tuple]:
+        return self._dirty.get(name) or self._flushing.get(name)
+
+    async def _load(self, name: str) -> Session:
+        pending = self._pending(name)
+        if pending is not None:
+            return pending[0], pending[1]
+        cached = self.cache.get(name)
+        if cached is not MISSING:
+            return cached
+        record = await self.db.get_fsm_record(name, self._clock() - self.session_ttl)
+        # Пока шло чтение, сессию могли изменить в этом же процессе
+        pending = self._pending(name)
+        if pending is not None:
+            return pending[0], pending[1]
+        session = (record['state'], record['data']) if record else (None, {})
+        self.cache.set(name, session)
+        return session
+
+    def _store(self, name: str, state: Optional[str], data: Dict[str, Any]):
+        self.cache.set(name, (state, data))
+        self._dirty[name] = (state, data, self._clock())
+        if len(self._dirty) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = self._key(key)
+        _, data = await self._load(name)
+        self._store(name, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        name = self._key(key)
+        state, _ = await self._load(name)
+        self._store(name, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return data.copy()
+
+    async def flush(self) -> int:
+        """Записывает накопленные изменения одной транзакцией и возвращает число сессий"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            self._flushing, self._dirty = self._dirty, {}
+            records = [(name, state, data, updated_at) for name, (state, data, updated_at) in self._flushing.items()]
+            try:
+                await self.db.save_fsm_records(records)
+            except Exception:
+                # Изменения не теряются: более новые из _dirty остаются, остальные вернутся в очередь
+                for name, pending in self._flushing.items():
+                    self._dirty.setdefault(name, pending)
+                raise
+            finally:
+                self._flushing = {}
+            return len(records)
+
+    async def expire(self) -> int:
+        """Удаляет из базы брошенные сессии"""
+        self._expired_at = self._clock()
+        return await self.db.delete_expired_fsm_records(self._expired_at - self.session_ttl)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if self._clock() - self._expired_at >= self.expire_interval:
+                    expired = await self.expire()
+                    if expired:
+                        logger.info(f"Удалено брошенных сессий FSM: {expired}")
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+
+    async def close(self) -> None:
+        """Дописывает оставшиеся изменения; соединения с базой закрывает владелец Database"""
+        await self.flush()
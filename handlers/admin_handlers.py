@@ -1,15 +1,21 @@
+import time
 from datetime import datetime
+from typing import Callable, Dict, Optional
 from aiogram import Dispatcher
-from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from states import AdminStates
 from database import Database
 from notifications import NotificationService
+from routing import router_for
+from scheduler import Schedule
 from text_utils import escape_markdown
 
-def register_admin_handlers(dp: Dispatcher, db: Database, notification_service: NotificationService):
-    
+def register_admin_handlers(dp: Dispatcher, db: Database, notification_service: NotificationService,
+                            job_schedules: Optional[Dict[str, Schedule]] = None,
+                            now: Callable[[], datetime] = datetime.now):
+    router = router_for(dp)
+
     admin_keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="👥 Все кураторы"), KeyboardButton(text="📊 Статистика")],
@@ -43,7 +49,7 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
             return False
         return True
 
-    @dp.message(Command("admin"))
+    @router.command("admin")
     async def admin_handler(message: Message):
         if not await check_admin_access(message):
             return
@@ -54,12 +60,13 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
             reply_markup=admin_keyboard
         )
 
-    @dp.message(Command("all_curators"))
+    @router.command("all_curators")
+    @router.text("👥 Все кураторы")
     async def all_curators_handler(message: Message):
         if not await check_admin_access(message):
             return
             
-        curators = await db.get_all_curators()
+        curators = await db.get_all_curator_stats()
         
         if not curators:
             await message.answer("В системе нет кураторов.")
@@ -68,18 +75,18 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
         response = "👥 *Все кураторы:*\n\n"
         
         for curator in curators:
-            stats = await db.get_curator_stats(curator['user_id'])
             name_raw = f"{curator['first_name']} {curator['last_name']}" if curator['first_name'] and curator['last_name'] else curator['username'] or f"ID: {curator['user_id']}"
             name = escape_markdown(name_raw)
             
             response += f"*{name}* (ID: {curator['user_id']})\n"
-            response += f"   👥 Учеников: {stats['student_count']}\n"
-            response += f"   📝 Отчетов: {stats['total_reports']}\n"
-            response += f"   📭 Непрочитанных: {stats['unread_reports']}\n\n"
+            response += f"   👥 Учеников: {curator['student_count']}\n"
+            response += f"   📝 Отчетов: {curator['total_reports']}\n"
+            response += f"   📭 Непрочитанных: {curator['unread_reports']}\n\n"
         
         await message.answer(response)
 
-    @dp.message(Command("add_curator"))
+    @router.command("add_curator")
+    @router.text("👤 Добавить куратора")
     async def add_curator_handler(message: Message, state: FSMContext):
         if not await check_admin_access(message):
             return
@@ -94,7 +101,8 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
             reply_markup=back_keyboard
         )
 
-    @dp.message(Command("assign_student"))
+    @router.command("assign_student")
+    @router.text("🔗 Назначить ученика")
     async def assign_student_handler(message: Message, state: FSMContext):
         if not await check_admin_access(message):
             return
@@ -239,11 +247,14 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
                 reply_markup=admin_keyboard
             )
 
-            await notification_service.notify_student_curator_assigned(student['user_id'])
+            await notification_service.background.submit(
+                notification_service.notify_student_curator_assigned, student['user_id']
+            )
         else:
             await message.answer("❌ Неверный номер куратора. Попробуйте снова.", reply_markup=back_keyboard)
 
-    @dp.message(Command("remove_relation"))
+    @router.command("remove_relation")
+    @router.text("❌ Удалить связь")
     async def remove_relation_handler(message: Message, state: FSMContext):
         if not await check_admin_access(message):
             return
@@ -284,7 +295,8 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
         else:
             await message.answer(f"❌ У ученика ID {student_id} нет куратора.", reply_markup=back_keyboard)
 
-    @dp.message(Command("deactivate_curator"))
+    @router.command("deactivate_curator")
+    @router.text("🚫 Деактивировать куратора")
     async def deactivate_curator_handler(message: Message, state: FSMContext):
         if not await check_admin_access(message):
             return
@@ -298,7 +310,8 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
             reply_markup=back_keyboard
         )
 
-    @dp.message(Command("activate_curator"))
+    @router.command("activate_curator")
+    @router.text("✅ Активировать куратора")
     async def activate_curator_handler(message: Message, state: FSMContext):
         if not await check_admin_access(message):
             return
@@ -312,7 +325,8 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
             reply_markup=back_keyboard
         )
 
-    @dp.message(Command("students_without_curators"))
+    @router.command("students_without_curators")
+    @router.text("👥 Без кураторов")
     async def students_without_curators_handler(message: Message):
         if not await check_admin_access(message):
             return
@@ -332,39 +346,80 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
         response += f"\n📊 Всего без кураторов: {len(students)}"
         await message.answer(response)
 
-    @dp.message(Command("admin_stats"))
+    @router.command("admin_stats")
+    @router.text("📊 Статистика")
     async def admin_stats_handler(message: Message):
         if not await check_admin_access(message):
             return
             
-        curators = await db.get_all_curators()
-        students_with_curators = await db.get_all_students_with_curators()
-        students_without_curators = await db.get_students_without_curators()
-        
-        total_curators = len(curators)
-        total_students = len(students_with_curators) + len(students_without_curators)
-        students_with_curators_count = len([s for s in students_with_curators if s['curator_id']])
+        counters = await db.get_system_counters()
+        curators = await db.get_all_curator_stats()
         
         response = "📊 *Общая статистика системы:*\n\n"
-        response += f"👨‍🏫 Всего кураторов: {total_curators}\n"
-        response += f"👥 Всего учеников: {total_students}\n"
-        response += f"🔗 С кураторами: {students_with_curators_count}\n"
-        response += f"❌ Без кураторов: {len(students_without_curators)}\n\n"
+        response += f"👨‍🏫 Всего кураторов: {counters['total_curators']}\n"
+        response += f"👥 Всего учеников: {counters['total_students']}\n"
+        response += f"🔗 С кураторами: {counters['students_with_curators']}\n"
+        response += f"❌ Без кураторов: {counters['students_without_curators']}\n"
+        response += f"🚫 Недоступны для рассылок: {counters['unreachable_users']}\n"
+        response += f"📉 Сэкономлено отправок: {counters['avoided_sends']}\n"
+        response += (
+            f"📬 Доставлено сообщений: {counters['delivered_messages']}, "
+            f"не доставлено: {counters['failed_messages']}, попыток: {counters['delivery_attempts']}\n\n"
+        )
         
         if curators:
             response += "📈 *Статистика по кураторам:*\n"
             for curator in curators[:5]:
-                stats = await db.get_curator_stats(curator['user_id'])
                 name_raw = f"{curator['first_name']} {curator['last_name']}" if curator['first_name'] and curator['last_name'] else curator['username'] or f"ID: {curator['user_id']}"
                 name = escape_markdown(name_raw)
-                response += f"• {name}: {stats['student_count']} учеников, {stats['unread_reports']} непрочитанных\n"
+                response += f"• {name}: {curator['student_count']} учеников, {curator['unread_reports']} непрочитанных\n"
             
             if len(curators) > 5:
                 response += f"... и еще {len(curators) - 5} кураторов"
         
         await message.answer(response)
 
-    @dp.message(Command("all_students_admin"))
+    @router.command("jobs")
+    async def jobs_handler(message: Message):
+        """Задачи планировщика: расписание, ближайший и последний запуск"""
+        if not await check_admin_access(message):
+            return
+
+        if not job_schedules:
+            await message.answer("Список задач планировщика пуст.")
+            return
+
+        def format_time(value: Optional[datetime]) -> str:
+            return value.strftime('%d.%m.%Y %H:%M') if value else "—"
+
+        # Задачи выполняет worker.py: его состояние видно только через базу,
+        # а ближайший запуск считается по расписанию в момент запроса
+        runs = await db.get_latest_job_runs()
+        lease = await db.get_lease('scheduler')
+        moment = now()
+        next_runs = {name: schedule.next_after(moment) for name, schedule in job_schedules.items()}
+
+        response = "⏱ *Задачи планировщика:*\n\n"
+        if lease and lease['expires_at'] > time.time():
+            response += f"Задачи выполняет: `{lease['holder']}`\n\n"
+        else:
+            response += "⚠️ Нет активного worker, задачи не выполняются\n\n"
+        for name in sorted(job_schedules, key=next_runs.get):
+            response += f"*{escape_markdown(name)}* ({escape_markdown(str(job_schedules[name]))})\n"
+            response += f"   Следующий запуск: {format_time(next_runs[name])}\n"
+            run = runs.get(name)
+            if run:
+                status = {'ok': "✅", 'error': "❌"}.get(run['status'], "⏳")
+                response += f"   Последний слот: {run['slot']} {status}"
+                if run['items'] is not None:
+                    response += f", обработано: {run['items']}"
+                response += "\n"
+            response += "\n"
+
+        await message.answer(response)
+
+    @router.command("all_students_admin")
+    @router.text("👥 Все ученики")
     async def all_students_admin_handler(message: Message):
         if not await check_admin_access(message):
             return
@@ -403,56 +458,20 @@ def register_admin_handlers(dp: Dispatcher, db: Database, notification_service:
         
         await message.answer(response)
 
-    @dp.message(lambda message: message.text == "👥 Все кураторы")
-    async def button_all_curators_handler(message: Message):
-        await all_curators_handler(message)
-
-    @dp.message(lambda message: message.text == "📊 Статистика")
-    async def button_admin_stats_handler(message: Message):
-        await admin_stats_handler(message)
-
-    @dp.message(lambda message: message.text == "👤 Добавить куратора")
-    async def button_add_curator_handler(message: Message, state: FSMContext):
-        await add_curator_handler(message, state)
-
-    @dp.message(lambda message: message.text == "🔗 Назначить ученика")
-    async def button_assign_student_handler(message: Message, state: FSMContext):
-        await assign_student_handler(message, state)
-
-    @dp.message(lambda message: message.text == "❌ Удалить связь")
-    async def button_remove_relation_handler(message: Message, state: FSMContext):
-        await remove_relation_handler(message, state)
-
-    @dp.message(lambda message: message.text == "🚫 Деактивировать куратора")
-    async def button_deactivate_curator_handler(message: Message, state: FSMContext):
-        await deactivate_curator_handler(message, state)
-
-    @dp.message(lambda message: message.text == "✅ Активировать куратора")
-    async def button_activate_curator_handler(message: Message, state: FSMContext):
-        await activate_curator_handler(message, state)
-
-    @dp.message(lambda message: message.text == "👥 Без кураторов")
-    async def button_students_without_curators_handler(message: Message):
-        await students_without_curators_handler(message)
-
-    @dp.message(lambda message: message.text == "👥 Все ученики")
-    async def button_all_students_admin_handler(message: Message):
-        await all_students_admin_handler(message)
-
-    @dp.message(lambda message: message.text == "❓ Помощь админа")
-    async def button_admin_help_handler(message: Message):
-        from bot import get_role_based_help
-        help_text, keyboard = await get_role_based_help(message.from_user.id)
-        await message.answer(help_text, reply_markup=keyboard)
-
-    @dp.message(Command("notify_curators"))
+    @router.command("notify_curators")
     async def notify_curators_handler(message: Message):
         """Ручной запуск уведомлений кураторам о неотправленных отчетах"""
         if not await check_admin_access(message):
             return
             
+        # Свой слот на каждую команду: иначе ключи совпадут с еженедельной задачей
+        # и ручной запуск ничего не отправит или заглушит запуск по расписанию
+        slot = f"manual:{message.from_user.id}:{message.message_id}"
         try:
-            await notification_service.send_curator_missing_reports_notifications()
-            await message.answer("✅ Уведомления кураторам о неотправленных отчетах отправлены!")
+            queued = await notification_service.send_curator_missing_reports_notifications(slot=slot)
+            if queued:
+                await message.answer(f"✅ Уведомления о неотправленных отчетах поставлены в очередь кураторам: {queued}")
+            else:
+                await message.answer("ℹ️ Все ученики с кураторами отправили отчеты за эту неделю, уведомлять некого.")
         except Exception as e:
             await message.answer(f"❌ Ошибка при отправке уведомлений: {e}")
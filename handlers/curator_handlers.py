@@ -1,15 +1,17 @@
 from datetime import datetime
 from aiogram import Dispatcher
-from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from states import CuratorStates
 from database import Database
+from digests import DIGEST_DAILY, DIGEST_IMMEDIATE, DIGEST_INTERVAL, DIGEST_TITLE_MARK
 from notifications import NotificationService
+from routing import ReadReportCallback, ViewReportsCallback, router_for
 from text_utils import escape_markdown
 
 def register_curator_handlers(dp: Dispatcher, db: Database, notification_service: NotificationService):
-    
+    router = router_for(dp)
+
     def format_report_text(report: dict, index: int) -> str:
         date = datetime.fromisoformat(report['created_at']).strftime('%d.%m.%Y %H:%M')
         read_status = "✅ Прочитано" if report['is_read_by_curator'] else "📭 Не прочитано"
@@ -58,7 +60,7 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             return True
         return False
     
-    @dp.message(Command("curator"))
+    @router.command("curator")
     async def curator_handler(message: Message):
         user = message.from_user
         user_id = user.id
@@ -89,7 +91,8 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             reply_markup=curator_keyboard
         )
 
-    @dp.message(Command("add_student"))
+    @router.command("add_student")
+    @router.text("👤 Добавить ученика")
     async def add_student_handler(message: Message, state: FSMContext):
         await state.set_state(CuratorStates.waiting_for_student_id)
         await message.answer(
@@ -122,9 +125,12 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             reply_markup=curator_keyboard
         )
         
-        await notification_service.notify_student_curator_assigned(student_id)
+        await notification_service.background.submit(
+            notification_service.notify_student_curator_assigned, student_id
+        )
 
-    @dp.message(Command("my_students"))
+    @router.command("my_students")
+    @router.text("👥 Мои ученики")
     async def my_students_handler(message: Message):
         curator_id = message.from_user.id
         students = await db.get_curator_students(curator_id)
@@ -142,13 +148,14 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             response += f"• {display_name} (ID: {student['user_id']})\n"
             keyboard_buttons.append([InlineKeyboardButton(
                 text=f"📋 Отчеты {name}",
-                callback_data=f"view_reports_{student['user_id']}"
+                callback_data=ViewReportsCallback(student_id=student['user_id']).pack()
             )])
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
         await message.answer(response, reply_markup=keyboard)
 
-    @dp.message(Command("all_students"))
+    @router.command("all_students")
+    @router.text("📋 Все ученики")
     async def all_students_handler(message: Message):
         students = await db.get_all_students_with_curators()
         
@@ -184,7 +191,8 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
         
         await message.answer(response)
 
-    @dp.message(Command("reports"))
+    @router.command("reports")
+    @router.text("📝 Отчеты")
     async def reports_handler(message: Message):
         curator_id = message.from_user.id
         reports = await db.get_unread_reports_for_curator(curator_id)
@@ -201,7 +209,7 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             report_problems = escape_markdown(report['problems'])
             
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="✅ Отметить как прочитанный", callback_data=f"read_{report['id']}")]
+                [InlineKeyboardButton(text="✅ Отметить как прочитанный", callback_data=ReadReportCallback(report_id=report['id']).pack())]
             ])
             
             await message.answer(
@@ -216,25 +224,63 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
         if len(reports) > 5:
             await message.answer(f"... и еще {len(reports) - 5} отчетов")
 
-    @dp.callback_query(lambda c: c.data.startswith('read_'))
-    async def mark_report_read(callback: CallbackQuery):
-        report_id = int(callback.data.split('_')[1])
+    @router.command("digest")
+    async def digest_handler(message: Message):
+        """Настройка режима уведомлений о новых отчетах: сразу, раз в N минут или раз в день"""
+        curator_id = message.from_user.id
+        if await db.get_user_type(curator_id) != 'curator':
+            await message.answer("❌ Команда доступна только кураторам.")
+            return
+
+        parts = (message.text or "").split()
+        if len(parts) < 2:
+            settings = await db.get_digest_settings(curator_id)
+            if settings['mode'] == DIGEST_INTERVAL:
+                current = f"сводка раз в {settings['interval_minutes']} мин."
+            elif settings['mode'] == DIGEST_DAILY:
+                current = "сводка раз в день"
+            else:
+                current = "каждый отчет сразу"
+            await message.answer(
+                f"🔔 *Уведомления о новых отчетах:* {current}\n\n"
+                "`/digest now` - каждый отчет сразу\n"
+                "`/digest 30` - сводка раз в 30 минут\n"
+                "`/digest daily` - сводка раз в день"
+            )
+            return
+
+        argument = parts[1].lower()
+        if argument == 'now':
+            await db.set_digest_settings(curator_id, DIGEST_IMMEDIATE)
+            await message.answer("✅ Теперь каждый новый отчет будет приходить сразу.")
+        elif argument == 'daily':
+            await db.set_digest_settings(curator_id, DIGEST_DAILY)
+            await message.answer("✅ Новые отчеты будут приходить одной сводкой раз в день.")
+        elif argument.isdigit() and int(argument) > 0:
+            await db.set_digest_settings(curator_id, DIGEST_INTERVAL, int(argument))
+            await message.answer(f"✅ Новые отчеты будут приходить сводкой раз в {int(argument)} мин.")
+        else:
+            await message.answer("❌ Укажи `now`, `daily` или число минут, например `/digest 30`.")
+
+    @router.callback(ReadReportCallback)
+    async def mark_report_read(callback: CallbackQuery, callback_data: ReadReportCallback):
+        report_id = callback_data.report_id
         curator_id = callback.from_user.id
         
-        await db.mark_report_as_read(report_id, curator_id)
-        
-        report = await db.get_report_by_id(report_id)
-        if report:
-            await notification_service.notify_student_report_read(report['user_id'], report)
-        
+        # Telegram ждет ответа на callback, поэтому отвечаем до любой работы с базой
         await callback.answer("✅ Отчет отмечен как прочитанный!")
 
+        # Отметка, проверка прав куратора и профиль ученика — один запрос
+        report = await db.mark_report_as_read(report_id, curator_id)
+
         if report:
-            student_profile = await db.get_user_profile(report['user_id'])
-            if student_profile and (student_profile.get('first_name') or student_profile.get('last_name')):
-                student_name_raw = f"{student_profile.get('first_name') or ''} {student_profile.get('last_name') or ''}".strip()
-            elif student_profile and student_profile.get('username'):
-                student_name_raw = student_profile['username']
+            await notification_service.background.submit(
+                notification_service.notify_student_report_read, report['user_id'], report
+            )
+            if report['first_name'] or report['last_name']:
+                student_name_raw = f"{report['first_name'] or ''} {report['last_name'] or ''}".strip()
+            elif report['username']:
+                student_name_raw = report['username']
             else:
                 student_name_raw = f"ID: {report['user_id']}"
             student_name = escape_markdown(student_name_raw)
@@ -250,16 +296,32 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
                 f"❓ *Проблемы:* {problems}\n\n"
                 f"✅ *ПРОЧИТАНО*"
             )
-            await callback.message.edit_text(message_text, reply_markup=None)
+
+        message = callback.message
+        keyboard = message.reply_markup.inline_keyboard if message.reply_markup else []
+        if (message.text or '').startswith(DIGEST_TITLE_MARK) or len(keyboard) > 1:
+            # В сводке несколько отчетов: убираем только нажатую кнопку, а прочитанный
+            # отчет присылаем отдельным сообщением, чтобы не стереть остальные
+            remaining = [
+                row for row in keyboard
+                if not any(button.callback_data == callback.data for button in row)
+            ]
+            await message.edit_reply_markup(
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=remaining) if remaining else None
+            )
+            if report:
+                await message.answer(message_text)
+        elif report:
+            await message.edit_text(message_text, reply_markup=None)
         else:
-            await callback.message.edit_text(
-                escape_markdown(callback.message.text) + "\n\n✅ *ПРОЧИТАНО*",
+            await message.edit_text(
+                escape_markdown(message.text) + "\n\n✅ *ПРОЧИТАНО*",
                 reply_markup=None
             )
 
-    @dp.callback_query(lambda c: c.data.startswith('view_reports_'))
-    async def view_student_reports(callback: CallbackQuery):
-        student_id = int(callback.data.split('_')[2])
+    @router.callback(ViewReportsCallback)
+    async def view_student_reports(callback: CallbackQuery, callback_data: ViewReportsCallback):
+        student_id = callback_data.student_id
         curator_id = callback.from_user.id
         
         reports = await db.get_all_student_reports_for_curator(curator_id, student_id)
@@ -301,26 +363,3 @@ def register_curator_handlers(dp: Dispatcher, db: Database, notification_service
             await callback.message.answer(response)
         
         await callback.answer()
-
-    # Обработчики кнопок для кураторов
-    @dp.message(lambda message: message.text == "👤 Добавить ученика")
-    async def button_add_student_handler(message: Message, state: FSMContext):
-        await add_student_handler(message, state)
-
-    @dp.message(lambda message: message.text == "👥 Мои ученики")
-    async def button_my_students_handler(message: Message):
-        await my_students_handler(message)
-
-    @dp.message(lambda message: message.text == "📋 Все ученики")
-    async def button_all_students_handler(message: Message):
-        await all_students_handler(message)
-
-    @dp.message(lambda message: message.text == "📝 Отчеты")
-    async def button_reports_handler(message: Message):
-        await reports_handler(message)
-
-    @dp.message(lambda message: message.text == "❓ Помощь")
-    async def button_help_handler(message: Message):
-        from bot import get_role_based_help
-        help_text, keyboard = await get_role_based_help(message.from_user.id)
-        await message.answer(help_text, reply_markup=keyboard)
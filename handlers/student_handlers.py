@@ -1,46 +1,47 @@
 from datetime import datetime
 from aiogram import Dispatcher
-from aiogram.filters import Command
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from states import ReportStates
 from database import Database
 from notifications import NotificationService
+from report_submission import CONTEXT_KEY, ReportSubmissionService
+from routing import PlansCallback, StageCallback, router_for
 from text_utils import escape_markdown
 
 STAGE_OPTIONS = [
     (
-        "stage_block1",
+        "block1",
         "📚 Изучение материалов - Блок 1. Основы языка",
         "Изучение материалов - Блок 1. Основы языка"
     ),
     (
-        "stage_block2",
+        "block2",
         "📚 Изучение материалов - Блок 2. ООП",
         "Изучение материалов - Блок 2. ООП"
     ),
     (
-        "stage_block3",
+        "block3",
         "📚 Изучение материалов - Блок 3. Конкурентность",
         "Изучение материалов - Блок 3. Конкурентность"
     ),
     (
-        "stage_block4",
+        "block4",
         "📚 Изучение материалов - Блок 4. Инфраструктура",
         "Изучение материалов - Блок 4. Инфраструктура"
     ),
     (
-        "stage_legend",
+        "legend",
         "📖 Изучение легенды",
         "Изучение легенды"
     ),
     (
-        "stage_fake_resume",
+        "fake_resume",
         "💼 Поиск работы на тренировочном резюме",
         "Поиск работы на фейк резюме"
     ),
     (
-        "stage_real_resume",
+        "real_resume",
         "💼 Поиск работы на реальном резюме",
         "Поиск работы на реальном резюме"
     )
@@ -48,6 +49,9 @@ STAGE_OPTIONS = [
 
 def register_student_handlers(dp: Dispatcher, db: Database, notification_service: NotificationService):
     
+    router = router_for(dp)
+    submissions = ReportSubmissionService(db, notification_service)
+
     # Создаем клавиатуру для учеников
     student_keyboard = ReplyKeyboardMarkup(
         keyboard=[
@@ -58,7 +62,7 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         one_time_keyboard=False
     )
     
-    @dp.message(Command("start"))
+    @router.command("start")
     async def start_handler(message: Message):
         user = message.from_user
         await db.add_user(
@@ -76,32 +80,23 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         greeting = "Привет! Я бот для сбора еженедельных отчетов.\n\n"
         await message.answer(greeting + help_text, reply_markup=keyboard)
 
-    @dp.message(Command("help"))
+    @router.command("help")
+    @router.text("❓ Помощь", "❓ Помощь админа")
     async def help_handler(message: Message):
         from bot import get_role_based_help
         help_text, keyboard = await get_role_based_help(message.from_user.id)
         await message.answer(help_text, reply_markup=keyboard)
 
-    # Обработчики кнопок
-    @dp.message(lambda message: message.text == "📝 Отправить отчет")
-    async def button_report_handler(message: Message, state: FSMContext):
-        await report_handler(message, state)
-
-    @dp.message(lambda message: message.text == "📊 Мои отчеты")
-    async def button_my_reports_handler(message: Message):
-        await my_reports_handler(message)
-
-    @dp.message(lambda message: message.text == "❓ Помощь")
-    async def button_help_handler(message: Message):
-        await help_handler(message)
-
-    @dp.message(Command("report"))
+    @router.command("report")
+    @router.text("📝 Отправить отчет")
     async def report_handler(message: Message, state: FSMContext):
         user_id = message.from_user.id
         
+        # Куратор, отчет за неделю и последний этап загружаются одним запросом
+        context = await submissions.load_context(user_id)
+        
         # Проверяем, есть ли у ученика закрепленный куратор
-        curator = await db.get_student_curator(user_id)
-        if not curator:
+        if context['curator_id'] is None:
             await message.answer(
                 "❌ *У тебя нет закрепленного куратора!*\n\n"
                 "Для отправки отчетов необходимо, чтобы за тобой был закреплен куратор.\n\n"
@@ -113,10 +108,8 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
             return
         
         # Проверяем, есть ли уже отчет за текущую неделю
-        current_week_reports = await db.get_reports_for_current_week(user_id)
-        if current_week_reports:
-            from datetime import datetime
-            report_date = datetime.fromisoformat(current_week_reports[0]['created_at'])
+        if context['week_submitted_at']:
+            report_date = datetime.fromisoformat(context['week_submitted_at'])
             await message.answer(
                 f"⏰ *Отчет за эту неделю уже отправлен!*\n\n"
                 f"Твой отчет за текущую неделю был отправлен {report_date.strftime('%d.%m.%Y в %H:%M')}\n"
@@ -127,18 +120,19 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
             )
             return
         
-        # Получаем последний выбранный этап для предустановки
-        last_stage = await db.get_last_stage_choice(user_id)
+        # Последний выбранный этап для предустановки
+        last_stage = context['last_stage']
         
         # Создаем клавиатуру с предустановленными блоками
         stage_keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text=label, callback_data=callback)]
-                for callback, label, _ in STAGE_OPTIONS
+                [InlineKeyboardButton(text=label, callback_data=StageCallback(code=code).pack())]
+                for code, label, _ in STAGE_OPTIONS
             ]
         )
         
         await state.set_state(ReportStates.waiting_for_stage_selection)
+        await state.update_data(**{CONTEXT_KEY: context})
         
         message_text = "📝 Начинаем заполнение еженедельного отчета!\n\n*Выбери свой текущий этап:*"
         
@@ -148,7 +142,8 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         
         await message.answer(message_text, reply_markup=stage_keyboard, parse_mode='Markdown')
 
-    @dp.message(Command("my_reports"))
+    @router.command("my_reports")
+    @router.text("📊 Мои отчеты")
     async def my_reports_handler(message: Message):
         user_id = message.from_user.id
         reports = await db.get_user_reports(user_id)
@@ -158,10 +153,10 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
             return
         
         # Проверяем, есть ли отчет за текущую неделю
-        current_week_reports = await db.get_reports_for_current_week(user_id)
+        week_status = await db.get_week_status(user_id)
         next_report_info = ""
-        if current_week_reports:
-            report_date = datetime.fromisoformat(current_week_reports[0]['created_at'])
+        if week_status:
+            report_date = datetime.fromisoformat(week_status['submitted_at'])
             next_report_info = f"\n⏰ Отчет за эту неделю уже отправлен ({report_date.strftime('%d.%m.%Y')})\n📅 Следующий отчет можно отправить в понедельник"
         else:
             next_report_info = "\n✅ Можно отправить отчет за эту неделю!"
@@ -202,11 +197,11 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         await message.answer(response, parse_mode='Markdown')
 
     # Обработчик выбора этапа
-    @dp.callback_query(lambda c: c.data.startswith('stage_'))
-    async def process_stage_selection(callback, state: FSMContext):
-        stage_mapping = {callback: value for callback, _, value in STAGE_OPTIONS}
+    @router.callback(StageCallback)
+    async def process_stage_selection(callback, state: FSMContext, callback_data: StageCallback):
+        stage_mapping = {code: value for code, _, value in STAGE_OPTIONS}
         
-        selected_stage = stage_mapping.get(callback.data)
+        selected_stage = stage_mapping.get(callback_data.code)
         if selected_stage:
             await state.update_data(current_stage=selected_stage)
             await state.set_state(ReportStates.waiting_for_plans)
@@ -217,15 +212,16 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
                 one_time_keyboard=True
             )
             
-            has_previous = await db.has_previous_reports(callback.from_user.id)
+            context = await submissions.context_from(await state.get_data(), callback.from_user.id)
+            has_previous = context['has_previous_reports']
             selected_stage_display = escape_markdown(selected_stage)
             
             if has_previous:
                 await state.set_state(ReportStates.waiting_for_plans_completion)
                 completion_keyboard = InlineKeyboardMarkup(
                     inline_keyboard=[
-                        [InlineKeyboardButton(text="✅ Да, выполнил", callback_data="plans_yes")],
-                        [InlineKeyboardButton(text="❌ Нет, не выполнил", callback_data="plans_no")]
+                        [InlineKeyboardButton(text="✅ Да, выполнил", callback_data=PlansCallback(completed=True).pack())],
+                        [InlineKeyboardButton(text="❌ Нет, не выполнил", callback_data=PlansCallback(completed=False).pack())]
                     ]
                 )
                 
@@ -266,9 +262,9 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         )
 
     # Обработчик выбора выполнения планов
-    @dp.callback_query(lambda c: c.data in ['plans_yes', 'plans_no'])
-    async def process_plans_completion(callback, state: FSMContext):
-        if callback.data == 'plans_yes':
+    @router.callback(PlansCallback)
+    async def process_plans_completion(callback, state: FSMContext, callback_data: PlansCallback):
+        if callback_data.completed:
             await state.update_data(plans_completed=True)
             await state.set_state(ReportStates.waiting_for_plans)
             
@@ -287,7 +283,7 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
                 "Пожалуйста, опиши свои планы:",
                 reply_markup=cancel_keyboard
             )
-        else:  # plans_no
+        else:
             await state.update_data(plans_completed=False)
             await state.set_state(ReportStates.waiting_for_plans_failure_reason)
             
@@ -385,16 +381,21 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
         data = await state.get_data()
         user_id = message.from_user.id
         
-        await db.save_report(
-            user_id=user_id,
-            current_stage=data['current_stage'],
-            plans=data['plans'],
-            problems=message.text,
-            plans_completed=data.get('plans_completed'),
-            plans_failure_reason=data.get('plans_failure_reason')
-        )
+        # Отчет и уведомление куратору фиксируются одной транзакцией,
+        # отправку выполняет outbox, не задерживая ответ ученику
+        result = await submissions.submit(user_id, data, message.text)
         
         await state.clear()
+        # Проверка при старте /report могла устареть: сессия FSM переживает перезапуск,
+        # а отчет за неделю мог прийти из другой сессии
+        if result['already_submitted']:
+            await message.answer(
+                "⏰ *Отчет за эту неделю уже отправлен!*\n\n"
+                "Этот отчет не сохранен. Следующий отчет можно будет отправить в понедельник.",
+                reply_markup=student_keyboard,
+                parse_mode='Markdown'
+            )
+            return
         current_stage_display = escape_markdown(data['current_stage'])
         plans_display = escape_markdown(data['plans'])
         problems_display = escape_markdown(message.text)
@@ -407,10 +408,3 @@ def register_student_handlers(dp: Dispatcher, db: Database, notification_service
             reply_markup=student_keyboard,
             parse_mode='Markdown'
         )
-        
-        # Уведомляем куратора о новом отчете
-        await notification_service.notify_curator_new_report(user_id, {
-            'current_stage': data['current_stage'],
-            'plans': data['plans'],
-            'problems': message.text
-        })
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def default_holder() -> str:
+    """Уникальное имя реплики: хост, процесс и случайный суффикс на случай повторного pid"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLease:
+    """Аренда лидерства в таблице leases
+
+    Реплика каждые renew_interval секунд берет или продлевает аренду на ttl
+    секунд. Лидером она считается только до истечения последней успешно
+    продленной аренды, поэтому реплика, потерявшая связь с базой, перестает
+    быть лидером сама. Резервная реплика забирает аренду не позже чем через
+    ttl + renew_interval после последнего продления лидера. Часы реплик
+    должны быть синхронизированы с точностью заметно лучше ttl.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        name: str = 'scheduler',
+        holder: Optional[str] = None,
+        ttl: float = 30.0,
+        renew_interval: float = 10.0,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        if renew_interval >= ttl:
+            raise ValueError("аренду нужно продлевать чаще, чем она истекает")
+        self.db = db
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._expires_at = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._clock() < self._expires_at
+
+    async def try_acquire(self) -> bool:
+        """Одна попытка взять или продлить аренду; возвращает, лидер ли реплика сейчас"""
+        was_leader = self.is_leader
+        now = self._clock()
+        try:
+            acquired = await self.db.acquire_lease(self.name, self.holder, now, self.ttl)
+        except Exception as e:
+            # Ошибка базы: остаемся лидером до истечения уже полученной аренды
+            logger.error(f"Не удалось продлить аренду {self.name}: {e}")
+            return self.is_leader
+        if acquired:
+            self._expires_at = now + self.ttl
+            if not was_leader:
+                logger.info(f"Реплика {self.holder} стала лидером ({self.name})")
+        elif self._expires_at:
+            # Аренду забрали: не ждем истечения своего срока
+            self._expires_at = 0.0
+            if was_leader:
+                logger.warning(f"Реплика {self.holder} больше не лидер ({self.name})")
+        return self.is_leader
+
+    async def wait_elected(self):
+        """Ждет, пока реплика станет лидером"""
+        while not self.is_leader:
+            await self._sleep(self.renew_interval)
+
+    async def run(self):
+        while True:
+            await self.try_acquire()
+            await self._sleep(self.renew_interval)
+
+    async def release(self):
+        """Отдает аренду при штатной остановке, чтобы резервная реплика не ждала ttl"""
+        if not self._expires_at:
+            return
+        self._expires_at = 0.0
+        try:
+            await self.db.release_lease(self.name, self.holder)
+        except Exception as e:
+            logger.error(f"Не удалось освободить аренду {self.name}: {e}")
@@ -0,0 +1,227 @@
+import logging
+from typing import List, NamedTuple, Sequence
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: Sequence[str]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'базовая схема', [
+        '''
+        create table if not exists users (
+            id integer primary key,
+            user_id integer unique not null,
+            username text,
+            first_name text,
+            last_name text,
+            is_active boolean default true,
+            user_type text default 'student',
+            created_at timestamp default current_timestamp
+        )
+        ''',
+        '''
+        create table if not exists reports (
+            id integer primary key autoincrement,
+            user_id integer not null,
+            current_stage text not null,
+            plans text not null,
+            plans_completed boolean,
+            plans_failure_reason text,
+            problems text not null,
+            is_read_by_curator boolean default false,
+            created_at timestamp default current_timestamp,
+            foreign key (user_id) references users (user_id)
+        )
+        ''',
+        '''
+        create table if not exists curator_student_relations (
+            id integer primary key autoincrement,
+            curator_id integer not null,
+            student_id integer not null,
+            created_at timestamp default current_timestamp,
+            foreign key (curator_id) references users (user_id),
+            foreign key (student_id) references users (user_id),
+            unique(curator_id, student_id)
+        )
+        ''',
+    ]),
+    Migration(2, 'индексы для горячих запросов по отчетам и связям', [
+        'create index if not exists idx_reports_user_created on reports (user_id, created_at)',
+        # Частичный индекс: непрочитанных отчетов мало, и только их ищет куратор
+        'create index if not exists idx_reports_unread on reports (user_id, created_at) where is_read_by_curator = 0',
+        'create index if not exists idx_csr_student on curator_student_relations (student_id, curator_id)',
+        'create index if not exists idx_users_type_active on users (user_type, is_active)',
+    ]),
+    Migration(3, 'журнал недельных статусов учеников', [
+        '''
+        create table if not exists student_week_status (
+            user_id integer not null,
+            week_start text not null,
+            report_id integer not null,
+            submitted_at timestamp not null,
+            primary key (user_id, week_start),
+            foreign key (report_id) references reports (id)
+        )
+        ''',
+        'create index if not exists idx_student_week_status_week on student_week_status (week_start, user_id)',
+        # Заполняем журнал по уже сохраненным отчетам: за неделю учитывается самый ранний
+        '''
+        insert or ignore into student_week_status (user_id, week_start, report_id, submitted_at)
+        select user_id, date(created_at, 'localtime', 'weekday 0', '-6 days'), id, created_at
+        from reports
+        order by created_at, id
+        ''',
+    ]),
+    Migration(4, 'очередь исходящих уведомлений', [
+        '''
+        create table if not exists outbox (
+            id integer primary key autoincrement,
+            idempotency_key text not null unique,
+            kind text not null,
+            chat_id integer not null,
+            payload text not null,
+            status text not null default 'pending',
+            attempts integer not null default 0,
+            created_at timestamp default current_timestamp,
+            updated_at timestamp
+        )
+        ''',
+        'create index if not exists idx_outbox_status on outbox (status, id)',
+    ]),
+    Migration(5, 'недоступные пользователи и счетчики доставки', [
+        'alter table users add column unreachable_at timestamp',
+        'alter table users add column unreachable_reason text',
+        # Недоступных мало, поэтому частичный индекс почти ничего не стоит
+        'create index if not exists idx_users_unreachable on users (unreachable_at) where unreachable_at is not null',
+        '''
+        create table if not exists delivery_counters (
+            name text primary key,
+            value integer not null default 0
+        )
+        ''',
+    ]),
+    Migration(6, 'сводки новых отчетов для кураторов', [
+        '''
+        create table if not exists curator_digest_settings (
+            curator_id integer primary key,
+            mode text not null default 'immediate',
+            interval_minutes integer,
+            updated_at timestamp default current_timestamp
+        )
+        ''',
+        '''
+        create table if not exists curator_report_events (
+            id integer primary key autoincrement,
+            curator_id integer not null,
+            report_id integer not null,
+            created_at timestamp default current_timestamp,
+            flushed_at timestamp,
+            unique (curator_id, report_id)
+        )
+        ''',
+        'create index if not exists idx_report_events_pending on curator_report_events (curator_id, id) where flushed_at is null',
+    ]),
+    Migration(7, 'журнал запусков задач планировщика', [
+        '''
+        create table if not exists job_runs (
+            id integer primary key autoincrement,
+            job_name text not null,
+            slot text not null,
+            status text not null,
+            attempts integer not null default 1,
+            started_at timestamp not null,
+            finished_at timestamp,
+            items integer,
+            error text,
+            unique (job_name, slot)
+        )
+        ''',
+    ]),
+    Migration(8, 'аренда лидерства между репликами', [
+        '''
+        create table if not exists leases (
+            name text primary key,
+            holder text not null,
+            expires_at real not null,
+            heartbeat_at real not null
+        )
+        ''',
+    ]),
+    Migration(9, 'отложенная доставка уведомлений', [
+        'alter table outbox add column not_before timestamp',
+    ]),
+    Migration(10, 'состояния FSM', [
+        '''
+        create table if not exists fsm_states (
+            key text primary key,
+            state text,
+            data text,
+            updated_at real not null
+        )
+        ''',
+        'create index if not exists idx_fsm_states_updated on fsm_states (updated_at)',
+    ]),
+    # created_at хранится в UTC, а неделя считается по местному времени, как current_week_start
+    Migration(11, 'журнал недель по местному времени', [
+        'delete from student_week_status',
+        '''
+        insert or ignore into student_week_status (user_id, week_start, report_id, submitted_at)
+        select user_id, date(created_at, 'localtime', 'weekday 0', '-6 days'), id, created_at
+        from reports
+        order by created_at, id
+        ''',
+    ]),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute('select coalesce(max(version), 0) from schema_version')
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def apply_migrations(db: aiosqlite.Connection, migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    """Применяет по порядку миграции, которых еще нет в schema_version, и возвращает итоговую версию"""
+    await db.execute('''
+        create table if not exists schema_version (
+            version integer primary key,
+            description text not null,
+            applied_at timestamp default current_timestamp
+        )
+    ''')
+    await db.commit()
+
+    current_version = await get_schema_version(db)
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current_version:
+            continue
+        try:
+            # DDL в sqlite3 не открывает транзакцию сам, а миграция должна примениться целиком.
+            # immediate сразу берет блокировку записи: бот и worker, стартующие вместе,
+            # применяют миграции по очереди, а версия перечитывается уже под блокировкой
+            await db.execute('begin immediate')
+            current_version = await get_schema_version(db)
+            if migration.version <= current_version:
+                await db.rollback()
+                continue
+            for statement in migration.statements:
+                await db.execute(statement)
+            await db.execute(
+                'insert into schema_version (version, description) values (?, ?)',
+                (migration.version, migration.description)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.error(f"Миграция {migration.version} ({migration.description}) не применена")
+            raise
+        logger.info(f"Применена миграция {migration.version}: {migration.description}")
+        current_version = migration.version
+    return current_version
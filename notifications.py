@@ -1,18 +1,69 @@
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
+from itertools import groupby
+from typing import Optional, Sequence
 from aiogram import Bot
-from database import Database
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+import config
+from background import BackgroundTasks
+from broadcast import Broadcaster
+from database import Database, current_week_start, week_key
+from digests import build_digest_messages, digest_due_at, utc_to_local
+from outbox import OutboxWorker
+from reminder_windows import preferred_hour, reminder_send_time, to_utc_timestamp
+from retry import FATAL, DeliveryStats, RetryPolicy, classify_error, unreachable_reason
 from text_utils import escape_markdown
 import text_utils
 
 logger = logging.getLogger(__name__)
 
+# Уведомления в ответ на действия пользователей; их доставляет процесс бота,
+# остальные (напоминания, рассылки кураторам, сводки) — worker.py
+INTERACTIVE_KINDS = ('new_report', 'report_read')
+
 class NotificationService:
-    def __init__(self, bot: Bot, db: Database):
+    def __init__(
+        self,
+        bot: Bot,
+        db: Database,
+        broadcaster: Optional[Broadcaster] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        outbox_kinds: Optional[Sequence[str]] = None,
+        outbox_exclude: bool = False,
+    ):
         self.bot = bot
         self.db = db
+        self.broadcaster = broadcaster or Broadcaster(
+            rate=float(config.BROADCAST_RATE_PER_SECOND),
+            chat_interval=float(config.BROADCAST_CHAT_INTERVAL_SECONDS),
+            workers=int(config.BROADCAST_WORKERS),
+        )
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=int(config.SEND_MAX_ATTEMPTS),
+            base_delay=float(config.SEND_RETRY_BASE_DELAY_SECONDS),
+            max_delay=float(config.SEND_RETRY_MAX_DELAY_SECONDS),
+            deadline=float(config.SEND_RETRY_DEADLINE_SECONDS),
+        )
+        self.delivery_stats = DeliveryStats()
+        # Напоминания распределяются по окну, а не уходят всем в момент запуска задачи
+        self.reminder_window_minutes = int(config.REMINDER_WINDOW_MINUTES)
+        # Уведомления из обработчиков отправляются здесь, вне пути ответа пользователю
+        self.background = BackgroundTasks(
+            max_pending=int(config.BACKGROUND_QUEUE_SIZE),
+            workers=int(config.BACKGROUND_WORKERS),
+        )
+        self.outbox = OutboxWorker(
+            db,
+            self._deliver_outbox_item,
+            self.broadcaster,
+            batch_size=int(config.OUTBOX_BATCH_SIZE),
+            poll_interval=float(config.OUTBOX_POLL_INTERVAL_SECONDS),
+            kinds=outbox_kinds,
+            exclude=outbox_exclude,
+            stale_after=float(config.OUTBOX_STALE_SECONDS),
+        )
 
     def _format_user_name(self, user: Optional[dict], fallback_id: int) -> str:
         if not user:
@@ -26,33 +77,24 @@ class NotificationService:
             return escape_markdown(username)
         return escape_markdown(f"ID: {fallback_id}")
 
-    async def notify_curator_new_report(self, student_id: int, report_data: dict):
-        """Уведомляет куратора о новом отчете от ученика"""
-        curator = await self.db.get_student_curator(student_id)
-        if not curator:
-            return
-        student_profile = await self.db.get_user_profile(student_id)
+    def format_new_report(self, student_profile: Optional[dict], student_id: int, report_data: dict) -> str:
+        """Текст уведомления куратору о новом отчете"""
         student_name = self._format_user_name(student_profile, student_id)
-        
-        try:
-            report_stage = escape_markdown(report_data['current_stage'])
-            report_plans = escape_markdown(report_data['plans'])
-            report_problems = escape_markdown(report_data['problems'])
-            await self.bot.send_message(
-                curator['user_id'],
-                f"📝 *Новый отчет от {student_name}!*\n\n"
-                f"🎯 *Этап:* {report_stage}\n"
-                f"📋 *Планы:* {report_plans}\n"
-                f"❓ *Проблемы:* {report_problems}\n\n"
-                f"Используйте `/reports` для просмотра всех отчетов."
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить куратора {curator['user_id']}: {e}")
+        report_stage = escape_markdown(report_data['current_stage'])
+        report_plans = escape_markdown(report_data['plans'])
+        report_problems = escape_markdown(report_data['problems'])
+        return (
+            f"📝 *Новый отчет от {student_name}!*\n\n"
+            f"🎯 *Этап:* {report_stage}\n"
+            f"📋 *Планы:* {report_plans}\n"
+            f"❓ *Проблемы:* {report_problems}\n\n"
+            f"Используйте `/reports` для просмотра всех отчетов."
+        )
 
     async def notify_student_curator_assigned(self, student_id: int):
         """Уведомляет ученика о назначении куратора"""
         try:
-            await self.bot.send_message(
+            await self._send_with_retry(
                 student_id,
                 f"👨‍🏫 *К тебе назначен куратор!*\n\n"
                 f"Теперь твои отчеты будут просматриваться куратором."
@@ -61,25 +103,28 @@ class NotificationService:
             logger.error(f"Не удалось уведомить ученика {student_id}: {e}")
 
     async def notify_student_report_read(self, student_id: int, report_data: dict):
-        """Уведомляет ученика о том, что куратор просмотрел его отчет"""
+        """Ставит в очередь уведомление ученику о том, что куратор просмотрел его отчет"""
         try:
             report_stage = escape_markdown(report_data['current_stage'])
             report_plans = escape_markdown(report_data['plans'])
             report_problems = escape_markdown(report_data['problems'])
-            await self.bot.send_message(
-                student_id,
+            text = (
                 "✅ *Твой отчет просмотрен куратором!*\n\n"
                 f"🎯 *Этап:* {report_stage}\n"
                 f"📋 *Планы:* {report_plans}\n"
                 f"❓ *Проблемы:* {report_problems}"
             )
+            # Повторное нажатие кнопки не должно присылать ученику второе уведомление
+            await self._enqueue([
+                (f"report_read:{report_data['id']}", 'report_read', student_id, {'text': text})
+            ])
         except Exception as e:
             logger.error(f"Не удалось уведомить ученика {student_id}: {e}")
 
-    async def send_weekly_reminders(self):
-        recipients = await self._get_students_without_weekly_report()
+    async def send_weekly_reminders(self) -> int:
+        recipients, unreachable = await self.db.get_weekly_reminder_audience()
         if not recipients:
-            return
+            return 0
         message = text_utils.escape_markdown(
             "📝 *Время для еженедельного отчета!*\n\n"
             "Пожалуйста, заполни отчет по форме:\n"
@@ -88,59 +133,147 @@ class NotificationService:
             "• Есть ли проблемы или вопросы?\n\n"
             "Используй кнопку '📝 Отправить отчет' для начала заполнения."
         )
-        await self._deliver_reminders(recipients, message)
+        slot = week_key(current_week_start())
+        return await self._enqueue_reminders(recipients, 'weekly_reminder', slot, message, unreachable)
 
-    async def send_daily_missing_report_reminders(self):
-        recipients = await self._get_students_without_weekly_report()
+    async def send_daily_missing_report_reminders(self) -> int:
+        recipients, unreachable = await self.db.get_weekly_reminder_audience()
         if not recipients:
-            return
+            return 0
         message = text_utils.escape_markdown(
             "🔔 *Напоминание об отчете!*\n\n"
             "Мы ждем твой еженедельный отчет. Заполни форму, чтобы поделиться прогрессом."
         )
-        await self._deliver_reminders(recipients, message)
-
-    async def _deliver_reminders(self, recipients, message):
-        tasks = [self._send_with_retry(user_id, message) for user_id in recipients]
-        await asyncio.gather(*tasks)
-
-    async def _get_students_without_weekly_report(self):
-        users = await self.db.get_all_active_users()
-        result = []
-        for user in users:
-            reports = await self.db.get_reports_for_current_week(user['user_id'])
-            if not reports:
-                result.append(user['user_id'])
-        return result
-
-    async def _send_with_retry(self, user_id, message, retry_delay=300):
+        slot = datetime.now().strftime('%Y-%m-%d')
+        return await self._enqueue_reminders(recipients, 'daily_reminder', slot, message, unreachable)
+
+    async def _enqueue_reminders(self, recipients, kind, slot, message, unreachable: int = 0) -> int:
+        """Один ключ на ученика и слот: повторный запуск в тот же слот ничего не добавит.
+        Время отправки каждому ученику выбирается в окне по часу, когда он обычно
+        присылает отчеты. Возвращает число новых уведомлений"""
+        window_start = datetime.now()
+        hours = await self.db.get_report_hours(recipients) if self.reminder_window_minutes > 0 else {}
+        added = await self._enqueue([
+            (f"{kind}:{user_id}:{slot}", kind, user_id, {'text': message}, to_utc_timestamp(reminder_send_time(
+                window_start, self.reminder_window_minutes, user_id,
+                preferred_hour(hours.get(user_id, {})), salt=f"{kind}:{slot}",
+            )))
+            for user_id in recipients
+        ])
+        logger.info(f"Поставлено в очередь напоминаний ({kind}, {slot}): {added} из {len(recipients)}")
+        # Недоступных учеников без отчета отфильтровал запрос получателей; повторный
+        # запуск того же слота ничего не ставит в очередь и сбереженные отправки не считает
+        if added and unreachable:
+            await self.db.increment_counter('avoided_sends', unreachable)
+        return added
+
+    async def flush_delivery_stats(self):
+        """Добавляет к счетчикам в базе исходы отправок с прошлой записи и пишет задержку доставки в лог"""
+        counts = self.delivery_stats.unflushed()
+        if not counts:
+            return
+        await self.db.increment_counters({f"delivery_{name}": value for name, value in counts.items()})
+        self.delivery_stats.mark_flushed(counts)
+        snapshot = self.delivery_stats.snapshot()
+
+        def seconds(value: Optional[float]) -> str:
+            return f"{value:.2f} с" if value is not None else "—"
+
+        logger.info(
+            f"Доставка: {snapshot['outcomes']}, попыток: {snapshot['attempts']}, задержка "
+            f"p50 {seconds(snapshot['latency_p50'])}, p99 {seconds(snapshot['latency_p99'])}"
+        )
+
+    async def run_delivery_stats(self, interval: float):
+        """Периодически сохраняет статистику доставки, которая иначе теряется при перезапуске"""
         while True:
+            await asyncio.sleep(interval)
             try:
-                await self.bot.send_message(user_id, message)
-                return
+                await self.flush_delivery_stats()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить статистику доставки: {e}")
+
+    async def _mark_unreachable(self, user_id: int, reason: str):
+        try:
+            if await self.db.mark_user_unreachable(user_id, reason):
+                logger.info(f"Пользователь {user_id} исключен из рассылок: {reason}")
+        except Exception as e:
+            logger.error(f"Не удалось отметить пользователя {user_id} недоступным: {e}")
+
+    async def _enqueue(self, notifications) -> int:
+        added = await self.db.enqueue_notifications(notifications)
+        self.outbox.wake()
+        return added
+
+    async def _deliver_outbox_item(self, chat_id: int, payload: dict) -> bool:
+        kwargs = {}
+        if payload.get('reply_markup'):
+            kwargs['reply_markup'] = InlineKeyboardMarkup.model_validate(payload['reply_markup'])
+        return await self._send_with_retry(chat_id, payload['text'], **kwargs)
+
+    async def flush_curator_digests(self, now: Optional[datetime] = None) -> int:
+        """Отправляет сводки тем кураторам, у которых подошло время; возвращает их число"""
+        now = now or datetime.now()
+        events = await self.db.get_pending_digest_events()
+        flushed = 0
+        for curator_id, curator_events in groupby(events, key=lambda event: event['curator_id']):
+            curator_events = list(curator_events)
+            first = curator_events[0]
+            # Режим сменили на immediate: отдаем накопленное сразу
+            due_at = digest_due_at(
+                first['mode'], first['interval_minutes'], utc_to_local(first['created_at']),
+                int(config.CURATOR_DIGEST_DAILY_HOUR)
+            )
+            if due_at > now:
+                continue
+            notifications = [
+                (f"curator_digest:{curator_id}:{event_id}", 'curator_digest', curator_id,
+                 {'text': text, 'reply_markup': reply_markup})
+                for event_id, text, reply_markup in build_digest_messages(
+                    curator_events, int(config.CURATOR_DIGEST_CHUNK_SIZE)
+                )
+            ]
+            await self.db.commit_digest([event['event_id'] for event in curator_events], notifications)
+            flushed += 1
+        if flushed:
+            self.outbox.wake()
+        return flushed
+
+    async def _send_with_retry(self, user_id, message, **kwargs) -> bool:
+        """Отправляет сообщение по политике повторов и возвращает True, если оно доставлено"""
+        policy = self.retry_policy
+        started = policy.clock()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.broadcaster.throttle(user_id)
+            try:
+                await self.bot.send_message(user_id, message, **kwargs)
             except Exception as error:
-                if not self._should_retry(error):
-                    logger.error(f"Не удалось отправить сообщение пользователю {user_id}: {error}")
-                    return
-                logger.warning(f"Повторная попытка отправки сообщения пользователю {user_id}: {error}")
-                await asyncio.sleep(retry_delay)
-
-    def _should_retry(self, error):
-        text = str(error).lower()
-        fatal_markers = (
-            "blocked",
-            "forbidden",
-            "chat not found",
-            "user is deactivated",
-            "bot was kicked",
-        )
-        return not any(marker in text for marker in fatal_markers)
+                delay = policy.next_delay(error, attempt, started)
+                if delay is None:
+                    outcome = 'fatal' if classify_error(error) == FATAL else 'exhausted'
+                    self.delivery_stats.record(outcome, attempt, policy.clock() - started)
+                    logger.error(f"Не удалось отправить сообщение пользователю {user_id} (попыток: {attempt}): {error}")
+                    reason = unreachable_reason(error)
+                    if reason is not None:
+                        await self._mark_unreachable(user_id, reason)
+                    return False
+                if isinstance(error, TelegramRetryAfter):
+                    # Лимит общий на бота: притормаживаем всю рассылку, а не одного получателя
+                    self.broadcaster.bucket.pause(delay)
+                logger.warning(f"Повторная попытка отправки пользователю {user_id} через {delay:.1f} с: {error}")
+                await policy.sleep(delay)
+                continue
+            self.delivery_stats.record('delivered', attempt, policy.clock() - started)
+            return True
 
-    async def send_curator_missing_reports_notifications(self):
-        """Отправляет кураторам уведомления о неотправленных отчетах их учеников"""
+    async def send_curator_missing_reports_notifications(self, slot: Optional[str] = None) -> int:
+        """Ставит кураторам уведомления о неотправленных отчетах их учеников; возвращает их число.
+        По умолчанию слот — неделя, как у задачи по расписанию; ручной запуск передает свой слот"""
         missing_records = await self.db.get_students_missing_weekly_reports()
         if not missing_records:
-            return
+            return 0
 
         def build_name(first_name, last_name, username, fallback_id):
             if first_name and last_name:
@@ -160,15 +293,17 @@ class NotificationService:
             )
             students_by_curator.setdefault(curator_id, []).append(student_name)
 
+        slot = slot or week_key(current_week_start())
+        notifications = []
         for curator_id, students in students_by_curator.items():
             students_list = "\n".join([f"• {name}" for name in students])
-            try:
-                await self.bot.send_message(
-                    curator_id,
-                    f"⚠️ *Уведомление куратора*\n\n"
-                    f"Следующие ученики не отправили отчет за эту неделю:\n\n"
-                    f"{students_list}\n\n"
-                    f"Рекомендуется связаться с ними для выяснения причин."
-                )
-            except Exception as e:
-                logger.error(f"Не удалось отправить уведомление куратору {curator_id}: {e}")
+            text = (
+                f"⚠️ *Уведомление куратора*\n\n"
+                f"Следующие ученики не отправили отчет за эту неделю:\n\n"
+                f"{students_list}\n\n"
+                f"Рекомендуется связаться с ними для выяснения причин."
+            )
+            notifications.append((
+                f"curator_missing_reports:{curator_id}:{slot}", 'curator_missing_reports', curator_id, {'text': text}
+            ))
+        return await self._enqueue(notifications)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Sequence
+
+from broadcast import Broadcaster
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[int, dict], Awaitable[bool]]
+
+
+class OutboxWorker:
+    """Доставляет уведомления из таблицы outbox пачками
+
+    Статусы: pending -> sending -> sent | failed; напоминание об отчете, который
+    ученик уже отправил, из pending сразу переходит в skipped. Строки, застрявшие
+    в sending дольше stale_after секунд (процесс упал, не закончив пачку), на
+    каждом опросе возвращаются в pending, поэтому доставка гарантируется хотя бы
+    один раз, а пачку, которую еще доставляет второй процесс, опрос не трогает.
+
+    kinds и exclude делят очередь между процессами: бот доставляет
+    интерактивные уведомления, worker.py — все остальные.
+
+    Уведомления с not_before ждут своего срока: воркер просыпается к ближайшему
+    из них, поэтому распределенные по окну напоминания уходят ровным потоком.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        deliver: Deliver,
+        broadcaster: Broadcaster,
+        batch_size: int = 100,
+        poll_interval: float = 30.0,
+        kinds: Optional[Sequence[str]] = None,
+        exclude: bool = False,
+        stale_after: float = 0,
+    ):
+        self.db = db
+        self.deliver = deliver
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.kinds = kinds
+        self.exclude = exclude
+        self.stale_after = stale_after
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Просит воркер разобрать очередь, не дожидаясь очередного опроса"""
+        self._wakeup.set()
+
+    async def drain(self) -> int:
+        """Доставляет все ожидающие уведомления и возвращает число обработанных"""
+        processed = 0
+        while True:
+            batch = await self.db.claim_outbox_batch(self.batch_size, self.kinds, self.exclude)
+            if not batch:
+                return processed
+            delivered = {}
+
+            async def deliver(item: dict) -> bool:
+                delivered[item['id']] = await self.deliver(item['chat_id'], item['payload'])
+                return delivered[item['id']]
+
+            await self.broadcaster.run(batch, deliver, name="outbox")
+            sent_ids = [item['id'] for item in batch if delivered.get(item['id'])]
+            failed_ids = [item['id'] for item in batch if not delivered.get(item['id'])]
+            await self.db.finish_outbox_batch(sent_ids, failed_ids)
+            processed += len(batch)
+
+    async def _next_poll_delay(self) -> float:
+        try:
+            due_in = await self.db.get_outbox_due_in(self.kinds, self.exclude)
+        except Exception as e:
+            logger.error(f"Не удалось узнать срок отложенных уведомлений: {e}")
+            return self.poll_interval
+        if due_in is None:
+            return self.poll_interval
+        # Срок хранится с точностью до секунды
+        return min(self.poll_interval, max(due_in, 1.0))
+
+    async def recover_stale(self) -> int:
+        """Возвращает в очередь строки, брошенные в sending упавшим процессом"""
+        reset = await self.db.reset_stale_outbox(self.kinds, self.exclude, self.stale_after)
+        if reset:
+            logger.warning(f"Возвращено в очередь неотправленных уведомлений: {reset}")
+        return reset
+
+    async def run(self):
+        while True:
+            try:
+                # Не только при запуске: после быстрого перезапуска строки упавшего
+                # процесса еще свежие и становятся брошенными позже, на одном из опросов
+                await self.recover_stale()
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Ошибка доставки уведомлений из outbox: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), await self._next_poll_delay())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+Relation = Tuple[int, int]
+
+
+class RelationGraph:
+    """Связи куратор-ученик и неактивные пользователи в памяти процесса
+
+    Граф загружается из базы при старте и обновляется после каждой
+    зафиксированной записи, поэтому чтения не ходят в SQLite.
+    """
+
+    def __init__(self):
+        self._students_by_curator: Dict[int, Set[int]] = {}
+        self._curators_by_student: Dict[int, Set[int]] = {}
+        self._inactive_users: Set[int] = set()
+
+    def load(self, relations: Iterable[Relation], inactive_users: Iterable[int]):
+        self._students_by_curator = {}
+        self._curators_by_student = {}
+        for curator_id, student_id in relations:
+            self.add(curator_id, student_id)
+        self._inactive_users = set(inactive_users)
+
+    def add(self, curator_id: int, student_id: int):
+        self._students_by_curator.setdefault(curator_id, set()).add(student_id)
+        self._curators_by_student.setdefault(student_id, set()).add(curator_id)
+
+    def remove(self, curator_id: int, student_id: int):
+        students = self._students_by_curator.get(curator_id)
+        if students is not None:
+            students.discard(student_id)
+            if not students:
+                del self._students_by_curator[curator_id]
+        curators = self._curators_by_student.get(student_id)
+        if curators is not None:
+            curators.discard(curator_id)
+            if not curators:
+                del self._curators_by_student[student_id]
+
+    def set_active(self, user_id: int, is_active: bool):
+        if is_active:
+            self._inactive_users.discard(user_id)
+        else:
+            self._inactive_users.add(user_id)
+
+    def is_active(self, user_id: int) -> bool:
+        return user_id not in self._inactive_users
+
+    def has_relation(self, curator_id: int, student_id: int) -> bool:
+        return student_id in self._students_by_curator.get(curator_id, ())
+
+    def students_of(self, curator_id: int) -> List[int]:
+        """Активные ученики куратора по возрастанию user_id"""
+        return sorted(
+            student_id for student_id in self._students_by_curator.get(curator_id, ())
+            if student_id not in self._inactive_users
+        )
+
+    def curator_of(self, student_id: int) -> Optional[int]:
+        """Активный куратор ученика; при нескольких кураторах берется с наименьшим user_id"""
+        curators = [
+            curator_id for curator_id in self._curators_by_student.get(student_id, ())
+            if curator_id not in self._inactive_users
+        ]
+        return min(curators) if curators else None
+
+    def relations(self) -> Set[Relation]:
+        return {
+            (curator_id, student_id)
+            for curator_id, students in self._students_by_curator.items()
+            for student_id in students
+        }
+
+    def inactive_users(self) -> Set[int]:
+        return set(self._inactive_users)
+
+    def diff(self, relations: Iterable[Relation], inactive_users: Iterable[int]) -> dict:
+        """Сравнивает граф с содержимым таблиц: missing есть в базе, но нет в графе, stale наоборот"""
+        expected_relations = set(relations)
+        expected_inactive = set(inactive_users)
+        current_relations = self.relations()
+        return {
+            'missing': sorted(expected_relations - current_relations),
+            'stale': sorted(current_relations - expected_relations),
+            'activity': sorted(expected_inactive ^ self._inactive_users),
+        }
@@ -0,0 +1,51 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+
+def jitter_fraction(user_id: int, salt: str = '') -> float:
+    """Детерминированная доля [0, 1) для ученика: при повторном запуске за тот же слот не меняется"""
+    digest = hashlib.sha256(f"{salt}:{user_id}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def preferred_hour(hour_counts: Dict[int, int]) -> Optional[int]:
+    """Час, в который ученик чаще всего присылает отчеты; при равенстве — более ранний"""
+    if not hour_counts:
+        return None
+    return min(hour_counts, key=lambda hour: (-hour_counts[hour], hour))
+
+
+def reminder_send_time(
+    window_start: datetime,
+    window_minutes: int,
+    user_id: int,
+    hour: Optional[int] = None,
+    salt: str = '',
+) -> datetime:
+    """Момент отправки напоминания в окне [window_start, window_start + window_minutes)
+
+    Если обычный час отчетов ученика попадает в окно, напоминание приходит
+    в этот час; остальные ученики равномерно распределяются по всему окну.
+    Сдвиг внутри часа или окна детерминирован, поэтому отправки идут ровным
+    потоком, а не одним всплеском в начале окна.
+    """
+    if window_minutes <= 0:
+        return window_start
+    window_end = window_start + timedelta(minutes=window_minutes)
+    fraction = jitter_fraction(user_id, salt)
+    if hour is not None:
+        hour_start = window_start.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if hour_start + timedelta(hours=1) <= window_start:
+            # Окно переходит через полночь
+            hour_start += timedelta(days=1)
+        start = max(hour_start, window_start)
+        end = min(hour_start + timedelta(hours=1), window_end)
+        if start < end:
+            return start + (end - start) * fraction
+    return window_start + (window_end - window_start) * fraction
+
+
+def to_utc_timestamp(moment: datetime) -> str:
+    """Локальное время процесса в формате current_timestamp SQLite (UTC)"""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,49 @@
+from typing import Optional
+
+from database import Database
+from notifications import NotificationService
+
+# Ключ в данных FSM, под которым хранится контекст заполняемого отчета
+CONTEXT_KEY = 'report_context'
+
+
+class ReportSubmissionService:
+    """Заполнение отчета за два обращения к базе
+
+    При старте /report одним запросом загружается контекст (куратор, последний
+    этап, прошлые отчеты, отчет за неделю, профиль ученика) и кладется в данные
+    FSM. При отправке отчет и уведомление куратору фиксируются одной
+    транзакцией, а доставку выполняет outbox.
+    """
+
+    def __init__(self, db: Database, notification_service: NotificationService):
+        self.db = db
+        self.notification_service = notification_service
+
+    async def load_context(self, user_id: int) -> dict:
+        return await self.db.get_report_context(user_id)
+
+    async def context_from(self, data: dict, user_id: int) -> dict:
+        """Контекст из данных FSM; если его там нет (старое состояние), загружает заново"""
+        context: Optional[dict] = data.get(CONTEXT_KEY)
+        if context is None:
+            context = await self.load_context(user_id)
+        return context
+
+    async def submit(self, user_id: int, data: dict, problems: str) -> dict:
+        """Сохраняет отчет из данных FSM и ставит уведомление куратору в outbox"""
+        context = await self.context_from(data, user_id)
+        report = {'current_stage': data['current_stage'], 'plans': data['plans'], 'problems': problems}
+        payload = {'text': self.notification_service.format_new_report(context, user_id, report)}
+        result = await self.db.submit_report(
+            user_id=user_id,
+            current_stage=data['current_stage'],
+            plans=data['plans'],
+            problems=problems,
+            plans_completed=data.get('plans_completed'),
+            plans_failure_reason=data.get('plans_failure_reason'),
+            curator_payload=payload,
+        )
+        if result['curator_id'] is not None and not result['buffered']:
+            self.notification_service.outbox.wake()
+        return result
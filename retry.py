@@ -0,0 +1,127 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+RETRY_AFTER = 'retry_after'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+
+def classify_error(error: BaseException) -> str:
+    """Решает по типу исключения aiogram, имеет ли смысл повторять отправку"""
+    if isinstance(error, TelegramRetryAfter):
+        return RETRY_AFTER
+    # Бот заблокирован, чат не найден, некорректное сообщение: повтор не поможет
+    if isinstance(error, (TelegramForbiddenError, TelegramBadRequest)):
+        return FATAL
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+
+def unreachable_reason(error: BaseException) -> Optional[str]:
+    """Причина, по которой пользователю больше не стоит писать, или None для прочих ошибок"""
+    # Forbidden: бот заблокирован, пользователь удален или бота исключили из чата
+    if isinstance(error, TelegramForbiddenError):
+        return error.message
+    # Остальные BadRequest обычно говорят об ошибке в самом сообщении, а не о получателе
+    if isinstance(error, TelegramBadRequest) and 'chat not found' in error.message.lower():
+        return error.message
+    return None
+
+
+class RetryPolicy:
+    """Ограниченные повторы: RetryAfter ждет ровно указанное сервером время,
+    временные ошибки ждут экспоненциально растущую паузу со случайным разбросом"""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline: Optional[float] = None,
+        random_fn: Callable[[], float] = random.random,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        if max_attempts < 1:
+            raise ValueError("число попыток должно быть положительным")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._random = random_fn
+        self.clock = clock
+        self.sleep = sleep
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза после неудачной попытки attempt: половина фиксирована, половина случайна"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + self._random() * delay / 2
+
+    def next_delay(self, error: BaseException, attempt: int, started: float) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если повторять больше нельзя"""
+        kind = classify_error(error)
+        if kind == FATAL or attempt >= self.max_attempts:
+            return None
+        delay = error.retry_after if kind == RETRY_AFTER else self.backoff(attempt)
+        if self.deadline is not None and self.clock() + delay - started > self.deadline:
+            return None
+        return delay
+
+
+class DeliveryStats:
+    """Исходы отправок и задержка доставки от первой попытки до результата"""
+
+    def __init__(self, max_samples: int = 10000):
+        self.outcomes: Dict[str, int] = {}
+        self.attempts = 0
+        self._latencies = deque(maxlen=max_samples)
+        # Значения счетчиков, уже записанных в базу
+        self._flushed: Dict[str, int] = {}
+
+    def record(self, outcome: str, attempts: int, latency: float):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.attempts += attempts
+        if outcome == 'delivered':
+            self._latencies.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+    def unflushed(self) -> Dict[str, int]:
+        """Прирост исходов и попыток с последней записи в базу"""
+        totals = {**self.outcomes, 'attempts': self.attempts}
+        return {
+            name: value - self._flushed.get(name, 0)
+            for name, value in totals.items()
+            if value != self._flushed.get(name, 0)
+        }
+
+    def mark_flushed(self, counts: Dict[str, int]):
+        for name, value in counts.items():
+            self._flushed[name] = self._flushed.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        return {
+            'outcomes': dict(self.outcomes),
+            'attempts': self.attempts,
+            'latency_p50': self.percentile(50),
+            'latency_p90': self.percentile(90),
+            'latency_p99': self.percentile(99),
+        }
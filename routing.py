@@ -0,0 +1,145 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, Message
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class StageCallback(CallbackData, prefix='stage'):
+    code: str
+
+
+class PlansCallback(CallbackData, prefix='plans'):
+    completed: bool
+
+
+class ReadReportCallback(CallbackData, prefix='read'):
+    report_id: int
+
+
+class ViewReportsCallback(CallbackData, prefix='view_reports'):
+    student_id: int
+
+
+CALLBACK_FACTORIES: Dict[str, Type[CallbackData]] = {
+    factory.__prefix__: factory
+    for factory in (StageCallback, PlansCallback, ReadReportCallback, ViewReportsCallback)
+}
+
+# Формат кнопок до перехода на CallbackData: такие кнопки остаются в уже
+# отправленных сообщениях и в payload уведомлений, ожидающих в outbox
+LEGACY_CALLBACKS = (
+    ('view_reports_', lambda value: ViewReportsCallback(student_id=int(value))),
+    ('read_', lambda value: ReadReportCallback(report_id=int(value))),
+    ('stage_', lambda value: StageCallback(code=value)),
+    ('plans_', lambda value: PlansCallback(completed={'yes': True, 'no': False}[value])),
+)
+
+
+def parse_callback(data: Optional[str]) -> Optional[CallbackData]:
+    """Разбирает callback data по префиксу; None, если формат неизвестен"""
+    if not data:
+        return None
+    prefix, separator, _ = data.partition(':')
+    factory = CALLBACK_FACTORIES.get(prefix) if separator else None
+    try:
+        if factory is not None:
+            return factory.unpack(data)
+        for legacy_prefix, build in LEGACY_CALLBACKS:
+            if data.startswith(legacy_prefix):
+                return build(data[len(legacy_prefix):])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+class Router:
+    """Кнопки, команды и callback-кнопки, найденные одним поиском в словаре
+
+    aiogram проверяет фильтры обработчиков по очереди, поэтому каждое
+    сообщение проходило через десятки лямбд. Router регистрирует в диспетчере
+    по одному обработчику сообщений и callback-запросов. Они стоят первыми и
+    выбирают функцию по тексту кнопки, имени команды или типу callback data.
+    Обработчики состояний FSM и ответ на прочие сообщения остаются
+    обычными обработчиками диспетчера.
+
+    Упоминание бота в команде (/help@bot) не проверяется: бот работает
+    в личных чатах.
+    """
+
+    def __init__(self):
+        self.texts: Dict[str, CallableObject] = {}
+        self.commands: Dict[str, CallableObject] = {}
+        self.callbacks: Dict[Type[CallbackData], CallableObject] = {}
+        # Все функции по имени: для тестов и отладки
+        self.handlers: Dict[str, Handler] = {}
+
+    def _route(self, table: dict, keys, handler: Handler) -> Handler:
+        for key in keys:
+            if key in table:
+                raise ValueError(f"маршрут {key!r} уже зарегистрирован")
+            table[key] = CallableObject(handler)
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    def text(self, *labels: str):
+        """Обработчик кнопок reply-клавиатуры с точным текстом"""
+        return lambda handler: self._route(self.texts, labels, handler)
+
+    def command(self, *names: str):
+        """Обработчик команд; имена без косой черты"""
+        return lambda handler: self._route(self.commands, names, handler)
+
+    def callback(self, factory: Type[CallbackData]):
+        """Обработчик callback-кнопок; разобранные данные передаются в аргументе callback_data"""
+        return lambda handler: self._route(self.callbacks, (factory,), handler)
+
+    def match_message(self, message: Message) -> Optional[CallableObject]:
+        text = message.text
+        if not text:
+            return None
+        route = self.texts.get(text)
+        if route is None and text.startswith('/'):
+            parts = text[1:].split(maxsplit=1)
+            if parts:
+                route = self.commands.get(parts[0].partition('@')[0])
+        return route
+
+    def match_callback(self, callback: CallbackQuery) -> Optional[Tuple[CallableObject, CallbackData]]:
+        callback_data = parse_callback(callback.data)
+        if callback_data is None:
+            return None
+        route = self.callbacks.get(type(callback_data))
+        return (route, callback_data) if route is not None else None
+
+    def attach(self, dp):
+        """Регистрирует в диспетчере обработчики, через которые идут все маршруты"""
+        async def message_route(message: Message):
+            route = self.match_message(message)
+            return {'route': route} if route is not None else False
+
+        async def callback_route(callback: CallbackQuery):
+            match = self.match_callback(callback)
+            if match is None:
+                return False
+            return {'route': match[0], 'callback_data': match[1]}
+
+        @dp.message(message_route)
+        async def route_message(message: Message, route: CallableObject, **kwargs):
+            return await route.call(message, **kwargs)
+
+        @dp.callback_query(callback_route)
+        async def route_callback(callback: CallbackQuery, route: CallableObject, **kwargs):
+            return await route.call(callback, **kwargs)
+
+
+def router_for(dp) -> Router:
+    """Общий Router диспетчера; при первом обращении регистрирует его обработчики в dp"""
+    router = getattr(dp, '_button_router', None)
+    if router is None:
+        router = Router()
+        router.attach(dp)
+        dp._button_router = router
+    return router
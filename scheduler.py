@@ -1,34 +1,254 @@
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+import config
+from cron import CronSchedule, IntervalSchedule
+from leader import LeaderLease
 from notifications import NotificationService
 
 logger = logging.getLogger(__name__)
 
+Schedule = Union[CronSchedule, IntervalSchedule]
+
+SLOT_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def default_job_schedules() -> Dict[str, Schedule]:
+    """Расписания задач worker; бот показывает их в /jobs, не запуская планировщик"""
+    return {
+        'weekly_reminders': CronSchedule(config.WEEKLY_REMINDER_CRON),
+        'daily_missing_report_reminders': CronSchedule(config.DAILY_REMINDER_CRON),
+        'curator_missing_reports': CronSchedule(config.CURATOR_MISSING_REPORTS_CRON),
+        'curator_digests': IntervalSchedule(float(config.CURATOR_DIGEST_FLUSH_INTERVAL_SECONDS)),
+    }
+
+
+class ScheduledJob:
+    """Задача планировщика вместе с расписанием и статистикой запусков"""
+
+    def __init__(
+        self,
+        name: str,
+        schedule: Schedule,
+        func: Callable[[], Awaitable[Any]],
+        max_instances: int,
+        misfire_grace: float,
+        durable: bool = False,
+    ):
+        if max_instances < 1:
+            raise ValueError("число одновременных запусков должно быть положительным")
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        self.max_instances = max_instances
+        self.misfire_grace = misfire_grace
+        # Запуски durable-задач пишутся в job_runs: слот выполняется один раз даже после перезапуска
+        self.durable = durable
+        self.next_run: Optional[datetime] = None
+        self.last_run: Optional[datetime] = None
+        self.last_status: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.running = 0
+        self.runs = 0
+        self.failures = 0
+        self.misfires = 0
+        self.skipped = 0
+
+    def describe(self) -> dict:
+        return {
+            'name': self.name,
+            'schedule': str(self.schedule),
+            'next_run': self.next_run,
+            'last_run': self.last_run,
+            'last_status': self.last_status,
+            'last_duration': self.last_duration,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'misfires': self.misfires,
+            'skipped': self.skipped,
+        }
+
+
 class Scheduler:
-    def __init__(self, notification_service: NotificationService):
+    """Планировщик по расписаниям cron и интервалам
+
+    Вычисляет ближайшее время срабатывания и спит ровно до него. Запуск,
+    опоздавший больше чем на misfire_grace секунд (процесс спал или цикл
+    событий был занят), пропускается; запуск при уже работающих max_instances
+    экземплярах задачи тоже пропускается, а не ставится в очередь.
+
+    Для durable-задач каждый слот (время срабатывания по расписанию) занимается
+    в таблице job_runs до запуска. При старте слоты, пропущенные за время
+    простоя в пределах misfire_grace, наверстываются, а успешно выполненный
+    слот повторно не запускается.
+
+    С арендой лидерства задачи запускает только реплика, которая ее держит;
+    ставшая лидером реплика наверстывает слоты так же, как при старте.
+    """
+
+    def __init__(
+        self,
+        notification_service: NotificationService,
+        now: Callable[[], datetime] = datetime.now,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        max_sleep: float = 60.0,
+        lease: Optional[LeaderLease] = None,
+    ):
         self.notification_service = notification_service
+        self.lease = lease
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._now = now
+        self._sleep = sleep
+        # Длинный сон режется на части, чтобы заметить перевод системных часов
+        self.max_sleep = max_sleep
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add_job(
+        self,
+        name: str,
+        schedule: Schedule,
+        func: Callable[[], Awaitable[Any]],
+        max_instances: int = 1,
+        misfire_grace: Optional[float] = None,
+        durable: bool = False,
+    ) -> ScheduledJob:
+        if name in self.jobs:
+            raise ValueError(f"задача {name} уже зарегистрирована")
+        if misfire_grace is None:
+            misfire_grace = float(config.SCHEDULER_MISFIRE_GRACE_SECONDS)
+        job = ScheduledJob(name, schedule, func, max_instances, misfire_grace, durable)
+        job.next_run = schedule.next_after(self._now())
+        self.jobs[name] = job
+        return job
+
+    def register_default_jobs(self):
+        """Напоминания ученикам и кураторам и сводки кураторам"""
+        service = self.notification_service
+        schedules = default_job_schedules()
+        self.add_job('weekly_reminders', schedules['weekly_reminders'],
+                     service.send_weekly_reminders, durable=True)
+        self.add_job('daily_missing_report_reminders', schedules['daily_missing_report_reminders'],
+                     service.send_daily_missing_report_reminders, durable=True)
+        self.add_job('curator_missing_reports', schedules['curator_missing_reports'],
+                     service.send_curator_missing_reports_notifications, durable=True)
+        self.add_job('curator_digests', schedules['curator_digests'], service.flush_curator_digests)
+
+    def describe_jobs(self) -> List[dict]:
+        """Состояние всех задач в порядке ближайшего запуска"""
+        return [job.describe() for job in sorted(self.jobs.values(), key=lambda job: job.next_run)]
+
+    async def run_pending(self) -> Optional[float]:
+        """Запускает задачи, время которых подошло; возвращает паузу до следующего срабатывания"""
+        now = self._now()
+        leading = self.lease is None or self.lease.is_leader
+        for job in self.jobs.values():
+            if job.next_run > now:
+                continue
+            scheduled_for = job.next_run
+            # Пропущенные срабатывания не наверстываются по одному: следующее считается от текущего момента
+            job.next_run = job.schedule.next_after(now)
+            lateness = (now - scheduled_for).total_seconds()
+            if lateness > job.misfire_grace:
+                job.misfires += 1
+                logger.warning(f"Задача {job.name} пропущена: опоздание {lateness:.0f} с на запуск {scheduled_for}")
+            elif not leading:
+                logger.info(f"Задача {job.name} не запущена: реплика не лидер")
+            elif job.running >= job.max_instances:
+                job.skipped += 1
+                logger.warning(f"Задача {job.name} пропущена: еще выполняется предыдущий запуск")
+            else:
+                self._start(job, scheduled_for)
+        if not self.jobs:
+            return None
+        next_run = min(job.next_run for job in self.jobs.values())
+        return max(0.0, (next_run - self._now()).total_seconds())
+
+    async def catch_up(self) -> int:
+        """Запускает последний слот каждой durable-задачи, пропущенный за время простоя
+        не дольше misfire_grace; возвращает число запущенных задач"""
+        now = self._now()
+        started = 0
+        for job in self.jobs.values():
+            # Расписание отсчитывается заново: наверстанный слот не запустится еще раз
+            # из run_pending, а интервальные задачи не считаются опоздавшими
+            job.next_run = job.schedule.next_after(now)
+            if not job.durable:
+                continue
+            missed = None
+            moment = job.schedule.next_after(now - timedelta(seconds=job.misfire_grace))
+            while moment <= now:
+                missed = moment
+                moment = job.schedule.next_after(moment)
+            if missed is not None and job.running < job.max_instances:
+                logger.info(f"Наверстываю задачу {job.name} за слот {missed:{SLOT_FORMAT}}")
+                self._start(job, missed)
+                started += 1
+        return started
 
-    async def start_weekly_reminders(self):
-        """Запускает планировщик еженедельных напоминаний"""
+    def _start(self, job: ScheduledJob, scheduled_for: datetime):
+        job.running += 1
+        task = asyncio.create_task(self._run_job(job, scheduled_for))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job: ScheduledJob, scheduled_for: datetime):
+        db = self.notification_service.db if job.durable else None
+        slot = scheduled_for.strftime(SLOT_FORMAT)
+        try:
+            if db is not None and not await db.claim_job_run(job.name, slot, self._now()):
+                job.skipped += 1
+                logger.info(f"Задача {job.name} за слот {slot} уже выполнена")
+                return
+            status, items, error = await self._execute(job, slot)
+            # Прерванный запуск остается в running и будет наверстан после перезапуска
+            if db is not None:
+                await db.finish_job_run(job.name, slot, status, self._now(), items=items, error=error)
+        except Exception as e:
+            logger.error(f"Ошибка журнала запусков задачи {job.name}: {e}")
+        finally:
+            job.running -= 1
+
+    async def _execute(self, job: ScheduledJob, slot: str) -> tuple:
+        """Выполняет задачу и возвращает (статус, число обработанных, ошибка)"""
+        started = self._now()
+        job.last_run = started
+        try:
+            result = await job.func()
+        except Exception as e:
+            job.failures += 1
+            job.last_status = 'error'
+            logger.error(f"Ошибка в задаче {job.name} за слот {slot}: {e}")
+            return 'error', None, str(e)
+        finally:
+            job.runs += 1
+            job.last_duration = (self._now() - started).total_seconds()
+        job.last_status = 'ok'
+        logger.info(f"Задача {job.name} выполнена за слот {slot}")
+        return 'ok', result if isinstance(result, int) else None, None
+
+    async def run(self):
+        leading = False
         while True:
-            try:
-                current_time = datetime.now()
-                current_weekday = current_time.weekday()  # 0 = понедельник, 2 = среда
-                current_hour = current_time.hour
-                
-                if current_weekday == 0 and current_hour == 10:
-                    await self.notification_service.send_weekly_reminders()
-                    logger.info("Отправлены еженедельные напоминания ученикам")
-                if current_weekday in {1, 2, 3, 4, 5, 6} and current_hour == 10:
-                    await self.notification_service.send_daily_missing_report_reminders()
-                    logger.info("Отправлены ежедневные напоминания ученикам без отчета")
-                
-                if current_weekday == 2 and current_hour == 14:
-                    await self.notification_service.send_curator_missing_reports_notifications()
-                    logger.info("Отправлены уведомления кураторам о неотправленных отчетах")
-                
-                await asyncio.sleep(3600)  # Проверяем каждый час
-            except Exception as e:
-                logger.error(f"Ошибка в планировщике: {e}")
-                await asyncio.sleep(3600)
+            if self.lease is not None and not self.lease.is_leader:
+                if leading:
+                    logger.warning("Аренда лидерства потеряна, задачи планировщика остановлены")
+                leading = False
+                await self.lease.wait_elected()
+                continue
+            if not leading:
+                leading = True
+                await self.catch_up()
+            delay = await self.run_pending()
+            await self._sleep(self.max_sleep if delay is None else min(delay, self.max_sleep))
+
+    async def join(self):
+        """Ждет завершения уже запущенных задач"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -23,4 +23,5 @@ async def db(tmp_path, monkeypatch) -> AsyncGenerator[Database, None]:
     database.db_path = str(test_db_path)
     await database.init_db()
     yield database
+    await database.close()
 
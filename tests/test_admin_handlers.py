@@ -2,18 +2,21 @@ import pytest
 from unittest.mock import AsyncMock
 from types import SimpleNamespace
 
+from background import BackgroundTasks
 from handlers.admin_handlers import register_admin_handlers
 from tests.utils import FakeDispatcher, FakeFSMContext, FakeMessage
 from states import AdminStates
 
 
 @pytest.fixture
-def setup_admin_handlers():
+async def setup_admin_handlers():
     dispatcher = FakeDispatcher()
     db = AsyncMock()
     db.is_admin = AsyncMock()
     db.get_all_curators = AsyncMock()
     db.get_curator_stats = AsyncMock()
+    db.get_all_curator_stats = AsyncMock()
+    db.get_system_counters = AsyncMock()
     db.get_students_without_curators = AsyncMock()
     db.get_all_students_with_curators = AsyncMock()
     db.add_user = AsyncMock()
@@ -26,10 +29,12 @@ def setup_admin_handlers():
     notification_service = SimpleNamespace(
         notify_student_curator_assigned=AsyncMock(),
         send_curator_missing_reports_notifications=AsyncMock(),
+        background=BackgroundTasks(),
     )
 
     register_admin_handlers(dispatcher, db, notification_service)
-    return dispatcher, db, notification_service
+    yield dispatcher, db, notification_service
+    await notification_service.background.stop()
 
 
 @pytest.mark.asyncio
@@ -64,25 +69,25 @@ async def test_all_curators_handler_lists_curators(setup_admin_handlers):
     handler = dispatcher.message_handlers["all_curators_handler"]
     message = FakeMessage(user_id=1)
     db.is_admin.return_value = True
-    db.get_all_curators.return_value = [
+    db.get_all_curator_stats.return_value = [
         {
             "user_id": 10,
             "username": "curator",
             "first_name": "Cur",
             "last_name": "Ator",
+            "student_count": 2,
+            "total_reports": 5,
+            "unread_reports": 1,
         }
     ]
-    db.get_curator_stats.return_value = {
-        "student_count": 2,
-        "total_reports": 5,
-        "unread_reports": 1,
-    }
 
     await handler(message)
 
-    db.get_curator_stats.assert_awaited_once_with(10)
+    db.get_all_curator_stats.assert_awaited_once_with()
+    db.get_curator_stats.assert_not_awaited()
     assert len(message.answers) == 1
     assert "все кураторы" in message.answers[0][0].lower()
+    assert "Учеников: 2" in message.answers[0][0]
 
 
 @pytest.mark.asyncio
@@ -91,20 +96,30 @@ async def test_admin_stats_handler_combines_data(setup_admin_handlers):
     handler = dispatcher.message_handlers["admin_stats_handler"]
     message = FakeMessage(user_id=1)
     db.is_admin.return_value = True
-    db.get_all_curators.return_value = [
-        {"user_id": 10, "first_name": "Cur", "last_name": "Ator", "username": "curator"}
-    ]
-    db.get_all_students_with_curators.return_value = [
-        {"user_id": 1, "curator_id": 10}
-    ]
-    db.get_students_without_curators.return_value = [
-        {"user_id": 2}
-    ]
-    db.get_curator_stats.return_value = {
-        "student_count": 1,
+    db.get_system_counters.return_value = {
+        "total_curators": 1,
+        "total_students": 2,
+        "students_with_curators": 1,
+        "students_without_curators": 1,
         "total_reports": 3,
         "unread_reports": 0,
+        "unreachable_users": 1,
+        "avoided_sends": 7,
+        "delivered_messages": 40,
+        "failed_messages": 2,
+        "delivery_attempts": 45,
     }
+    db.get_all_curator_stats.return_value = [
+        {
+            "user_id": 10,
+            "first_name": "Cur",
+            "last_name": "Ator",
+            "username": "curator",
+            "student_count": 1,
+            "total_reports": 3,
+            "unread_reports": 0,
+        }
+    ]
 
     await handler(message)
 
@@ -112,6 +127,11 @@ async def test_admin_stats_handler_combines_data(setup_admin_handlers):
     text = message.answers[0][0]
     assert "общая статистика системы" in text.lower()
     assert "всего кураторов" in text.lower()
+    assert "Всего учеников: 2" in text
+    assert "Сэкономлено отправок: 7" in text
+    assert "Доставлено сообщений: 40, не доставлено: 2, попыток: 45" in text
+    db.get_curator_stats.assert_not_awaited()
+    db.get_all_students_with_curators.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -203,6 +223,7 @@ async def test_process_curator_selection_assigns_student(setup_admin_handlers):
     db.assign_student_to_curator.assert_awaited_once_with(2, 10)
     assert state.cleared is True
     assert "назначение выполнено" in message.answers[0][0].lower()
+    await notification_service.background.join()
     notification_service.notify_student_curator_assigned.assert_awaited_once_with(2)
 
 
@@ -344,11 +365,26 @@ async def test_notify_curators_handler_sends_notifications(setup_admin_handlers)
     message = FakeMessage(user_id=1)
     db.is_admin.return_value = True
 
+    notification_service.send_curator_missing_reports_notifications.return_value = 2
+
     await handler(message)
 
-    notification_service.send_curator_missing_reports_notifications.assert_awaited_once()
+    notification_service.send_curator_missing_reports_notifications.assert_awaited_once_with(slot="manual:1:1")
     assert len(message.answers) == 1
-    assert "уведомления" in message.answers[0][0].lower()
+    assert "кураторам: 2" in message.answers[0][0]
+
+
+@pytest.mark.asyncio
+async def test_notify_curators_handler_reports_when_nothing_queued(setup_admin_handlers):
+    dispatcher, db, notification_service = setup_admin_handlers
+    handler = dispatcher.message_handlers["notify_curators_handler"]
+    message = FakeMessage(user_id=1)
+    db.is_admin.return_value = True
+    notification_service.send_curator_missing_reports_notifications.return_value = 0
+
+    await handler(message)
+
+    assert "уведомлять некого" in message.answers[0][0]
 
 
 @pytest.mark.asyncio
@@ -419,7 +455,7 @@ async def test_all_curators_handler_empty_list(setup_admin_handlers):
     handler = dispatcher.message_handlers["all_curators_handler"]
     message = FakeMessage(user_id=1)
     db.is_admin.return_value = True
-    db.get_all_curators.return_value = []
+    db.get_all_curator_stats.return_value = []
 
     await handler(message)
 
@@ -481,3 +517,86 @@ async def test_process_curator_selection_empty_list(setup_admin_handlers):
     assert state.cleared is True
     assert "недоступны" in message.answers[0][0].lower()
 
+
+
+@pytest.mark.asyncio
+async def test_jobs_handler_lists_scheduler_jobs():
+    from datetime import datetime
+    from cron import CronSchedule
+
+    dispatcher = FakeDispatcher()
+    db = AsyncMock()
+    db.is_admin.return_value = True
+    db.get_latest_job_runs.return_value = {}
+    db.get_lease.return_value = None
+    register_admin_handlers(dispatcher, db, SimpleNamespace(), {"weekly_reminders": CronSchedule("0 10 * * 1")},
+                            now=lambda: datetime(2024, 1, 1, 9, 0))
+    message = FakeMessage(user_id=1)
+
+    await dispatcher.message_handlers["jobs_handler"](message)
+
+    text = message.answers[0][0]
+    assert "weekly\\_reminders" in text
+    assert "01.01.2024 10:00" in text
+    assert "Нет активного worker" in text
+
+
+@pytest.mark.asyncio
+async def test_jobs_handler_computes_next_run_at_request_time():
+    from datetime import datetime
+    from cron import CronSchedule
+
+    dispatcher = FakeDispatcher()
+    db = AsyncMock()
+    db.is_admin.return_value = True
+    db.get_latest_job_runs.return_value = {}
+    db.get_lease.return_value = None
+    clock = {"now": datetime(2024, 1, 1, 9, 0)}
+    register_admin_handlers(dispatcher, db, SimpleNamespace(), {"weekly_reminders": CronSchedule("0 10 * * 1")},
+                            now=lambda: clock["now"])
+    # Бот работает дольше недели: первый слот после регистрации уже прошел
+    clock["now"] = datetime(2024, 1, 9, 12, 0)
+    message = FakeMessage(user_id=1)
+
+    await dispatcher.message_handlers["jobs_handler"](message)
+
+    text = message.answers[0][0]
+    assert "Следующий запуск: 15.01.2024 10:00" in text
+    assert "01.01.2024" not in text
+
+
+@pytest.mark.asyncio
+async def test_jobs_handler_shows_worker_state_from_database():
+    import time
+    from datetime import datetime
+    from cron import CronSchedule
+
+    dispatcher = FakeDispatcher()
+    db = AsyncMock()
+    db.is_admin.return_value = True
+    db.get_latest_job_runs.return_value = {
+        "weekly_reminders": {"slot": "2024-01-01 10:00", "status": "ok", "items": 42},
+    }
+    db.get_lease.return_value = {"holder": "worker-1", "expires_at": time.time() + 30, "heartbeat_at": time.time()}
+    register_admin_handlers(dispatcher, db, SimpleNamespace(), {"weekly_reminders": CronSchedule("0 10 * * 1")},
+                            now=lambda: datetime(2024, 1, 1, 9, 0))
+    message = FakeMessage(user_id=1)
+
+    await dispatcher.message_handlers["jobs_handler"](message)
+
+    text = message.answers[0][0]
+    assert "worker-1" in text
+    assert "2024-01-01 10:00 ✅, обработано: 42" in text
+    # Счетчики процесса бота пусты: задачи в нем не выполняются
+    assert "Запусков" not in text
+
+
+@pytest.mark.asyncio
+async def test_jobs_handler_without_scheduler(setup_admin_handlers):
+    dispatcher, db, _ = setup_admin_handlers
+    db.is_admin.return_value = True
+    message = FakeMessage(user_id=1)
+
+    await dispatcher.message_handlers["jobs_handler"](message)
+
+    assert "пуст" in message.answers[0][0]
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from background import BackgroundTasks
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_before_job_finishes():
+    tasks = BackgroundTasks(workers=2)
+    release = asyncio.Event()
+    done = []
+
+    async def job(value):
+        await release.wait()
+        done.append(value)
+
+    await asyncio.wait_for(tasks.submit(job, 1), timeout=0.1)
+    assert done == []
+
+    release.set()
+    await tasks.join()
+    assert done == [1]
+    await tasks.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_does_not_stop_workers():
+    tasks = BackgroundTasks(workers=1)
+    done = []
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def job():
+        done.append(True)
+
+    await tasks.submit(failing)
+    await tasks.submit(job)
+    await tasks.join()
+
+    assert done == [True]
+    assert tasks.metrics() == {"pending": 0, "submitted": 2, "completed": 1, "failed": 1}
+    await tasks.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_pending_jobs_and_rejects_new_ones():
+    tasks = BackgroundTasks(max_pending=10, workers=1)
+    done = []
+
+    async def job(value):
+        await asyncio.sleep(0.01)
+        done.append(value)
+
+    for value in range(5):
+        await tasks.submit(job, value)
+    await tasks.stop(timeout=1)
+
+    assert done == [0, 1, 2, 3, 4]
+    with pytest.raises(RuntimeError):
+        await tasks.submit(job, 5)
+
+
+@pytest.mark.asyncio
+async def test_full_queue_applies_backpressure():
+    tasks = BackgroundTasks(max_pending=1, workers=1)
+    release = asyncio.Event()
+
+    async def job():
+        await release.wait()
+
+    await tasks.submit(job)
+    await asyncio.sleep(0)
+    await tasks.submit(job)
+    blocked = asyncio.create_task(tasks.submit(job))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    release.set()
+    await blocked
+    await tasks.stop(timeout=1)
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from broadcast import Broadcaster, ChatPacer, TokenBucket
+
+
+class FakeClock:
+    """Часы, которые сдвигаются только при ожидании"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate_after_burst(clock):
+    bucket = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+
+    for _ in range(30):
+        await bucket.acquire()
+
+    # 10 токенов уходят сразу, остальные 20 по одному каждые 0.1 с
+    assert clock.now == pytest.approx(2.0)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_pause_blocks_acquire(clock):
+    bucket = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+    bucket.pause(5)
+
+    await bucket.acquire()
+
+    assert clock.now >= 5
+
+
+@pytest.mark.asyncio
+async def test_chat_pacer_spaces_messages_to_one_chat(clock):
+    pacer = ChatPacer(interval=1, clock=clock, sleep=clock.sleep)
+
+    await pacer.wait(1)
+    await pacer.wait(2)
+    assert clock.now == 0
+    await pacer.wait(1)
+    assert clock.now == pytest.approx(1)
+
+
+@pytest.mark.asyncio
+async def test_run_uses_bounded_workers_and_counts_outcomes(clock):
+    broadcaster = Broadcaster(rate=1000, chat_interval=0, workers=3, progress_every=4, clock=clock, sleep=clock.sleep)
+    in_flight = 0
+    max_in_flight = 0
+    progress = []
+
+    async def deliver(item):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await clock.sleep(0.01)
+        in_flight -= 1
+        if item == 3:
+            raise RuntimeError("boom")
+        return item % 2 == 0
+
+    result = await broadcaster.run(range(10), deliver, on_progress=progress.append)
+
+    assert max_in_flight == 3
+    assert result.total == result.done == 10
+    assert result.delivered == 5
+    assert result.failed == 5
+    assert [snapshot.done for snapshot in progress] == [4, 8, 10]
+
+
+@pytest.mark.asyncio
+async def test_run_with_no_items_returns_empty_result(clock):
+    broadcaster = Broadcaster(rate=30, chat_interval=1, workers=2, clock=clock, sleep=clock.sleep)
+
+    result = await broadcaster.run([], lambda item: None)
+
+    assert result.total == 0
+    assert result.done == 0
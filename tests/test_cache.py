@@ -0,0 +1,64 @@
+import pytest
+
+from cache import MISSING, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_missing_for_unknown_key():
+    cache = TTLCache(maxsize=2, ttl=10)
+
+    assert cache.get("key") is MISSING
+    assert cache.get("key", None) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("key", "value")
+
+    clock.now = 9.9
+    assert cache.get("key") == "value"
+    clock.now = 10.0
+    assert cache.get("key") is MISSING
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_and_stats():
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", None)
+
+    assert cache.get("a") is None
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is MISSING
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_non_positive_size_is_rejected():
+    with pytest.raises(ValueError):
+        TTLCache(maxsize=0, ttl=10)
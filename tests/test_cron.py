@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from cron import CronSchedule, IntervalSchedule
+
+
+def test_weekly_schedule_fires_on_monday_morning():
+    schedule = CronSchedule("0 10 * * 1")
+
+    # 2024-01-01 — понедельник
+    assert schedule.next_after(datetime(2024, 1, 1, 9, 59, 30)) == datetime(2024, 1, 1, 10, 0)
+    assert schedule.next_after(datetime(2024, 1, 1, 10, 0)) == datetime(2024, 1, 8, 10, 0)
+
+
+def test_weekday_lists_and_ranges_treat_zero_and_seven_as_sunday():
+    schedule = CronSchedule("0 10 * * 0,2-6")
+    fires = []
+    moment = datetime(2024, 1, 1, 0, 0)
+    for _ in range(7):
+        moment = schedule.next_after(moment)
+        fires.append(moment)
+
+    assert [fire.weekday() for fire in fires] == [1, 2, 3, 4, 5, 6, 1]
+    assert CronSchedule("0 0 * * 7").next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 7, 0, 0)
+
+
+def test_steps_day_of_month_and_year_rollover():
+    assert CronSchedule("*/15 * * * *").next_after(datetime(2024, 1, 1, 10, 16)) == datetime(2024, 1, 1, 10, 30)
+    assert CronSchedule("0 0 1 1 *").next_after(datetime(2024, 3, 5)) == datetime(2025, 1, 1, 0, 0)
+    assert CronSchedule("0 12 29 2 *").next_after(datetime(2024, 3, 1)) == datetime(2028, 2, 29, 12, 0)
+
+
+def test_day_of_month_or_weekday_when_both_are_set():
+    # Как в cron: 13-е число или любая пятница
+    schedule = CronSchedule("0 0 13 * 5")
+
+    assert schedule.next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 5, 0, 0)
+    assert schedule.next_after(datetime(2024, 1, 12, 1)) == datetime(2024, 1, 13, 0, 0)
+
+
+@pytest.mark.parametrize("expression", ["0 10 * *", "60 * * * *", "0 10 * * 8", "*/0 * * * *", "0 0 31 2 *"])
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression).next_after(datetime(2024, 1, 1))
+
+
+def test_interval_schedule():
+    assert IntervalSchedule(90).next_after(datetime(2024, 1, 1, 10, 0)) == datetime(2024, 1, 1, 10, 1, 30)
+    with pytest.raises(ValueError):
+        IntervalSchedule(0)
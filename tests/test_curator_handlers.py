@@ -1,9 +1,13 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock
 from types import SimpleNamespace
 from datetime import datetime
 
+from background import BackgroundTasks
 from handlers.curator_handlers import register_curator_handlers
+from routing import parse_callback
 from tests.utils import (
     FakeDispatcher,
     FakeFSMContext,
@@ -14,7 +18,7 @@ from tests.utils import (
 
 
 @pytest.fixture
-def setup_curator_handlers():
+async def setup_curator_handlers():
     dispatcher = FakeDispatcher()
     db = AsyncMock()
     db.is_admin = AsyncMock()
@@ -31,10 +35,12 @@ def setup_curator_handlers():
     notification_service = SimpleNamespace(
         notify_student_curator_assigned=AsyncMock(),
         notify_student_report_read=AsyncMock(),
+        background=BackgroundTasks(),
     )
 
     register_curator_handlers(dispatcher, db, notification_service)
-    return dispatcher, db, notification_service
+    yield dispatcher, db, notification_service
+    await notification_service.background.stop()
 
 
 @pytest.mark.asyncio
@@ -101,6 +107,7 @@ async def test_process_student_id_adds_student_and_notifies(setup_curator_handle
     assert state.cleared is True
     assert len(message.answers) == 1
     assert "ученик с id" in message.answers[0][0].lower()
+    await notification_service.background.join()
     notification_service.notify_student_curator_assigned.assert_awaited_once_with(123)
 
 
@@ -135,25 +142,118 @@ async def test_mark_report_read_marks_and_notifies(setup_curator_handlers):
     dispatcher, db, notification_service = setup_curator_handlers
     handler = dispatcher.callback_handlers["mark_report_read"]
     callback_message = FakeCallbackMessage(text="Report text")
-    callback = FakeCallbackQuery(user_id=7, data="read_3", message=callback_message)
-    db.get_report_by_id.return_value = {
+    callback = FakeCallbackQuery(user_id=7, data="read:3", message=callback_message)
+    db.mark_report_as_read.return_value = {
+        "id": 3,
         "user_id": 20,
         "current_stage": "stage",
         "plans": "plans",
         "problems": "problems",
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "username": "student",
+        "first_name": "Stu",
+        "last_name": "Dent",
     }
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     db.mark_report_as_read.assert_awaited_once_with(3, 7)
-    db.get_report_by_id.assert_awaited_once_with(3)
+    db.get_report_by_id.assert_not_awaited()
+    await notification_service.background.join()
     notification_service.notify_student_report_read.assert_awaited_once_with(
         20,
-        db.get_report_by_id.return_value,
+        db.mark_report_as_read.return_value,
     )
     assert callback.answers and "отчет отмечен" in callback.answers[0][0].lower()
     assert callback_message.edits and "прочитано" in callback_message.edits[0][0].lower()
+    assert "Stu Dent" in callback_message.edits[0][0]
+
+
+@pytest.mark.asyncio
+async def test_mark_report_read_in_digest_keeps_other_reports(setup_curator_handlers):
+    from aiogram.types import InlineKeyboardMarkup
+    from digests import build_digest_messages
+
+    dispatcher, db, _ = setup_curator_handlers
+    handler = dispatcher.callback_handlers["mark_report_read"]
+    events = [
+        {"event_id": report_id, "report_id": report_id, "current_stage": f"stage{report_id}",
+         "report_created_at": "2024-01-01 10:00:00", "student_id": report_id,
+         "username": f"student{report_id}", "first_name": None, "last_name": None}
+        for report_id in (1, 2, 3)
+    ]
+    _, text, reply_markup = build_digest_messages(events, 10)[0]
+    callback_message = FakeCallbackMessage(text=text, reply_markup=InlineKeyboardMarkup.model_validate(reply_markup))
+    pressed = reply_markup["inline_keyboard"][1][0]["callback_data"]
+    callback = FakeCallbackQuery(user_id=7, data=pressed, message=callback_message)
+    db.mark_report_as_read.return_value = {
+        "id": 2, "user_id": 2, "current_stage": "stage2", "plans": "plans", "problems": "problems",
+        "created_at": "2024-01-01 10:00:00", "username": "student2", "first_name": None, "last_name": None,
+    }
+
+    await handler(callback, parse_callback(callback.data))
+
+    db.mark_report_as_read.assert_awaited_once_with(2, 7)
+    # Текст сводки не меняется, пропадает только кнопка прочитанного отчета
+    assert callback_message.edits == []
+    remaining = callback_message.reply_markup.inline_keyboard
+    assert [row[0].callback_data for row in remaining] == [
+        reply_markup["inline_keyboard"][0][0]["callback_data"],
+        reply_markup["inline_keyboard"][2][0]["callback_data"],
+    ]
+    assert len(callback_message.answers) == 1
+    assert "student2" in callback_message.answers[0][0]
+    assert "ПРОЧИТАНО" in callback_message.answers[0][0]
+
+
+@pytest.mark.asyncio
+async def test_mark_report_read_answers_callback_before_database(setup_curator_handlers):
+    dispatcher, db, _ = setup_curator_handlers
+    handler = dispatcher.callback_handlers["mark_report_read"]
+    callback = FakeCallbackQuery(user_id=7, data="read:3", message=FakeCallbackMessage(text="Report text"))
+    answered_before_mark = []
+
+    async def mark(report_id, curator_id):
+        answered_before_mark.append(bool(callback.answers))
+        return None
+
+    db.mark_report_as_read.side_effect = mark
+
+    await handler(callback, parse_callback(callback.data))
+
+    assert answered_before_mark == [True]
+
+
+@pytest.mark.asyncio
+async def test_mark_report_read_answers_before_student_is_notified(setup_curator_handlers):
+    dispatcher, db, notification_service = setup_curator_handlers
+    handler = dispatcher.callback_handlers["mark_report_read"]
+    callback = FakeCallbackQuery(user_id=7, data="read:3", message=FakeCallbackMessage(text="Report text"))
+    db.mark_report_as_read.return_value = {
+        "id": 3,
+        "user_id": 20,
+        "current_stage": "stage",
+        "plans": "plans",
+        "problems": "problems",
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "username": None,
+        "first_name": None,
+        "last_name": None,
+    }
+    telegram_responded = asyncio.Event()
+
+    async def slow_notification(*args):
+        await telegram_responded.wait()
+
+    notification_service.notify_student_report_read.side_effect = slow_notification
+
+    await asyncio.wait_for(handler(callback, parse_callback(callback.data)), timeout=1)
+
+    assert callback.answers
+    assert notification_service.background.metrics()["completed"] == 0
+    telegram_responded.set()
+    await notification_service.background.join()
+    notification_service.notify_student_report_read.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -304,12 +404,14 @@ async def test_mark_report_read_without_report_found(setup_curator_handlers):
     dispatcher, db, notification_service = setup_curator_handlers
     handler = dispatcher.callback_handlers["mark_report_read"]
     callback_message = FakeCallbackMessage(text="Report text")
-    callback = FakeCallbackQuery(user_id=7, data="read_3", message=callback_message)
-    db.get_report_by_id.return_value = None
+    callback = FakeCallbackQuery(user_id=7, data="read:3", message=callback_message)
+    db.mark_report_as_read.return_value = None
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     db.mark_report_as_read.assert_awaited_once_with(3, 7)
+    assert callback_message.edits and "прочитано" in callback_message.edits[0][0].lower()
+    await notification_service.background.join()
     notification_service.notify_student_report_read.assert_not_awaited()
 
 
@@ -318,7 +420,7 @@ async def test_view_student_reports_shows_all_reports(setup_curator_handlers):
     dispatcher, db, _ = setup_curator_handlers
     handler = dispatcher.callback_handlers["view_student_reports"]
     callback_message = FakeCallbackMessage()
-    callback = FakeCallbackQuery(user_id=10, data="view_reports_1", message=callback_message)
+    callback = FakeCallbackQuery(user_id=10, data="view_reports:1", message=callback_message)
     
     db.get_all_student_reports_for_curator.return_value = [
         {
@@ -345,7 +447,7 @@ async def test_view_student_reports_shows_all_reports(setup_curator_handlers):
         }
     ]
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     db.get_all_student_reports_for_curator.assert_awaited_once_with(10, 1)
     assert len(callback_message.answers) == 1
@@ -364,11 +466,11 @@ async def test_view_student_reports_shows_no_reports_message(setup_curator_handl
     dispatcher, db, _ = setup_curator_handlers
     handler = dispatcher.callback_handlers["view_student_reports"]
     callback_message = FakeCallbackMessage()
-    callback = FakeCallbackQuery(user_id=10, data="view_reports_1", message=callback_message)
+    callback = FakeCallbackQuery(user_id=10, data="view_reports:1", message=callback_message)
     
     db.get_all_student_reports_for_curator.return_value = []
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     db.get_all_student_reports_for_curator.assert_awaited_once_with(10, 1)
     assert len(callback.answers) == 1
@@ -380,7 +482,7 @@ async def test_view_student_reports_shows_plans_completion_info(setup_curator_ha
     dispatcher, db, _ = setup_curator_handlers
     handler = dispatcher.callback_handlers["view_student_reports"]
     callback_message = FakeCallbackMessage()
-    callback = FakeCallbackQuery(user_id=10, data="view_reports_1", message=callback_message)
+    callback = FakeCallbackQuery(user_id=10, data="view_reports:1", message=callback_message)
     
     db.get_all_student_reports_for_curator.return_value = [
         {
@@ -396,7 +498,7 @@ async def test_view_student_reports_shows_plans_completion_info(setup_curator_ha
         }
     ]
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     text = callback_message.answers[0][0]
     assert "выполнение планов" in text.lower() and "нет" in text.lower()
@@ -408,7 +510,7 @@ async def test_view_student_reports_splits_long_messages(setup_curator_handlers)
     dispatcher, db, _ = setup_curator_handlers
     handler = dispatcher.callback_handlers["view_student_reports"]
     callback_message = FakeCallbackMessage()
-    callback = FakeCallbackQuery(user_id=10, data="view_reports_1", message=callback_message)
+    callback = FakeCallbackQuery(user_id=10, data="view_reports:1", message=callback_message)
     
     long_text = "x" * 2000
     reports = []
@@ -427,9 +529,38 @@ async def test_view_student_reports_splits_long_messages(setup_curator_handlers)
     
     db.get_all_student_reports_for_curator.return_value = reports
 
-    await handler(callback)
+    await handler(callback, parse_callback(callback.data))
 
     assert len(callback_message.answers) > 1
     total_text = "".join([ans[0] for ans in callback_message.answers])
     assert "всего отчетов" in total_text.lower() and "5" in total_text
 
+
+@pytest.mark.asyncio
+async def test_digest_handler_updates_mode(setup_curator_handlers):
+    dispatcher, db, _ = setup_curator_handlers
+    handler = dispatcher.message_handlers["digest_handler"]
+    db.get_user_type.return_value = "curator"
+
+    await handler(FakeMessage(user_id=10, text="/digest 30"))
+    await handler(FakeMessage(user_id=10, text="/digest daily"))
+    message = FakeMessage(user_id=10, text="/digest soon")
+    await handler(message)
+
+    assert [call.args for call in db.set_digest_settings.await_args_list] == [
+        (10, "interval", 30),
+        (10, "daily"),
+    ]
+    assert "❌" in message.get_last_answer_text()
+
+
+@pytest.mark.asyncio
+async def test_digest_handler_rejects_non_curator(setup_curator_handlers):
+    dispatcher, db, _ = setup_curator_handlers
+    handler = dispatcher.message_handlers["digest_handler"]
+    db.get_user_type.return_value = "student"
+    message = FakeMessage(user_id=1, text="/digest daily")
+
+    await handler(message)
+
+    db.set_digest_settings.assert_not_awaited()
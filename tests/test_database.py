@@ -5,6 +5,18 @@ import aiosqlite
 import pytest
 
 
+async def move_reports_to_previous_week(db, user_id=None):
+    """Сдвигает отчеты (всех учеников или одного) на неделю назад: текущая неделя
+    освобождается, и следующий save_report не упирается в ограничение недели"""
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute(
+            "update reports set created_at = datetime(created_at, '-7 days') where ? is null or user_id = ?",
+            (user_id, user_id),
+        )
+        await connection.commit()
+    await db.check_week_status_consistency(repair=True)
+
+
 @pytest.mark.asyncio
 async def test_add_user_and_get_profile(db):
     await db.add_user(1, username="student", first_name="Ivan", last_name="Ivanov")
@@ -43,13 +55,7 @@ async def test_save_report_and_get_user_reports_sorted(db):
     await db.add_user(1, username="student", user_type="student")
 
     await db.save_report(1, "stage1", "plan1", "problem1")
-    async with aiosqlite.connect(db.db_path) as connection:
-        older = datetime.now() - timedelta(minutes=5)
-        await connection.execute(
-            "update reports set created_at = ? where user_id = ? and current_stage = ?",
-            (older.strftime("%Y-%m-%d %H:%M:%S"), 1, "stage1"),
-        )
-        await connection.commit()
+    await move_reports_to_previous_week(db, 1)
     await db.save_report(1, "stage2", "plan2", "problem2")
 
     reports = await db.get_user_reports(1)
@@ -101,6 +107,7 @@ async def test_get_students_missing_weekly_reports_returns_students_without_repo
             (past_date.strftime("%Y-%m-%d %H:%M:%S"), 2),
         )
         await connection.commit()
+    await db.check_week_status_consistency(repair=True)
 
     missing = await db.get_students_missing_weekly_reports()
 
@@ -132,15 +139,7 @@ async def test_has_previous_reports_returns_false_when_no_reports(db):
 async def test_get_last_stage_choice_returns_most_recent_stage(db):
     await db.add_user(1, username="student", user_type="student")
     await db.save_report(1, "stage1", "plan1", "problem1")
-    
-    async with aiosqlite.connect(db.db_path) as connection:
-        older = datetime.now() - timedelta(days=1)
-        await connection.execute(
-            "update reports set created_at = ? where current_stage = ?",
-            (older.strftime("%Y-%m-%d %H:%M:%S"), "stage1"),
-        )
-        await connection.commit()
-    
+    await move_reports_to_previous_week(db, 1)
     await db.save_report(1, "stage2", "plan2", "problem2")
     
     async with aiosqlite.connect(db.db_path) as connection:
@@ -283,6 +282,7 @@ async def test_get_curator_students_returns_only_active_students(db):
             (2,)
         )
         await connection.commit()
+    await db.reconcile_relation_graph(repair=True)
     
     students = await db.get_curator_students(10)
     
@@ -353,6 +353,7 @@ async def test_get_all_student_reports_for_curator_returns_reports(db):
     await db.add_curator_student_relation(10, 2)
     
     await db.save_report(1, "stage1", "plan1", "problem1", plans_completed=True)
+    await move_reports_to_previous_week(db, 1)
     await db.save_report(1, "stage2", "plan2", "problem2", plans_completed=False, plans_failure_reason="reason")
     await db.save_report(2, "stage3", "plan3", "problem3")
     
@@ -418,3 +419,631 @@ async def test_get_all_student_reports_for_curator_includes_read_status(db):
     assert len(reports) == 1
     assert reports[0]["is_read_by_curator"] is True
 
+
+
+@pytest.mark.asyncio
+async def test_database_reuses_connection_between_calls(db):
+    async with db._connection() as first:
+        pass
+    await db.add_user(1, username="student", user_type="student")
+    await db.get_user_profile(1)
+    async with db._connection() as second:
+        pass
+
+    pool_connections = db._connections._connections
+    assert len(pool_connections) == db.read_pool_size
+    assert first in pool_connections
+    assert second in pool_connections
+
+
+@pytest.mark.asyncio
+async def test_database_reopens_connection_after_close(db):
+    await db.add_user(1, username="student", user_type="student")
+    await db.close()
+
+    profile = await db.get_user_profile(1)
+
+    assert profile["username"] == "student"
+
+
+@pytest.mark.asyncio
+async def test_init_db_applies_sqlite_performance_profile(db):
+    async with db._connection() as connection:
+        results = {}
+        for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store"):
+            cursor = await connection.execute(f"pragma {name}")
+            results[name] = (await cursor.fetchone())[0]
+
+    assert results["journal_mode"] == "wal"
+    assert results["synchronous"] == 1
+    assert results["busy_timeout"] == 5000
+    assert results["temp_store"] == 2
+
+
+def test_database_rejects_invalid_sqlite_profile(monkeypatch):
+    import config
+    from database import Database
+
+    monkeypatch.setattr(config, "SQLITE_SYNCHRONOUS", "fast")
+
+    with pytest.raises(ValueError):
+        Database()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writers_do_not_hit_database_locked(db):
+    from database import Database
+
+    other = Database()
+    other.db_path = db.db_path
+    await other.init_db()
+    try:
+        await db.add_user(10, username="curator", user_type="curator")
+        for student_id in range(1, 21):
+            await db.add_user(student_id, username=f"student{student_id}")
+            await db.add_curator_student_relation(10, student_id)
+        for student_id in range(1, 21):
+            await db.save_report(student_id, "stage", "plan", "problem")
+        await move_reports_to_previous_week(db)
+        initial = await db.get_unread_reports_for_curator(10)
+
+        writes = []
+        for index, report in enumerate(initial):
+            writer = db if index % 2 else other
+            writes.append(writer.mark_report_as_read(report["id"], 10))
+            writes.append(writer.save_report(report["user_id"], "stage", "plan", "problem"))
+        await asyncio.gather(*writes)
+
+        unread = await db.get_unread_reports_for_curator(10)
+        assert len(unread) == 20
+        assert not {report["id"] for report in unread} & {report["id"] for report in initial}
+    finally:
+        await other.close()
+
+
+@pytest.mark.asyncio
+async def test_init_db_records_schema_version(db):
+    from migrations import MIGRATIONS
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        cursor = await connection.execute("select max(version) from schema_version")
+        row = await cursor.fetchone()
+
+    assert row[0] == max(migration.version for migration in MIGRATIONS)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_init_db_applies_each_migration_once(tmp_path):
+    from database import Database
+    from migrations import MIGRATIONS
+
+    # Бот и worker стартуют одновременно с пустой базой
+    databases = []
+    for _ in range(2):
+        database = Database()
+        database.db_path = str(tmp_path / "shared.db")
+        databases.append(database)
+    try:
+        await asyncio.gather(*(database.init_db() for database in databases))
+    finally:
+        for database in databases:
+            await database.close()
+
+    async with aiosqlite.connect(str(tmp_path / "shared.db")) as connection:
+        cursor = await connection.execute("select version from schema_version order by version")
+        versions = [row[0] for row in await cursor.fetchall()]
+    assert versions == sorted(migration.version for migration in MIGRATIONS)
+
+
+@pytest.mark.asyncio
+async def test_init_db_is_idempotent(db):
+    await db.add_user(1, username="student")
+
+    await db.init_db()
+
+    assert (await db.get_user_profile(1))["username"] == "student"
+
+
+async def _capture_statements(db, calls):
+    statements = []
+    connections = [*db._connections._connections, db._writer._connection]
+    for connection in connections:
+        await connection.set_trace_callback(statements.append)
+    try:
+        for call in calls:
+            await call()
+    finally:
+        for connection in connections:
+            await connection.set_trace_callback(None)
+    return [
+        statement for statement in statements
+        if statement.lstrip().lower().startswith(("select", "update", "delete", "with"))
+    ]
+
+
+@pytest.mark.asyncio
+async def test_every_database_query_uses_an_index(db):
+    await db.add_user(10, username="curator", first_name="Cur", last_name="Ator", user_type="curator")
+    await db.add_user(1, username="student", first_name="Stu", last_name="Dent")
+    await db.add_curator_student_relation(10, 1)
+    await db.save_report(1, "stage", "plan", "problem")
+    report_id = (await db.get_unread_reports_for_curator(10))[0]["id"]
+
+    statements = await _capture_statements(db, [
+        lambda: db.get_user_profile(1),
+        lambda: db.get_all_active_users(),
+        lambda: db.get_user_reports(1),
+        lambda: db.get_last_report_date(1),
+        lambda: db.get_reports_for_current_week(1),
+        lambda: db.get_weekly_reminder_recipients(),
+        lambda: db.get_week_status(1),
+        lambda: db.get_students_missing_weekly_reports(),
+        lambda: db.get_last_stage_choice(1),
+        lambda: db.has_previous_reports(1),
+        lambda: db.get_curator_students(10),
+        lambda: db.get_student_curator(1),
+        lambda: db.get_unread_reports_for_curator(10),
+        lambda: db.mark_report_as_read(report_id, 10),
+        lambda: db.get_report_by_id(report_id),
+        lambda: db.get_all_student_reports_for_curator(10, 1),
+        lambda: db.get_all_students_with_curators(),
+        lambda: db.get_user_type(1),
+        lambda: db.get_all_curators(),
+        lambda: db.get_curator_stats(10),
+        lambda: db.get_all_curator_stats(),
+        lambda: db.get_system_counters(),
+        lambda: db.get_students_without_curators(),
+        lambda: db.deactivate_curator(10),
+        lambda: db.activate_curator(10),
+        lambda: db.remove_curator_student_relation(10, 1),
+        lambda: db.claim_outbox_batch(10),
+        lambda: db.reset_stale_outbox(),
+        lambda: db.claim_outbox_batch(10, ("new_report", "report_read")),
+        lambda: db.reset_stale_outbox(("new_report", "report_read"), exclude=True),
+        lambda: db.get_outbox_counts(),
+        lambda: db.get_weekly_reminder_audience(),
+        lambda: db.get_digest_settings(10),
+        lambda: db.get_pending_digest_events(),
+        lambda: db.get_report_context(1),
+        lambda: db.finish_job_run("weekly", "2024-01-01 10:00", "ok", datetime.now(), items=1),
+        lambda: db.get_latest_job_runs(),
+        lambda: db.get_lease("scheduler"),
+        lambda: db.get_report_hours([1, 2]),
+        lambda: db.get_outbox_due_in(),
+        lambda: db.get_fsm_record("1:1:1::default", 0),
+        lambda: db.save_fsm_records([("1:1:1::default", "state", {"a": 1}, 1.0), ("1:2:2::default", None, {}, 1.0)]),
+        lambda: db.delete_expired_fsm_records(0),
+        lambda: db.release_lease("scheduler", "holder"),
+        lambda: db.submit_report(1, "stage", "plan", "problem", curator_payload={"text": "report"}),
+    ])
+    assert statements
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        for statement in statements:
+            cursor = await connection.execute(f"explain query plan {statement}")
+            plan = [row[3] for row in await cursor.fetchall()]
+            full_scans = [
+                step for step in plan
+                if step.startswith("SCAN") and "INDEX" not in step and step != "SCAN CONSTANT ROW"
+            ]
+            assert not full_scans, f"{statement.strip()} -> {plan}"
+
+
+@pytest.mark.asyncio
+async def test_get_report_hours_counts_reports_by_local_hour(db):
+    from digests import utc_to_local
+
+    await db.add_user(1, username="student")
+    await db.add_user(2, username="no_reports")
+    created = ["2024-01-01 08:15:00", "2024-01-08 08:40:00", "2024-01-15 17:05:00"]
+    for _ in created:
+        await db.save_report(1, "stage", "plan", "problem")
+        await move_reports_to_previous_week(db, 1)
+    async with aiosqlite.connect(db.db_path) as connection:
+        cursor = await connection.execute("select id from reports order by id")
+        for (report_id,), value in zip(await cursor.fetchall(), created):
+            await connection.execute("update reports set created_at = ? where id = ?", (value, report_id))
+        await connection.commit()
+
+    hours = await db.get_report_hours([1, 2])
+
+    morning, evening = (utc_to_local(value).hour for value in created[1:])
+    assert hours == {1: {morning: 2, evening: 1}}
+    assert await db.get_report_hours([]) == {}
+
+
+@pytest.mark.asyncio
+async def test_get_weekly_reminder_recipients_returns_students_without_current_report(db):
+    await db.add_user(1, username="reported")
+    await db.add_user(2, username="old_report")
+    await db.add_user(3, username="no_reports")
+    await db.add_user(4, username="inactive")
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.save_report(1, "stage", "plan", "problem")
+    await db.save_report(2, "stage", "plan", "problem")
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        past_date = datetime.now() - timedelta(days=14)
+        await connection.execute(
+            "update reports set created_at = ? where user_id = ?",
+            (past_date.strftime("%Y-%m-%d %H:%M:%S"), 2),
+        )
+        await connection.execute("update users set is_active = false where user_id = ?", (4,))
+        await connection.commit()
+    await db.check_week_status_consistency(repair=True)
+
+    recipients = await db.get_weekly_reminder_recipients()
+
+    assert recipients == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_get_all_curator_stats_matches_per_curator_stats(db):
+    await db.add_user(10, username="curator1", first_name="A", last_name="One", user_type="curator")
+    await db.add_user(20, username="curator2", first_name="B", last_name="Two", user_type="curator")
+    await db.add_user(30, username="curator3", first_name="C", last_name="Three", user_type="curator")
+    for student_id in (1, 2, 3):
+        await db.add_user(student_id, username=f"student{student_id}")
+    await db.add_curator_student_relation(10, 1)
+    await db.add_curator_student_relation(10, 2)
+    await db.add_curator_student_relation(20, 3)
+    await db.save_report(1, "stage", "plan", "problem")
+    await move_reports_to_previous_week(db, 1)
+    await db.save_report(1, "stage", "plan", "problem")
+    await db.save_report(3, "stage", "plan", "problem")
+    report_id = (await db.get_unread_reports_for_curator(20))[0]["id"]
+    await db.mark_report_as_read(report_id, 20)
+
+    all_stats = await db.get_all_curator_stats()
+
+    assert [curator["user_id"] for curator in all_stats] == [10, 20, 30]
+    for curator in all_stats:
+        expected = await db.get_curator_stats(curator["user_id"])
+        assert {key: curator[key] for key in expected} == expected
+
+
+@pytest.mark.asyncio
+async def test_get_system_counters_counts_each_student_once(db):
+    await db.add_user(10, username="curator1", user_type="curator")
+    await db.add_user(20, username="curator2", user_type="curator")
+    await db.add_user(1, username="student1")
+    await db.add_user(2, username="student2")
+    await db.add_curator_student_relation(10, 1)
+    await db.add_curator_student_relation(20, 1)
+    await db.save_report(1, "stage", "plan", "problem")
+
+    counters = await db.get_system_counters()
+
+    assert counters == {
+        "total_curators": 2,
+        "total_students": 2,
+        "students_with_curators": 1,
+        "students_without_curators": 1,
+        "total_reports": 1,
+        "unread_reports": 1,
+        "unreachable_users": 0,
+        "avoided_sends": 0,
+        "delivered_messages": 0,
+        "failed_messages": 0,
+        "delivery_attempts": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_save_report_allows_one_report_per_week(db):
+    from database import WeekAlreadySubmitted
+
+    await db.add_user(1, username="student")
+
+    first_id = await db.save_report(1, "stage1", "plan1", "problem1")
+    with pytest.raises(WeekAlreadySubmitted):
+        await db.save_report(1, "stage2", "plan2", "problem2")
+
+    status = await db.get_week_status(1)
+    assert status["report_id"] == first_id
+    # Второй отчет откатывается вместе с неудавшейся записью в журнал недель
+    assert [report["current_stage"] for report in await db.get_user_reports(1)] == ["stage1"]
+    async with aiosqlite.connect(db.db_path) as connection:
+        cursor = await connection.execute("select count(*) from student_week_status where user_id = ?", (1,))
+        assert (await cursor.fetchone())[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_submit_report_twice_in_one_week_keeps_first(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+
+    # Две сессии /report, начатые до первой отправки, приходят почти одновременно
+    first, second = await asyncio.gather(
+        db.submit_report(1, "stage1", "plan", "problem", curator_payload={"text": "first"}),
+        db.submit_report(1, "stage2", "plan", "problem", curator_payload={"text": "second"}),
+    )
+
+    assert first["already_submitted"] is False
+    assert second == {"report_id": None, "curator_id": None, "buffered": False, "already_submitted": True}
+    assert len(await db.get_user_reports(1)) == 1
+    assert [item["payload"]["text"] for item in await db.claim_outbox_batch(10)] == ["first"]
+
+
+@pytest.mark.asyncio
+async def test_get_week_status_returns_none_without_report(db):
+    await db.add_user(1, username="student")
+
+    assert await db.get_week_status(1) is None
+
+
+@pytest.mark.asyncio
+async def test_week_status_migration_backfills_existing_reports(tmp_path):
+    from migrations import MIGRATIONS, apply_migrations
+
+    db_path = tmp_path / "legacy.db"
+    async with aiosqlite.connect(db_path) as connection:
+        await apply_migrations(connection, [m for m in MIGRATIONS if m.version < 3])
+        await connection.executemany(
+            "insert into reports (user_id, current_stage, plans, problems, created_at) values (?, 's', 'p', 'q', ?)",
+            [
+                (1, "2025-11-03 09:00:00"),
+                (1, "2025-11-05 09:00:00"),
+                (1, "2025-11-10 12:00:00"),
+                (2, "2025-11-09 23:00:00"),
+            ],
+        )
+        await connection.commit()
+
+        await apply_migrations(connection)
+
+        cursor = await connection.execute(
+            "select user_id, week_start, submitted_at from student_week_status order by user_id, week_start"
+        )
+        rows = await cursor.fetchall()
+
+    assert rows == [
+        (1, "2025-11-03", "2025-11-03 09:00:00"),
+        (1, "2025-11-10", "2025-11-10 12:00:00"),
+        (2, "2025-11-03", "2025-11-09 23:00:00"),
+    ]
+
+
+@pytest.fixture
+def moscow_time(monkeypatch):
+    import time
+
+    # SQLite 'localtime' берет часовой пояс процесса из TZ
+    monkeypatch.setenv("TZ", "Europe/Moscow")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.asyncio
+async def test_week_ledger_uses_local_week_boundaries(db, moscow_time):
+    await db.add_user(1, username="student")
+    # Воскресенье 22:30 UTC — уже понедельник 01:30 по Москве
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute(
+            "insert into reports (user_id, current_stage, plans, problems, created_at) "
+            "values (1, 's', 'p', 'q', '2024-01-07 22:30:00')"
+        )
+        await connection.commit()
+
+    drift = await db.check_week_status_consistency(repair=True)
+
+    assert [record["week_start"] for record in drift["missing"]] == ["2024-01-08"]
+    assert await db.get_week_status(1, datetime(2024, 1, 8)) is not None
+    assert await db.get_week_status(1, datetime(2024, 1, 1)) is None
+
+
+@pytest.mark.asyncio
+async def test_check_week_status_consistency_reports_and_repairs_drift(db):
+    await db.add_user(1, username="student")
+    await db.add_user(2, username="student2")
+    await db.save_report(1, "stage", "plan", "problem")
+    await db.save_report(2, "stage", "plan", "problem")
+    assert await db.check_week_status_consistency() == {"missing": [], "stale": []}
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute("delete from student_week_status where user_id = ?", (1,))
+        await connection.execute("update student_week_status set week_start = '2000-01-03' where user_id = ?", (2,))
+        await connection.commit()
+
+    drift = await db.check_week_status_consistency(repair=True)
+
+    assert {record["user_id"] for record in drift["missing"]} == {1, 2}
+    assert [record["user_id"] for record in drift["stale"]] == [2]
+    assert await db.check_week_status_consistency() == {"missing": [], "stale": []}
+    assert await db.get_week_status(1) is not None
+
+
+@pytest.mark.asyncio
+async def test_read_connections_reject_writes(db):
+    async with db._connection() as connection:
+        with pytest.raises(aiosqlite.OperationalError):
+            await connection.execute("insert into users (user_id) values (1)")
+
+
+@pytest.mark.asyncio
+async def test_reads_run_in_parallel_with_writer(db):
+    for user_id in range(1, 7):
+        await db.add_user(user_id, username=f"student{user_id}")
+    await db.save_report(1, "stage", "plan", "problem")
+
+    results = await asyncio.gather(
+        *(db.get_user_reports(1) for _ in range(20)),
+        *(db.save_report(user_id, "stage", "plan", "problem") for user_id in range(2, 7)),
+    )
+
+    assert all(len(reports) >= 1 for reports in results[:20])
+    metrics = db.read_pool_metrics()
+    assert metrics["checkouts"] >= 20
+    assert metrics["checkout_failures"] == 0
+    assert metrics["in_use"] == 0
+
+
+async def test_user_type_and_profile_are_served_from_cache(db):
+    await db.add_user(user_id=1, username="user", first_name="A", user_type="curator")
+
+    assert await db.get_user_type(1) == "curator"
+    profile = await db.get_user_profile(1)
+    profile["username"] = "changed"
+    misses = db.cache_stats()["misses"]
+
+    assert await db.get_user_type(1) == "curator"
+    assert (await db.get_user_profile(1))["username"] == "user"
+    stats = db.cache_stats()
+    assert stats["misses"] == misses
+    assert stats["hits"] >= 2
+
+
+async def test_user_cache_is_invalidated_on_writes(db):
+    await db.add_user(user_id=1, username="old", user_type="curator")
+    assert (await db.get_user_profile(1))["username"] == "old"
+
+    await db.add_user(user_id=1, username="new", user_type="student")
+
+    assert (await db.get_user_profile(1))["username"] == "new"
+    assert await db.get_user_type(1) == "student"
+
+
+async def test_is_admin_follows_env_changes(db, monkeypatch):
+    monkeypatch.setenv("ADMIN_ID", "1")
+    assert await db.is_admin(1)
+
+    monkeypatch.setenv("ADMIN_ID", "2")
+    assert not await db.is_admin(1)
+    assert await db.is_admin(2)
+
+
+@pytest.mark.asyncio
+async def test_relation_graph_follows_writes_without_queries(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.assign_student_to_curator(1, 10)
+    await db.get_user_profile(1)
+    await db.get_user_profile(10)
+
+    statements = await _capture_statements(db, [
+        lambda: db.get_student_curator(1),
+        lambda: db.get_curator_students(10),
+    ])
+    assert statements == []
+    assert (await db.get_student_curator(1))["user_id"] == 10
+
+    await db.deactivate_curator(10)
+    assert await db.get_student_curator(1) is None
+    await db.activate_curator(10)
+    await db.remove_curator_student_relation(10, 1)
+    assert await db.get_curator_students(10) == []
+    assert await db.reconcile_relation_graph() == {'missing': [], 'stale': [], 'activity': []}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_relation_graph_reports_and_repairs_drift(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute("delete from curator_student_relations")
+        await connection.execute(
+            "insert into curator_student_relations (curator_id, student_id) values (10, 2)"
+        )
+        await connection.commit()
+
+    drift = await db.reconcile_relation_graph(repair=True)
+
+    assert drift == {'missing': [(10, 2)], 'stale': [(10, 1)], 'activity': []}
+    assert db.relations.students_of(10) == [2]
+    assert await db.reconcile_relation_graph() == {'missing': [], 'stale': [], 'activity': []}
+
+
+@pytest.mark.asyncio
+async def test_relation_reconciliation_loop_repairs_graph_periodically(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_curator_student_relation(10, 1)
+
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute("delete from curator_student_relations")
+        await connection.commit()
+
+    task = asyncio.create_task(db.run_relation_reconciliation(0.01))
+    try:
+        for _ in range(100):
+            if not db.relations.students_of(10):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert db.relations.students_of(10) == []
+
+
+@pytest.mark.asyncio
+async def test_mark_report_as_read_rejects_foreign_curator(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(11, username="other", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+    report_id = await db.save_report(1, "stage", "plan", "problem")
+
+    assert await db.mark_report_as_read(report_id, 11) is None
+    assert len(await db.get_unread_reports_for_curator(10)) == 1
+
+    await db.mark_report_as_read(report_id, 10)
+    assert await db.get_unread_reports_for_curator(10) == []
+
+
+@pytest.mark.asyncio
+async def test_mark_report_as_read_returns_report_with_student_profile(db):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student1", first_name="Stu", last_name="Dent")
+    await db.add_curator_student_relation(10, 1)
+    report_id = await db.save_report(1, "stage", "plan", "problem")
+
+    report = await db.mark_report_as_read(report_id, 10)
+
+    assert report["id"] == report_id
+    assert report["user_id"] == 1
+    assert (report["current_stage"], report["plans"], report["problems"]) == ("stage", "plan", "problem")
+    assert (report["username"], report["first_name"], report["last_name"]) == ("student1", "Stu", "Dent")
+    assert await db.mark_report_as_read(report_id + 1, 10) is None
+
+
+@pytest.mark.asyncio
+async def test_job_run_slot_is_claimed_once_after_success(db):
+    started = datetime(2024, 1, 1, 10, 0)
+
+    assert await db.claim_job_run("weekly", "2024-01-01 10:00", started)
+    # Незавершенный запуск (процесс упал) можно занять снова
+    assert await db.claim_job_run("weekly", "2024-01-01 10:00", started)
+    await db.finish_job_run("weekly", "2024-01-01 10:00", "ok", started + timedelta(seconds=3), items=5)
+
+    assert not await db.claim_job_run("weekly", "2024-01-01 10:00", started)
+    assert await db.claim_job_run("weekly", "2024-01-08 10:00", started + timedelta(days=7))
+    runs = await db.get_latest_job_runs()
+    assert runs["weekly"]["slot"] == "2024-01-08 10:00"
+    assert runs["weekly"]["status"] == "running"
+
+
+@pytest.mark.asyncio
+async def test_unreachable_users_are_excluded_until_start(db):
+    await db.add_user(1, username="student1")
+    await db.add_user(2, username="student2")
+
+    assert await db.mark_user_unreachable(2, "Forbidden: bot was blocked by the user")
+    assert not await db.mark_user_unreachable(2, "again")
+
+    assert await db.get_weekly_reminder_recipients() == [1]
+    assert [user["user_id"] for user in await db.get_all_active_users()] == [1]
+    assert await db.get_weekly_reminder_audience() == ([1], 1)
+
+    await db.increment_counter("avoided_sends", 1)
+    await db.increment_counter("avoided_sends", 2)
+    counters = await db.get_system_counters()
+    assert counters["unreachable_users"] == 1
+    assert counters["avoided_sends"] == 3
+
+    await db.add_user(2, username="student2")
+    assert await db.get_weekly_reminder_recipients() == [1, 2]
@@ -0,0 +1,154 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+from db_connections import (
+    ConnectionManager,
+    ConnectionPoolTimeout,
+    DatabaseWriter,
+    build_pragmas,
+    build_writer_settings,
+)
+
+
+@pytest.fixture
+def pragmas():
+    return build_pragmas(
+        journal_mode="wal",
+        synchronous="normal",
+        busy_timeout_ms=5000,
+        mmap_size=0,
+        cache_size_kb=2048,
+        temp_store="memory",
+    )
+
+
+@pytest.fixture
+async def writer(tmp_path, pragmas):
+    db_path = str(tmp_path / "writer.db")
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.execute("create table items (id integer primary key, value text unique)")
+        await connection.commit()
+    writer = DatabaseWriter(db_path, pragmas=pragmas, batch_window=0.01, max_batch=20)
+    yield writer
+    await writer.stop()
+
+
+def insert(value):
+    async def operation(db):
+        cursor = await db.execute("insert into items (value) values (?)", (value,))
+        return cursor.lastrowid
+    return operation
+
+
+async def count_items(db_path):
+    async with aiosqlite.connect(db_path) as connection:
+        cursor = await connection.execute("select count(*) from items")
+        return (await cursor.fetchone())[0]
+
+
+def test_build_pragmas_rejects_unknown_journal_mode():
+    with pytest.raises(ValueError):
+        build_pragmas("fast", "normal", 1000, 0, 1024, "memory")
+
+
+def test_build_writer_settings_rejects_empty_batch():
+    with pytest.raises(ValueError):
+        build_writer_settings(5, 0)
+
+
+@pytest.mark.asyncio
+async def test_connection_manager_opens_once_for_concurrent_callers(tmp_path, pragmas):
+    manager = ConnectionManager(str(tmp_path / "pool.db"), size=2, pragmas=pragmas)
+
+    async def use():
+        async with manager.acquire() as connection:
+            await connection.execute("select 1")
+
+    await asyncio.gather(*(use() for _ in range(10)))
+
+    assert len(manager._connections) == 2
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_writer_groups_concurrent_writes_into_batches(writer):
+    ids = await asyncio.gather(*(writer.submit(insert(f"value{i}")) for i in range(100)))
+
+    assert len(set(ids)) == 100
+    assert writer.committed_writes == 100
+    assert writer.committed_batches <= 10
+    assert await count_items(writer.db_path) == 100
+
+
+@pytest.mark.asyncio
+async def test_writer_isolates_failing_operation_within_batch(writer):
+    results = await asyncio.gather(
+        writer.submit(insert("first")),
+        writer.submit(insert("first")),
+        writer.submit(insert("second")),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[1], aiosqlite.IntegrityError)
+    assert not isinstance(results[0], Exception)
+    assert not isinstance(results[2], Exception)
+    assert await count_items(writer.db_path) == 2
+
+
+@pytest.mark.asyncio
+async def test_writer_result_is_visible_to_other_connections_once_resolved(writer):
+    await writer.submit(insert("visible"))
+
+    assert await count_items(writer.db_path) == 1
+
+
+@pytest.mark.asyncio
+async def test_writer_stop_commits_accepted_writes(writer):
+    pending = [asyncio.create_task(writer.submit(insert(f"value{i}"))) for i in range(30)]
+    await asyncio.sleep(0)
+
+    await writer.stop()
+
+    await asyncio.gather(*pending)
+    assert await count_items(writer.db_path) == 30
+
+
+@pytest.mark.asyncio
+async def test_connection_manager_times_out_and_counts_failures(tmp_path, pragmas):
+    manager = ConnectionManager(str(tmp_path / "pool.db"), size=1, pragmas=pragmas, checkout_timeout=0.05)
+
+    async with manager.acquire():
+        with pytest.raises(ConnectionPoolTimeout):
+            async with manager.acquire():
+                pass
+
+    metrics = manager.metrics()
+    assert metrics["checkout_failures"] == 1
+    assert metrics["checkouts"] == 1
+    assert metrics["in_use"] == 0
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_manager_serves_waiters_in_arrival_order(tmp_path, pragmas):
+    manager = ConnectionManager(str(tmp_path / "pool.db"), size=1, pragmas=pragmas)
+    order = []
+
+    async def use(name):
+        async with manager.acquire():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async with manager.acquire():
+        tasks = [asyncio.create_task(use(name)) for name in ("first", "second", "third")]
+        await asyncio.sleep(0.01)
+        assert manager.metrics()["utilization"] == 1.0
+        assert manager.metrics()["waiting"] == 3
+
+    await asyncio.gather(*tasks)
+
+    assert order == ["first", "second", "third"]
+    assert manager.metrics()["max_wait_ms"] > 0
+    await manager.close()
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from digests import build_digest_messages, digest_due_at
+
+
+def event(event_id, name="Stu", stage="stage"):
+    return {
+        "event_id": event_id,
+        "report_id": 100 + event_id,
+        "student_id": event_id,
+        "username": None,
+        "first_name": name,
+        "last_name": "Dent",
+        "current_stage": stage,
+        "report_created_at": "2024-01-01 10:00:00",
+    }
+
+
+def test_digest_due_at_for_each_mode():
+    oldest = datetime(2024, 1, 1, 12, 30)
+
+    assert digest_due_at("immediate", None, oldest, 18) == oldest
+    assert digest_due_at("interval", 30, oldest, 18) == datetime(2024, 1, 1, 13, 0)
+    assert digest_due_at("daily", None, oldest, 18) == datetime(2024, 1, 1, 18, 0)
+    assert digest_due_at("daily", None, datetime(2024, 1, 1, 19, 0), 18) == datetime(2024, 1, 2, 18, 0)
+
+
+def test_build_digest_messages_chunks_reports_with_read_buttons():
+    messages = build_digest_messages([event(i) for i in range(1, 6)], chunk_size=2)
+
+    assert [first_event for first_event, _, _ in messages] == [1, 3, 5]
+    first_text = messages[0][1]
+    assert "Новые отчеты: 5" in first_text
+    assert "часть 1 из 3" in first_text
+    buttons = [row[0] for _, _, markup in messages for row in markup["inline_keyboard"]]
+    assert [button["callback_data"] for button in buttons] == [f"read:{100 + i}" for i in range(1, 6)]
+    assert buttons[0]["text"] == "✅ 1. Stu Dent"
+
+
+def test_build_digest_messages_truncates_long_stage():
+    _, text, _ = build_digest_messages([event(1, stage="x" * 500)], chunk_size=10)[0]
+
+    assert "часть" not in text
+    assert "x" * 100 + "…" in text
+    assert "x" * 101 not in text
@@ -0,0 +1,137 @@
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+from states import ReportStates
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_storage(db, clock=None, **kwargs):
+    return SQLiteStorage(db, clock=clock or FakeClock(), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_state_and_data_survive_restart(db):
+    clock = FakeClock()
+    storage = make_storage(db, clock)
+    await storage.set_state(KEY, ReportStates.waiting_for_plans)
+    await storage.update_data(KEY, {"current_stage": "Этап 1", "report_context": {"curator_id": 5}})
+    assert await storage.flush() == 1
+
+    restarted = make_storage(db, clock)
+    assert await restarted.get_state(KEY) == ReportStates.waiting_for_plans.state
+    assert await restarted.get_data(KEY) == {"current_stage": "Этап 1", "report_context": {"curator_id": 5}}
+    other = StorageKey(bot_id=1, chat_id=11, user_id=11)
+    assert await restarted.get_state(other) is None
+    assert await restarted.get_data(other) == {}
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_until_flush(db):
+    clock = FakeClock()
+    storage = make_storage(db, clock)
+    for user_id in range(5):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        await storage.set_state(key, "state")
+        await storage.set_data(key, {"n": user_id})
+        assert await storage.get_data(key) == {"n": user_id}
+
+    reader = make_storage(db, clock)
+    assert await reader.get_state(StorageKey(bot_id=1, chat_id=3, user_id=3)) is None
+
+    # Пять сессий, каждая изменена дважды, — одна запись в базу
+    assert await storage.flush() == 5
+    assert await storage.flush() == 0
+    assert await make_storage(db, clock).get_data(StorageKey(bot_id=1, chat_id=3, user_id=3)) == {"n": 3}
+
+
+@pytest.mark.asyncio
+async def test_returned_data_is_a_copy(db):
+    storage = make_storage(db)
+    data = {"items": 1}
+    await storage.set_data(KEY, data)
+    data["items"] = 2
+    fetched = await storage.get_data(KEY)
+    fetched["items"] = 3
+
+    assert await storage.get_data(KEY) == {"items": 1}
+
+
+@pytest.mark.asyncio
+async def test_cleared_session_is_deleted(db):
+    clock = FakeClock()
+    storage = make_storage(db, clock)
+    await storage.set_state(KEY, "state")
+    await storage.set_data(KEY, {"a": 1})
+    await storage.flush()
+
+    clock.now += 1
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    await storage.flush()
+
+    assert await db.get_fsm_record(storage._key(KEY), 0) is None
+
+
+@pytest.mark.asyncio
+async def test_abandoned_sessions_expire(db):
+    clock = FakeClock()
+    storage = make_storage(db, clock, session_ttl=100, cache_ttl=10)
+    await storage.set_state(KEY, "state")
+    await storage.flush()
+
+    clock.now += 150
+    assert await storage.get_state(KEY) is None
+    assert await storage.expire() == 1
+    assert await db.get_fsm_record(storage._key(KEY), 0) is None
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_is_bounded(db):
+    storage = make_storage(db, cache_size=2)
+    for user_id in range(5):
+        await storage.set_state(StorageKey(bot_id=1, chat_id=user_id, user_id=user_id), "state")
+    await storage.flush()
+
+    assert len(storage.cache) == 2
+    assert await storage.get_state(StorageKey(bot_id=1, chat_id=0, user_id=0)) == "state"
+
+
+@pytest.mark.asyncio
+async def test_older_write_from_another_process_does_not_win(db):
+    clock = FakeClock()
+    first, second = make_storage(db, clock), make_storage(db, clock)
+    await first.set_state(KEY, "old")
+    clock.now += 1
+    await second.set_state(KEY, "new")
+
+    await second.flush()
+    await first.flush()
+
+    assert await make_storage(db, clock).get_state(KEY) == "new"
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_changes(db, monkeypatch):
+    storage = make_storage(db)
+    await storage.set_state(KEY, "state")
+
+    async def failing(records):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(db, "save_fsm_records", failing)
+    with pytest.raises(RuntimeError):
+        await storage.flush()
+    monkeypatch.undo()
+
+    assert await storage.flush() == 1
+    assert (await db.get_fsm_record(storage._key(KEY), 0))["state"] == "state"
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cron import CronSchedule, IntervalSchedule
+from leader import LeaderLease
+from scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_lease(db, holder, clock, ttl=30.0, renew_interval=10.0):
+    return LeaderLease(db, holder=holder, ttl=ttl, renew_interval=renew_interval, clock=clock)
+
+
+@pytest.mark.asyncio
+async def test_only_one_replica_holds_the_lease(db):
+    clock = Clock()
+    first = make_lease(db, "first", clock)
+    second = make_lease(db, "second", clock)
+
+    assert await first.try_acquire()
+    assert not await second.try_acquire()
+
+    clock.now += 20
+    assert await first.try_acquire()
+    assert not await second.try_acquire()
+    lease = await db.get_lease("scheduler")
+    assert (lease["holder"], lease["expires_at"], lease["heartbeat_at"]) == ("first", 1050.0, 1020.0)
+
+
+@pytest.mark.asyncio
+async def test_standby_takes_over_after_leader_stops_renewing(db):
+    clock = Clock()
+    first = make_lease(db, "first", clock)
+    second = make_lease(db, "second", clock)
+    await first.try_acquire()
+
+    # Лидер перестал продлевать аренду: ровно до истечения она еще его
+    clock.now += 29
+    assert first.is_leader
+    assert not await second.try_acquire()
+    clock.now += 1
+    assert not first.is_leader
+    assert await second.try_acquire()
+
+    # Вернувшийся старый лидер узнает, что аренда ушла
+    assert not await first.try_acquire()
+    assert second.is_leader
+
+
+@pytest.mark.asyncio
+async def test_release_hands_over_immediately(db):
+    clock = Clock()
+    first = make_lease(db, "first", clock)
+    second = make_lease(db, "second", clock)
+    await first.try_acquire()
+
+    await first.release()
+
+    assert not first.is_leader
+    assert await second.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_database_error_keeps_leadership_only_until_expiry(db):
+    clock = Clock()
+    lease = make_lease(db, "first", clock)
+    await lease.try_acquire()
+    lease.db = SimpleNamespace(acquire_lease=AsyncMock(side_effect=RuntimeError("disk I/O error")))
+
+    clock.now += 15
+    assert await lease.try_acquire()
+    clock.now += 15
+    assert not await lease.try_acquire()
+
+
+def test_lease_must_be_renewed_before_it_expires(db):
+    with pytest.raises(ValueError):
+        LeaderLease(db, ttl=10, renew_interval=10)
+
+
+def replica(db, holder, now, lease_clock, func):
+    lease = make_lease(db, holder, lease_clock)
+    scheduler = Scheduler(SimpleNamespace(db=db), now=lambda: now[0], lease=lease)
+    scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=3600, durable=True)
+    return scheduler, lease
+
+
+@pytest.mark.asyncio
+async def test_two_schedulers_run_a_slot_once_across_failover(db):
+    now = [datetime(2024, 1, 1, 9, 59, 50)]
+    lease_clock = Clock()
+    func = AsyncMock()
+    first, first_lease = replica(db, "first", now, lease_clock, func)
+    second, second_lease = replica(db, "second", now, lease_clock, func)
+    assert await first_lease.try_acquire()
+    assert not await second_lease.try_acquire()
+
+    now[0] = datetime(2024, 1, 1, 10, 0)
+    lease_clock.now += 10
+    await asyncio.gather(first.run_pending(), second.run_pending())
+    await asyncio.gather(first.join(), second.join())
+    func.assert_awaited_once()
+
+    # Лидер упал; резервная реплика забирает аренду и не повторяет выполненный слот
+    now[0] += timedelta(seconds=40)
+    lease_clock.now += 40
+    assert await second_lease.try_acquire()
+    await second.catch_up()
+    await second.join()
+    func.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_standby_catches_up_slot_missed_by_crashed_leader(db):
+    now = [datetime(2024, 1, 1, 9, 59, 50)]
+    lease_clock = Clock()
+    func = AsyncMock()
+    first, first_lease = replica(db, "first", now, lease_clock, func)
+    second, second_lease = replica(db, "second", now, lease_clock, func)
+    await first_lease.try_acquire()
+
+    # Лидер упал за 10 секунд до слота
+    now[0] = datetime(2024, 1, 1, 10, 0, 30)
+    lease_clock.now += 40
+    await second.run_pending()
+    func.assert_not_awaited()
+
+    assert await second_lease.try_acquire()
+    await second.catch_up()
+    await second.join()
+    func.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_replicas_fail_over_within_bound(db):
+    ttl, renew_interval = 0.2, 0.05
+    runs = {"first": 0, "second": 0}
+    tasks = {}
+    leases = {}
+
+    for holder in runs:
+        async def job(holder=holder):
+            runs[holder] += 1
+
+        lease = LeaderLease(db, holder=holder, ttl=ttl, renew_interval=renew_interval)
+        scheduler = Scheduler(SimpleNamespace(db=db), lease=lease)
+        scheduler.add_job("tick", IntervalSchedule(0.02), job, misfire_grace=60)
+        leases[holder] = lease
+        tasks[holder] = [asyncio.create_task(lease.run()), asyncio.create_task(scheduler.run())]
+
+    try:
+        for _ in range(10):
+            await asyncio.sleep(0.03)
+            assert not (leases["first"].is_leader and leases["second"].is_leader)
+        leader = "first" if leases["first"].is_leader else "second"
+        standby = "second" if leader == "first" else "first"
+        assert runs[leader] > 0 and runs[standby] == 0
+
+        # Лидер падает без освобождения аренды
+        for task in tasks[leader]:
+            task.cancel()
+        crashed_at = asyncio.get_running_loop().time()
+        while not leases[standby].is_leader:
+            await asyncio.sleep(0.01)
+        assert asyncio.get_running_loop().time() - crashed_at <= ttl + renew_interval + 0.1
+
+        await asyncio.sleep(0.1)
+        assert runs[standby] > 0
+    finally:
+        for task in [task for holder_tasks in tasks.values() for task in holder_tasks]:
+            task.cancel()
+        await asyncio.gather(*(task for holder_tasks in tasks.values() for task in holder_tasks),
+                             return_exceptions=True)
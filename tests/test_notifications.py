@@ -1,8 +1,22 @@
 import pytest
 from unittest.mock import AsyncMock
 
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+)
+from aiogram.methods import SendMessage
+
 import text_utils
+from broadcast import Broadcaster
 from notifications import NotificationService
+from retry import RetryPolicy
+
+
+def telegram_error(error_class, message, **kwargs):
+    return error_class(method=SendMessage(chat_id=1, text="text"), message=message, **kwargs)
 
 
 @pytest.fixture
@@ -13,12 +27,41 @@ def bot_mock():
 @pytest.fixture
 def db_mock():
     mock = AsyncMock()
+    # Простая очередь вместо таблицы outbox: ключи идемпотентности проверяются в test_outbox
+    queue = []
+
+    async def enqueue_notifications(notifications):
+        queue.extend(notifications)
+        return len(notifications)
+
+    async def claim_outbox_batch(limit, kinds=None, exclude=False):
+        batch = [
+            {"id": index, "kind": kind, "chat_id": chat_id, "payload": payload}
+            for index, (_, kind, chat_id, payload, *_) in enumerate(queue[:limit])
+        ]
+        del queue[:limit]
+        return batch
+
+    mock.enqueue_notifications.side_effect = enqueue_notifications
+    mock.get_digest_settings.return_value = {"mode": "immediate", "interval_minutes": None}
+    mock.get_report_hours.return_value = {}
+    mock.claim_outbox_batch.side_effect = claim_outbox_batch
     return mock
 
 
 @pytest.fixture
 def notification_service(bot_mock, db_mock):
-    return NotificationService(bot_mock, db_mock)
+    now = [0.0]
+
+    async def sleep(delay):
+        now[0] += delay
+
+    # Общие поддельные часы: пауза по RetryAfter не ждет реального времени
+    broadcaster = Broadcaster(rate=1000, chat_interval=0, workers=4, clock=lambda: now[0], sleep=sleep)
+    retry_policy = RetryPolicy(
+        max_attempts=3, random_fn=lambda: 0.0, clock=lambda: now[0], sleep=AsyncMock(side_effect=sleep)
+    )
+    return NotificationService(bot_mock, db_mock, broadcaster, retry_policy)
 
 
 def test_format_user_name_prefers_full_name(notification_service):
@@ -45,47 +88,25 @@ def test_format_user_name_uses_fallback(notification_service):
     assert result == "ID: 5"
 
 
-@pytest.mark.asyncio
-async def test_notify_curator_new_report_sends_message(notification_service, bot_mock, db_mock):
-    db_mock.get_student_curator.return_value = {"user_id": 100}
-    db_mock.get_user_profile.return_value = {
-        "first_name": "Ivan",
-        "last_name": "Ivanov",
-        "username": "ivan",
-    }
-
+def test_format_new_report_builds_curator_message(notification_service):
+    profile = {"first_name": "Ivan", "last_name": "Ivanov", "username": "ivan"}
     report = {"current_stage": "Stage", "plans": "Plan", "problems": "Problem"}
 
-    await notification_service.notify_curator_new_report(1, report)
-
-    bot_mock.send_message.assert_awaited_once_with(
-        100,
+    assert notification_service.format_new_report(profile, 1, report) == (
         "📝 *Новый отчет от Ivan Ivanov!*\n\n"
         "🎯 *Этап:* Stage\n"
         "📋 *Планы:* Plan\n"
         "❓ *Проблемы:* Problem\n\n"
-        "Используйте `/reports` для просмотра всех отчетов.",
+        "Используйте `/reports` для просмотра всех отчетов."
     )
 
 
-@pytest.mark.asyncio
-async def test_notify_curator_new_report_skips_without_curator(notification_service, bot_mock, db_mock):
-    db_mock.get_student_curator.return_value = None
-
-    await notification_service.notify_curator_new_report(1, {"current_stage": "Stage", "plans": "Plan", "problems": "Problem"})
-
-    bot_mock.send_message.assert_not_awaited()
-
-
 @pytest.mark.asyncio
 async def test_send_weekly_reminders_only_notifies_missing(notification_service, bot_mock, db_mock):
-    db_mock.get_all_active_users.return_value = [
-        {"user_id": 1},
-        {"user_id": 2},
-    ]
-    db_mock.get_reports_for_current_week.side_effect = [[{"dummy": 1}], []]
+    db_mock.get_weekly_reminder_audience.return_value = ([2], 0)
 
     await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
 
     bot_mock.send_message.assert_awaited_once_with(
         2,
@@ -126,6 +147,7 @@ async def test_send_curator_missing_reports_notifications_groups_students(notifi
     ]
 
     await notification_service.send_curator_missing_reports_notifications()
+    await notification_service.outbox.drain()
 
     bot_mock.send_message.assert_awaited_once_with(
         100,
@@ -142,21 +164,11 @@ async def test_send_curator_missing_reports_notifications_skips_when_empty(notif
     db_mock.get_students_missing_weekly_reports.return_value = []
 
     await notification_service.send_curator_missing_reports_notifications()
+    await notification_service.outbox.drain()
 
     bot_mock.send_message.assert_not_awaited()
 
 
-@pytest.mark.asyncio
-async def test_notify_curator_new_report_handles_bot_exception(notification_service, bot_mock, db_mock):
-    db_mock.get_student_curator.return_value = {"user_id": 100}
-    db_mock.get_user_profile.return_value = {"first_name": "Ivan", "last_name": "Ivanov"}
-    bot_mock.send_message.side_effect = Exception("Bot blocked")
-    
-    await notification_service.notify_curator_new_report(1, {"current_stage": "Stage", "plans": "Plan", "problems": "Problem"})
-    
-    bot_mock.send_message.assert_awaited_once()
-
-
 @pytest.mark.asyncio
 async def test_notify_student_curator_assigned_sends_correct_message(notification_service, bot_mock):
     await notification_service.notify_student_curator_assigned(123)
@@ -179,12 +191,14 @@ async def test_notify_student_curator_assigned_handles_exception(notification_se
 @pytest.mark.asyncio
 async def test_notify_student_report_read_sends_correct_message(notification_service, bot_mock):
     report_data = {
+        "id": 1,
         "current_stage": "Stage 1",
         "plans": "Some plans",
         "problems": "Some problems"
     }
     
     await notification_service.notify_student_report_read(456, report_data)
+    await notification_service.outbox.drain()
     
     bot_mock.send_message.assert_awaited_once()
     args = bot_mock.send_message.await_args
@@ -195,28 +209,30 @@ async def test_notify_student_report_read_sends_correct_message(notification_ser
 
 @pytest.mark.asyncio
 async def test_notify_student_report_read_handles_exception(notification_service, bot_mock):
-    bot_mock.send_message.side_effect = Exception("User blocked bot")
+    bot_mock.send_message.side_effect = telegram_error(TelegramForbiddenError, "Forbidden: bot was blocked by the user")
     report_data = {
+        "id": 1,
         "current_stage": "Stage 1",
         "plans": "Plans",
         "problems": "Problems"
     }
     
     await notification_service.notify_student_report_read(456, report_data)
+    await notification_service.outbox.drain()
     
     bot_mock.send_message.assert_awaited_once()
 
 
 @pytest.mark.asyncio
 async def test_send_weekly_reminders_handles_exception_for_individual_user(notification_service, bot_mock, db_mock):
-    db_mock.get_all_active_users.return_value = [
-        {"user_id": 1},
-        {"user_id": 2},
+    db_mock.get_weekly_reminder_audience.return_value = ([1, 2], 0)
+    bot_mock.send_message.side_effect = [
+        telegram_error(TelegramForbiddenError, "Forbidden: bot was blocked by the user"),
+        None,
     ]
-    db_mock.get_reports_for_current_week.return_value = []
-    bot_mock.send_message.side_effect = [Exception("First user blocked"), None]
     
     await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
     
     assert bot_mock.send_message.await_count == 2
 
@@ -235,9 +251,10 @@ async def test_send_curator_missing_reports_notifications_handles_exception(noti
             "student_last_name": "Dent",
         }
     ]
-    bot_mock.send_message.side_effect = Exception("Curator blocked bot")
+    bot_mock.send_message.side_effect = telegram_error(TelegramForbiddenError, "Forbidden: bot was blocked by the user")
 
     await notification_service.send_curator_missing_reports_notifications()
+    await notification_service.outbox.drain()
 
     bot_mock.send_message.assert_awaited_once()
 
@@ -263,28 +280,66 @@ async def test_format_user_name_handles_only_last_name(notification_service):
 
 
 @pytest.mark.asyncio
-async def test_send_weekly_reminders_retries_transient_error(notification_service, bot_mock, db_mock, monkeypatch):
-    db_mock.get_all_active_users.return_value = [
-        {"user_id": 1},
+async def test_send_weekly_reminders_retries_transient_error(notification_service, bot_mock, db_mock):
+    db_mock.get_weekly_reminder_audience.return_value = ([1], 0)
+    bot_mock.send_message.side_effect = [telegram_error(TelegramNetworkError, "Timeout"), None]
+
+    await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
+
+    assert bot_mock.send_message.await_count == 2
+    notification_service.retry_policy.sleep.assert_awaited_once_with(0.5)
+    assert notification_service.delivery_stats.outcomes == {"delivered": 1}
+
+
+@pytest.mark.asyncio
+async def test_send_weekly_reminders_waits_exactly_retry_after(notification_service, bot_mock, db_mock):
+    db_mock.get_weekly_reminder_audience.return_value = ([1], 0)
+    bot_mock.send_message.side_effect = [
+        telegram_error(TelegramRetryAfter, "Flood control exceeded", retry_after=7),
+        None,
     ]
-    db_mock.get_reports_for_current_week.return_value = []
-    bot_mock.send_message.side_effect = [Exception("Timeout"), None]
-    monkeypatch.setattr("notifications.asyncio.sleep", AsyncMock())
 
     await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
 
     assert bot_mock.send_message.await_count == 2
+    notification_service.retry_policy.sleep.assert_awaited_once_with(7)
 
 
 @pytest.mark.asyncio
-async def test_send_daily_missing_report_reminders_only_notifies_missing(notification_service, bot_mock, db_mock):
-    db_mock.get_all_active_users.return_value = [
-        {"user_id": 1},
-        {"user_id": 2},
+async def test_permanent_failure_marks_user_unreachable(notification_service, bot_mock, db_mock):
+    db_mock.get_weekly_reminder_audience.return_value = ([1, 2], 4)
+    bot_mock.send_message.side_effect = [
+        telegram_error(TelegramForbiddenError, "Forbidden: bot was blocked by the user"),
+        telegram_error(TelegramBadRequest, "Bad Request: can't parse entities"),
     ]
-    db_mock.get_reports_for_current_week.side_effect = [[], [{"dummy": 1}]]
+
+    await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
+
+    db_mock.mark_user_unreachable.assert_awaited_once_with(1, "Forbidden: bot was blocked by the user")
+    db_mock.increment_counter.assert_awaited_once_with("avoided_sends", 4)
+
+
+@pytest.mark.asyncio
+async def test_send_weekly_reminders_gives_up_after_max_attempts(notification_service, bot_mock, db_mock):
+    db_mock.get_weekly_reminder_audience.return_value = ([1], 0)
+    bot_mock.send_message.side_effect = telegram_error(TelegramNetworkError, "Timeout")
+
+    await notification_service.send_weekly_reminders()
+    await notification_service.outbox.drain()
+
+    assert bot_mock.send_message.await_count == 3
+    assert notification_service.delivery_stats.outcomes == {"exhausted": 1}
+
+
+@pytest.mark.asyncio
+async def test_send_daily_missing_report_reminders_only_notifies_missing(notification_service, bot_mock, db_mock):
+    db_mock.get_weekly_reminder_audience.return_value = ([1], 0)
 
     await notification_service.send_daily_missing_report_reminders()
+    await notification_service.outbox.drain()
 
     bot_mock.send_message.assert_awaited_once_with(
         1,
@@ -294,3 +349,102 @@ async def test_send_daily_missing_report_reminders_only_notifies_missing(notific
         ),
     )
 
+
+@pytest.mark.asyncio
+async def test_reminders_are_spread_over_window_by_report_hour(notification_service, db_mock):
+    from datetime import datetime, timedelta
+    from digests import utc_to_local
+
+    hour = (datetime.now() + timedelta(hours=1)).hour
+    db_mock.get_weekly_reminder_audience.return_value = ([1, 2], 0)
+    db_mock.get_report_hours.return_value = {1: {hour: 3}}
+    notification_service.reminder_window_minutes = 180
+
+    before = datetime.now()
+    await notification_service.send_daily_missing_report_reminders()
+
+    notifications = db_mock.enqueue_notifications.await_args.args[0]
+    send_times = {chat_id: utc_to_local(not_before) for _, _, chat_id, _, not_before in notifications}
+    assert all(before - timedelta(seconds=1) <= moment < before + timedelta(minutes=180) for moment in send_times.values())
+    assert send_times[1].hour == hour
+
+
+
+@pytest.mark.asyncio
+async def test_digest_mode_coalesces_new_report_notifications(db, bot_mock):
+    from datetime import datetime, timedelta
+    from report_submission import ReportSubmissionService
+
+    broadcaster = Broadcaster(rate=1000, chat_interval=0, workers=4)
+    service = NotificationService(bot_mock, db, broadcaster, RetryPolicy(max_attempts=1))
+    submission = ReportSubmissionService(db, service)
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.set_digest_settings(10, "interval", 30)
+    for student_id in range(1, 4):
+        await db.add_user(student_id, first_name=f"Stu{student_id}", last_name="Dent")
+        await db.add_curator_student_relation(10, student_id)
+        result = await submission.submit(student_id, {"current_stage": f"stage{student_id}", "plans": "plan"}, "problem")
+        assert result["buffered"] is True
+    await service.outbox.drain()
+    bot_mock.send_message.assert_not_awaited()
+
+    assert await service.flush_curator_digests(datetime.now()) == 0
+    assert await service.flush_curator_digests(datetime.now() + timedelta(minutes=31)) == 1
+    assert await service.flush_curator_digests(datetime.now() + timedelta(minutes=31)) == 0
+    await service.outbox.drain()
+
+    bot_mock.send_message.assert_awaited_once()
+    args, kwargs = bot_mock.send_message.await_args
+    assert args[0] == 10
+    assert "Новые отчеты: 3" in args[1]
+    assert len(kwargs["reply_markup"].inline_keyboard) == 3
+
+
+@pytest.mark.asyncio
+async def test_avoided_sends_counts_only_this_slot_recipients(db, bot_mock):
+    service = NotificationService(bot_mock, db, Broadcaster(rate=1000, chat_interval=0, workers=4),
+                                  RetryPolicy(max_attempts=1))
+    for user_id in range(1, 5):
+        await db.add_user(user_id, username=f"student{user_id}")
+    await db.mark_user_unreachable(3, "Forbidden: bot was blocked by the user")
+    await db.mark_user_unreachable(4, "Forbidden: bot was blocked by the user")
+    # Ученик 4 уже отчитался: напоминание ему не полагалось бы и без блокировки
+    await db.save_report(4, "stage", "plan", "problem")
+
+    assert await service.send_weekly_reminders() == 2
+    assert (await db.get_system_counters())["avoided_sends"] == 1
+
+    # Повторный запуск того же слота ничего не добавляет в очередь
+    assert await service.send_weekly_reminders() == 0
+    assert (await db.get_system_counters())["avoided_sends"] == 1
+
+
+@pytest.mark.asyncio
+async def test_delivery_stats_are_persisted_to_counters(db, bot_mock):
+    service = NotificationService(bot_mock, db, Broadcaster(rate=1000, chat_interval=0, workers=4),
+                                  RetryPolicy(max_attempts=1))
+    bot_mock.send_message.side_effect = [None, telegram_error(TelegramBadRequest, "Bad Request: chat not found")]
+
+    assert await service._send_with_retry(1, "hi")
+    assert not await service._send_with_retry(2, "hi")
+    await service.flush_delivery_stats()
+    # Повторная запись без новых отправок ничего не добавляет
+    await service.flush_delivery_stats()
+
+    counters = await db.get_system_counters()
+    assert (counters["delivered_messages"], counters["failed_messages"], counters["delivery_attempts"]) == (1, 1, 2)
+
+
+@pytest.mark.asyncio
+async def test_manual_curator_notification_does_not_collide_with_weekly_slot(db, bot_mock):
+    service = NotificationService(bot_mock, db, Broadcaster(rate=1000, chat_interval=0, workers=4),
+                                  RetryPolicy(max_attempts=1))
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+
+    # Ручной запуск до задачи по расписанию не глушит ее, а после — отправляет снова
+    assert await service.send_curator_missing_reports_notifications(slot="manual:1:5") == 1
+    assert await service.send_curator_missing_reports_notifications() == 1
+    assert await service.send_curator_missing_reports_notifications() == 0
+    assert await service.send_curator_missing_reports_notifications(slot="manual:1:6") == 1
@@ -0,0 +1,188 @@
+import aiosqlite
+import pytest
+
+from broadcast import Broadcaster
+from outbox import OutboxWorker
+
+
+def reminder(user_id, slot="2024-01-01"):
+    return (f"weekly_reminder:{user_id}:{slot}", "weekly_reminder", user_id, {"text": f"hi {user_id}"})
+
+
+def make_worker(db, delivered, failing=()):
+    async def deliver(chat_id, payload):
+        delivered.append((chat_id, payload["text"]))
+        return chat_id not in failing
+
+    broadcaster = Broadcaster(rate=1000, chat_interval=0, workers=4)
+    return OutboxWorker(db, deliver, broadcaster, batch_size=2)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_skips_duplicate_idempotency_keys(db):
+    assert await db.enqueue_notifications([reminder(1), reminder(2)]) == 2
+    assert await db.enqueue_notifications([reminder(1), reminder(2), reminder(3)]) == 1
+    assert await db.enqueue_notifications([]) == 0
+
+    assert await db.get_outbox_counts() == {"pending": 3}
+
+
+@pytest.mark.asyncio
+async def test_drain_delivers_in_batches_and_records_status(db):
+    await db.enqueue_notifications([reminder(user_id) for user_id in range(1, 6)])
+    delivered = []
+    worker = make_worker(db, delivered, failing={3})
+
+    assert await worker.drain() == 5
+
+    assert sorted(delivered) == [(user_id, f"hi {user_id}") for user_id in range(1, 6)]
+    assert await db.get_outbox_counts() == {"sent": 4, "failed": 1}
+    assert await worker.drain() == 0
+
+
+@pytest.mark.asyncio
+async def test_reenqueue_after_delivery_does_not_send_again(db):
+    delivered = []
+    worker = make_worker(db, delivered)
+    await db.enqueue_notifications([reminder(1)])
+    await worker.drain()
+
+    await db.enqueue_notifications([reminder(1)])
+    await worker.drain()
+
+    assert delivered == [(1, "hi 1")]
+
+
+@pytest.mark.asyncio
+async def test_claimed_rows_are_resumed_after_restart(db):
+    await db.enqueue_notifications([reminder(1), reminder(2)])
+    claimed = await db.claim_outbox_batch(10)
+    assert [item["chat_id"] for item in claimed] == [1, 2]
+    assert await db.claim_outbox_batch(10) == []
+
+    assert await db.reset_stale_outbox() == 2
+
+    delivered = []
+    await make_worker(db, delivered).drain()
+    assert sorted(delivered) == [(1, "hi 1"), (2, "hi 2")]
+    async with aiosqlite.connect(db.db_path) as connection:
+        cursor = await connection.execute("select attempts from outbox order by id")
+        assert [row[0] for row in await cursor.fetchall()] == [2, 2]
+
+
+@pytest.mark.asyncio
+async def test_kind_filter_splits_queue_between_processes(db):
+    interactive = ("new_report", "report_read")
+    await db.enqueue_notifications([
+        reminder(1),
+        ("new_report:7", "new_report", 10, {"text": "report 7"}),
+        reminder(2),
+    ])
+    bot_delivered, worker_delivered = [], []
+    bot = make_worker(db, bot_delivered)
+    bot.kinds = interactive
+    worker = make_worker(db, worker_delivered)
+    worker.kinds, worker.exclude = interactive, True
+
+    await bot.drain()
+    assert bot_delivered == [(10, "report 7")]
+
+    # После падения worker возвращает в очередь только свои уведомления
+    assert [item["chat_id"] for item in await db.claim_outbox_batch(10, interactive, exclude=True)] == [1, 2]
+    await db.enqueue_notifications([("report_read:7", "report_read", 1, {"text": "read 7"})])
+    await db.claim_outbox_batch(10, interactive)
+    assert await db.reset_stale_outbox(interactive, exclude=True) == 2
+
+    await worker.drain()
+    assert sorted(worker_delivered) == [(1, "hi 1"), (2, "hi 2")]
+    assert await db.get_outbox_counts() == {"sent": 3, "sending": 1}
+
+
+@pytest.mark.asyncio
+async def test_deferred_notifications_wait_for_their_time(db):
+    await db.enqueue_notifications([
+        reminder(1) + ("2000-01-01 00:00:00",),
+        reminder(2) + ("2999-01-01 00:00:00",),
+        reminder(3),
+    ])
+
+    delivered = []
+    await make_worker(db, delivered).drain()
+
+    assert sorted(delivered) == [(1, "hi 1"), (3, "hi 3")]
+    assert await db.get_outbox_counts() == {"sent": 2, "pending": 1}
+    assert await db.get_outbox_due_in() > 0
+    assert await db.get_outbox_due_in(("new_report",)) is None
+
+
+@pytest.mark.asyncio
+async def test_deferred_reminder_is_skipped_after_report_submitted(db):
+    await db.add_user(1, username="reported")
+    await db.add_user(2, username="silent")
+    await db.enqueue_notifications([
+        reminder(user_id) + ("2999-01-01 00:00:00",) for user_id in (1, 2)
+    ] + [("new_report:7", "new_report", 1, {"text": "report 7"})])
+
+    # Отчет пришел, пока напоминания ждали своего времени в окне рассылки
+    await db.save_report(1, "Этап 1", "планы", "нет")
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute("update outbox set not_before = '2000-01-01 00:00:00'")
+        await connection.commit()
+
+    delivered = []
+    await make_worker(db, delivered).drain()
+
+    assert sorted(delivered) == [(1, "report 7"), (2, "hi 2")]
+    assert await db.get_outbox_counts() == {"sent": 2, "skipped": 1}
+
+
+@pytest.mark.asyncio
+async def test_fresh_sending_rows_survive_second_worker_start(db):
+    await db.enqueue_notifications([reminder(1), reminder(2)])
+    # Первый worker взял пачку и еще доставляет ее
+    await db.claim_outbox_batch(1)
+    async with aiosqlite.connect(db.db_path) as connection:
+        await connection.execute(
+            "update outbox set status = 'sending', updated_at = datetime('now', '-2 hours') where chat_id = 2"
+        )
+        await connection.commit()
+
+    # Второй worker на старте возвращает в очередь только брошенную строку
+    assert await db.reset_stale_outbox(stale_after=1800) == 1
+    assert await db.get_outbox_counts() == {"sending": 1, "pending": 1}
+
+    delivered = []
+    await make_worker(db, delivered).drain()
+    assert delivered == [(2, "hi 2")]
+
+
+@pytest.mark.asyncio
+async def test_rows_of_crashed_worker_are_delivered_once_stale_after_restart(db):
+    import asyncio
+
+    await db.enqueue_notifications([reminder(1)])
+    # Процесс взял строку и упал; перезапуск происходит сразу
+    await db.claim_outbox_batch(10)
+    delivered = []
+    worker = make_worker(db, delivered)
+    worker.stale_after = 1800
+    worker.poll_interval = 0.01
+    task = asyncio.create_task(worker.run())
+    try:
+        await asyncio.sleep(0.05)
+        assert delivered == []
+        assert await db.get_outbox_counts() == {"sending": 1}
+
+        async with aiosqlite.connect(db.db_path) as connection:
+            await connection.execute("update outbox set updated_at = datetime('now', '-2 hours')")
+            await connection.commit()
+        for _ in range(100):
+            if delivered:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert delivered == [(1, "hi 1")]
+    assert await db.get_outbox_counts() == {"sent": 1}
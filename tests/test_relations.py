@@ -0,0 +1,43 @@
+from relations import RelationGraph
+
+
+def test_lookups_are_bidirectional():
+    graph = RelationGraph()
+    graph.load([(10, 1), (10, 2), (11, 2)], inactive_users=[])
+
+    assert graph.students_of(10) == [1, 2]
+    assert graph.curator_of(1) == 10
+    assert graph.curator_of(2) == 10
+    assert graph.has_relation(11, 2)
+    assert not graph.has_relation(11, 1)
+
+
+def test_remove_drops_both_directions():
+    graph = RelationGraph()
+    graph.add(10, 1)
+    graph.remove(10, 1)
+    graph.remove(10, 1)
+
+    assert graph.students_of(10) == []
+    assert graph.curator_of(1) is None
+    assert graph.relations() == set()
+
+
+def test_inactive_users_are_skipped():
+    graph = RelationGraph()
+    graph.load([(10, 1), (10, 2), (11, 1)], inactive_users=[2, 10])
+
+    assert graph.students_of(10) == [1]
+    assert graph.curator_of(1) == 11
+
+    graph.set_active(10, True)
+    assert graph.curator_of(1) == 10
+
+
+def test_diff_reports_drift():
+    graph = RelationGraph()
+    graph.load([(10, 1), (10, 2)], inactive_users=[3])
+
+    drift = graph.diff([(10, 1), (11, 1)], inactive_users=[])
+
+    assert drift == {'missing': [(11, 1)], 'stale': [(10, 2)], 'activity': [3]}
@@ -0,0 +1,58 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from reminder_windows import jitter_fraction, preferred_hour, reminder_send_time, to_utc_timestamp
+
+START = datetime(2024, 1, 1, 10, 0)
+
+
+def test_jitter_is_deterministic_and_depends_on_salt():
+    assert jitter_fraction(1, "weekly:2024-01-01") == jitter_fraction(1, "weekly:2024-01-01")
+    assert jitter_fraction(1, "weekly:2024-01-01") != jitter_fraction(1, "weekly:2024-01-08")
+    assert 0 <= jitter_fraction(1) < 1
+
+
+def test_preferred_hour_is_most_frequent_then_earliest():
+    assert preferred_hour({}) is None
+    assert preferred_hour({19: 3, 11: 5}) == 11
+    assert preferred_hour({19: 2, 11: 2}) == 11
+
+
+def test_students_without_history_spread_evenly_over_window():
+    times = [reminder_send_time(START, 120, user_id) for user_id in range(6000)]
+
+    assert all(START <= moment < START + timedelta(minutes=120) for moment in times)
+    # 12 интервалов по 10 минут: в каждом около 500 отправок, без всплеска в начале
+    buckets = Counter(int((moment - START).total_seconds() // 600) for moment in times)
+    assert len(buckets) == 12
+    assert max(buckets.values()) < 600
+    assert min(buckets.values()) > 400
+
+
+def test_student_with_history_is_reminded_in_usual_hour():
+    moment = reminder_send_time(START, 180, 7, hour=11)
+    assert datetime(2024, 1, 1, 11, 0) <= moment < datetime(2024, 1, 1, 12, 0)
+
+    # Час частично за окном: только его часть внутри окна
+    moment = reminder_send_time(START, 90, 7, hour=11)
+    assert datetime(2024, 1, 1, 11, 0) <= moment < datetime(2024, 1, 1, 11, 30)
+
+
+def test_hour_outside_window_falls_back_to_whole_window():
+    moment = reminder_send_time(START, 60, 7, hour=20)
+    assert moment == START + timedelta(minutes=60) * jitter_fraction(7)
+
+
+def test_window_crossing_midnight():
+    start = datetime(2024, 1, 1, 23, 0)
+    moment = reminder_send_time(start, 180, 7, hour=1)
+    assert datetime(2024, 1, 2, 1, 0) <= moment < datetime(2024, 1, 2, 2, 0)
+
+
+def test_zero_window_sends_immediately():
+    assert reminder_send_time(START, 0, 7, hour=11) == START
+
+
+def test_to_utc_timestamp_matches_sqlite_format():
+    moment = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+    assert to_utc_timestamp(moment) == "2024-01-01 10:00:00"
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from broadcast import Broadcaster
+from notifications import NotificationService
+from report_submission import ReportSubmissionService
+from retry import RetryPolicy
+
+
+@pytest.fixture
+def service(db):
+    notification_service = NotificationService(
+        AsyncMock(), db, Broadcaster(rate=1000, chat_interval=0, workers=4), RetryPolicy(max_attempts=1)
+    )
+    return ReportSubmissionService(db, notification_service)
+
+
+async def capture_queries(db, call):
+    statements = []
+    connections = [*db._connections._connections, db._writer._connection]
+    for connection in connections:
+        await connection.set_trace_callback(statements.append)
+    try:
+        result = await call()
+    finally:
+        for connection in connections:
+            await connection.set_trace_callback(None)
+    queries = [
+        statement for statement in statements
+        if statement.lstrip().lower().startswith(("select", "insert", "update", "delete"))
+    ]
+    return result, queries
+
+
+@pytest.mark.asyncio
+async def test_load_context_collects_everything_for_the_flow(db, service):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student", first_name="Stu", last_name="Dent")
+    await db.add_curator_student_relation(10, 1)
+
+    context = await service.load_context(1)
+    assert context == {
+        "curator_id": 10, "last_stage": None, "has_previous_reports": False, "week_submitted_at": None,
+        "username": "student", "first_name": "Stu", "last_name": "Dent",
+    }
+
+    await db.save_report(1, "stage", "plan", "problem")
+    context = await service.load_context(1)
+    assert context["last_stage"] == "stage"
+    assert context["has_previous_reports"] is True
+    assert context["week_submitted_at"] == (await db.get_week_status(1))["submitted_at"]
+    last_week = await db.get_report_context(1, datetime.now() + timedelta(days=7))
+    assert last_week["week_submitted_at"] is None
+
+    await db.deactivate_curator(10)
+    assert (await service.load_context(1))["curator_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_submit_commits_report_and_curator_notification_together(db, service):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student", first_name="Stu", last_name="Dent")
+    await db.add_curator_student_relation(10, 1)
+    context = await service.load_context(1)
+
+    result = await service.submit(1, {"current_stage": "stage", "plans": "plans", "report_context": context}, "problems")
+
+    assert result == {"report_id": result["report_id"], "curator_id": 10, "buffered": False, "already_submitted": False}
+    assert (await db.get_week_status(1))["report_id"] == result["report_id"]
+    batch = await db.claim_outbox_batch(10)
+    assert [(item["kind"], item["chat_id"]) for item in batch] == [("new_report", 10)]
+    assert "Новый отчет от Stu Dent" in batch[0]["payload"]["text"]
+
+
+@pytest.mark.asyncio
+async def test_submit_buffers_report_for_digest_curator(db, service):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+    await db.set_digest_settings(10, "daily")
+
+    result = await service.submit(1, {"current_stage": "stage", "plans": "plans"}, "problems")
+
+    assert result["buffered"] is True
+    assert await db.get_outbox_counts() == {}
+    events = await db.get_pending_digest_events()
+    assert [(event["curator_id"], event["report_id"]) for event in events] == [(10, result["report_id"])]
+
+
+@pytest.mark.asyncio
+async def test_submit_without_curator_only_saves_report(db, service):
+    await db.add_user(1, username="student")
+
+    result = await service.submit(1, {"current_stage": "stage", "plans": "plans"}, "problems")
+
+    assert result["curator_id"] is None
+    assert len(await db.get_user_reports(1)) == 1
+    assert await db.get_outbox_counts() == {}
+
+
+@pytest.mark.asyncio
+async def test_report_flow_needs_two_round_trips(db, service):
+    await db.add_user(10, username="curator", user_type="curator")
+    await db.add_user(1, username="student")
+    await db.add_curator_student_relation(10, 1)
+
+    context, start_queries = await capture_queries(db, lambda: service.load_context(1))
+    _, submit_queries = await capture_queries(db, lambda: service.submit(
+        1, {"current_stage": "stage", "plans": "plans", "report_context": context}, "problems"
+    ))
+
+    assert len(start_queries) == 1
+    # Отчет, журнал недели, выбор куратора и outbox в одной транзакции
+    assert len(submit_queries) == 4
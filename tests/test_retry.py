@@ -0,0 +1,92 @@
+import pytest
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import SendMessage
+
+from retry import (
+    FATAL,
+    RETRY_AFTER,
+    TRANSIENT,
+    DeliveryStats,
+    RetryPolicy,
+    classify_error,
+    unreachable_reason,
+)
+
+
+def telegram_error(error_class, message="error", **kwargs):
+    return error_class(method=SendMessage(chat_id=1, text="text"), message=message, **kwargs)
+
+
+def test_classify_error_uses_exception_types():
+    assert classify_error(telegram_error(TelegramRetryAfter, retry_after=3)) == RETRY_AFTER
+    assert classify_error(telegram_error(TelegramForbiddenError)) == FATAL
+    assert classify_error(telegram_error(TelegramBadRequest, "chat not found")) == FATAL
+    assert classify_error(telegram_error(TelegramNetworkError)) == TRANSIENT
+    assert classify_error(telegram_error(TelegramServerError)) == TRANSIENT
+    assert classify_error(ValueError("boom")) == FATAL
+
+
+def test_unreachable_reason_only_for_recipient_errors():
+    blocked = telegram_error(TelegramForbiddenError, "Forbidden: bot was blocked by the user")
+
+    assert unreachable_reason(blocked) == "Forbidden: bot was blocked by the user"
+    assert unreachable_reason(telegram_error(TelegramBadRequest, "Bad Request: chat not found")) is not None
+    assert unreachable_reason(telegram_error(TelegramBadRequest, "Bad Request: can't parse entities")) is None
+    assert unreachable_reason(telegram_error(TelegramNetworkError)) is None
+
+
+def test_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(base_delay=1, max_delay=10, random_fn=lambda: 1.0)
+
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [1, 2, 4, 8, 10]
+    low = RetryPolicy(base_delay=1, max_delay=10, random_fn=lambda: 0.0)
+    assert low.backoff(3) == 2
+
+
+def test_next_delay_respects_attempts_and_deadline():
+    now = [0.0]
+    policy = RetryPolicy(max_attempts=3, base_delay=1, deadline=30, random_fn=lambda: 1.0, clock=lambda: now[0])
+    network = telegram_error(TelegramNetworkError)
+
+    assert policy.next_delay(network, attempt=1, started=0) == 1
+    assert policy.next_delay(network, attempt=3, started=0) is None
+    assert policy.next_delay(telegram_error(TelegramRetryAfter, retry_after=20), attempt=1, started=0) == 20
+    now[0] = 15
+    assert policy.next_delay(telegram_error(TelegramRetryAfter, retry_after=20), attempt=1, started=0) is None
+    assert policy.next_delay(telegram_error(TelegramForbiddenError), attempt=1, started=0) is None
+
+
+def test_delivery_stats_percentiles():
+    stats = DeliveryStats()
+    for latency in range(1, 101):
+        stats.record("delivered", 1, latency / 100)
+    stats.record("fatal", 1, 0.5)
+
+    snapshot = stats.snapshot()
+
+    assert snapshot["outcomes"] == {"delivered": 100, "fatal": 1}
+    assert snapshot["attempts"] == 101
+    assert snapshot["latency_p50"] == pytest.approx(0.5)
+    assert snapshot["latency_p99"] == pytest.approx(0.99)
+    assert DeliveryStats().percentile(50) is None
+
+
+def test_delivery_stats_unflushed_returns_increments_since_last_flush():
+    stats = DeliveryStats()
+    stats.record("delivered", 1, 0.1)
+    stats.record("exhausted", 3, 2.0)
+
+    counts = stats.unflushed()
+    assert counts == {"delivered": 1, "exhausted": 1, "attempts": 4}
+    stats.mark_flushed(counts)
+    assert stats.unflushed() == {}
+
+    stats.record("delivered", 2, 0.3)
+    assert stats.unflushed() == {"delivered": 1, "attempts": 2}
+    assert stats.snapshot()["outcomes"] == {"delivered": 2, "exhausted": 1}
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from routing import (
+    PlansCallback,
+    ReadReportCallback,
+    Router,
+    StageCallback,
+    ViewReportsCallback,
+    parse_callback,
+    router_for,
+)
+from tests.utils import FakeDispatcher, FakeFSMContext, FakeMessage
+
+
+def test_parse_callback_reads_packed_data():
+    assert parse_callback(ReadReportCallback(report_id=5).pack()) == ReadReportCallback(report_id=5)
+    assert parse_callback("view_reports:7") == ViewReportsCallback(student_id=7)
+    assert parse_callback("stage:fake_resume") == StageCallback(code="fake_resume")
+    assert parse_callback(PlansCallback(completed=False).pack()) == PlansCallback(completed=False)
+
+
+def test_parse_callback_accepts_buttons_sent_before_callback_data():
+    assert parse_callback("read_5") == ReadReportCallback(report_id=5)
+    assert parse_callback("view_reports_7") == ViewReportsCallback(student_id=7)
+    assert parse_callback("stage_fake_resume") == StageCallback(code="fake_resume")
+    assert parse_callback("plans_yes") == PlansCallback(completed=True)
+    assert parse_callback("plans_no") == PlansCallback(completed=False)
+
+
+@pytest.mark.parametrize("data", [None, "", "unknown:1", "read:abc", "read_abc", "plans_maybe", "read:1:2"])
+def test_parse_callback_rejects_unknown_data(data):
+    assert parse_callback(data) is None
+
+
+def test_router_matches_buttons_and_commands():
+    router = Router()
+
+    @router.command("report")
+    @router.text("📝 Отправить отчет")
+    async def report_handler(message):
+        pass
+
+    for text in ("📝 Отправить отчет", "/report", "/report@supervisor_bot", "/report now"):
+        assert router.match_message(SimpleNamespace(text=text)).callback is report_handler
+    for text in (None, "", "/", "/reports", "report", "📝 отправить отчет"):
+        assert router.match_message(SimpleNamespace(text=text)) is None
+
+
+def test_router_rejects_duplicate_routes():
+    router = Router()
+    router.text("❓ Помощь")(lambda message: None)
+
+    with pytest.raises(ValueError):
+        router.text("❓ Помощь")(lambda message: None)
+
+
+@pytest.mark.asyncio
+async def test_routes_pass_only_the_arguments_handlers_accept():
+    dispatcher = FakeDispatcher()
+    router = router_for(dispatcher)
+    assert router_for(dispatcher) is router
+    calls = []
+
+    @router.text("📝 Отчеты")
+    async def reports_handler(message):
+        calls.append(("reports", message.text))
+
+    @router.callback(ReadReportCallback)
+    async def mark_report_read(callback, callback_data: ReadReportCallback):
+        calls.append(("read", callback_data.report_id))
+
+    message = FakeMessage(user_id=1, text="📝 Отчеты")
+    route = router.match_message(message)
+    await dispatcher.message_handlers["route_message"](message, route, state=FakeFSMContext(), bot=None)
+
+    callback = SimpleNamespace(data="read_9")
+    route, callback_data = router.match_callback(callback)
+    await dispatcher.callback_handlers["route_callback"](callback, route, callback_data=callback_data)
+
+    assert calls == [("reports", "📝 Отчеты"), ("read", 9)]
+    assert router.match_callback(SimpleNamespace(data="view_reports:1")) is None
+
+
+def test_all_handler_modules_register_without_conflicts():
+    from handlers.admin_handlers import register_admin_handlers
+    from handlers.curator_handlers import register_curator_handlers
+    from handlers.student_handlers import register_student_handlers
+
+    dispatcher = FakeDispatcher()
+    notification_service = SimpleNamespace()
+    register_student_handlers(dispatcher, SimpleNamespace(), notification_service)
+    register_curator_handlers(dispatcher, SimpleNamespace(), notification_service)
+    register_admin_handlers(dispatcher, SimpleNamespace(), notification_service)
+
+    router = router_for(dispatcher)
+    assert router.match_message(SimpleNamespace(text="❓ Помощь")).callback.__name__ == "help_handler"
+    assert router.match_message(SimpleNamespace(text="/help")).callback.__name__ == "help_handler"
+    assert set(router.callbacks) == {StageCallback, PlansCallback, ReadReportCallback, ViewReportsCallback}
+    # Только обработчики состояний остаются отдельными фильтрами диспетчера
+    assert not any(name.startswith("button_") for name in dispatcher._message_handlers)
@@ -0,0 +1,238 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cron import CronSchedule, IntervalSchedule
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    async def sleep(self, delay: float):
+        self.sleeps.append(delay)
+        self.now += timedelta(seconds=delay)
+        await asyncio.sleep(0)
+
+
+def make_scheduler(now: datetime, **services) -> tuple:
+    clock = FakeClock(now)
+    notification_service = SimpleNamespace(**services)
+    return Scheduler(notification_service, now=clock, sleep=clock.sleep), clock
+
+
+@pytest.mark.asyncio
+async def test_job_fires_exactly_at_next_cron_time():
+    # 2024-01-01 — понедельник
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 9, 30))
+    func = AsyncMock()
+    job = scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=60)
+
+    assert await scheduler.run_pending() == 1800
+    func.assert_not_awaited()
+
+    await clock.sleep(1800)
+    await scheduler.run_pending()
+    await scheduler.join()
+
+    func.assert_awaited_once()
+    assert job.last_run == datetime(2024, 1, 1, 10, 0)
+    assert job.last_status == "ok"
+    assert job.next_run == datetime(2024, 1, 8, 10, 0)
+
+
+@pytest.mark.asyncio
+async def test_run_sleeps_until_next_fire_in_bounded_steps():
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 9, 58))
+    func = AsyncMock()
+    scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=60)
+    scheduler.max_sleep = 60
+
+    async def run_until_fired():
+        while not func.await_count:
+            await asyncio.sleep(0)
+
+    runner = asyncio.create_task(scheduler.run())
+    await asyncio.wait_for(run_until_fired(), timeout=1)
+    runner.cancel()
+    await scheduler.stop()
+
+    assert clock.sleeps[:2] == [60, 60]
+    assert clock.now >= datetime(2024, 1, 1, 10, 0)
+
+
+@pytest.mark.asyncio
+async def test_late_run_beyond_grace_is_recorded_as_misfire():
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 9, 59))
+    func = AsyncMock()
+    job = scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=300)
+
+    # Процесс «проспал» срабатывание на 10 минут
+    clock.now = datetime(2024, 1, 1, 10, 10)
+    await scheduler.run_pending()
+    await scheduler.join()
+
+    func.assert_not_awaited()
+    assert job.misfires == 1
+    assert job.next_run == datetime(2024, 1, 8, 10, 0)
+
+
+@pytest.mark.asyncio
+async def test_run_within_grace_still_fires():
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 9, 59))
+    func = AsyncMock()
+    scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=300)
+
+    clock.now = datetime(2024, 1, 1, 10, 2)
+    await scheduler.run_pending()
+    await scheduler.join()
+
+    func.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_skips_overlapping_runs():
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 10, 0))
+    release = asyncio.Event()
+    started = []
+
+    async def slow_job():
+        started.append(clock.now)
+        await release.wait()
+
+    job = scheduler.add_job("slow", IntervalSchedule(1), slow_job, max_instances=2, misfire_grace=60)
+
+    for _ in range(3):
+        await clock.sleep(1)
+        await scheduler.run_pending()
+        await asyncio.sleep(0)
+
+    assert len(started) == 2
+    assert job.running == 2
+    assert job.skipped == 1
+
+    release.set()
+    await scheduler.join()
+    assert job.running == 0
+    assert job.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_job_is_recorded_and_keeps_its_schedule():
+    scheduler, clock = make_scheduler(datetime(2024, 1, 1, 10, 0))
+    job = scheduler.add_job("broken", IntervalSchedule(60), AsyncMock(side_effect=RuntimeError("boom")))
+
+    await clock.sleep(60)
+    await scheduler.run_pending()
+    await scheduler.join()
+
+    assert job.failures == 1
+    assert job.last_status == "error"
+    assert job.next_run == datetime(2024, 1, 1, 10, 2)
+
+
+@pytest.mark.asyncio
+async def test_default_jobs_keep_existing_schedules():
+    scheduler, _ = make_scheduler(
+        datetime(2024, 1, 1, 0, 0),
+        send_weekly_reminders=AsyncMock(),
+        send_daily_missing_report_reminders=AsyncMock(),
+        send_curator_missing_reports_notifications=AsyncMock(),
+        flush_curator_digests=AsyncMock(),
+        db=AsyncMock(),
+    )
+    scheduler.register_default_jobs()
+
+    next_runs = {job["name"]: job["next_run"] for job in scheduler.describe_jobs()}
+    assert next_runs["weekly_reminders"] == datetime(2024, 1, 1, 10, 0)
+    assert next_runs["daily_missing_report_reminders"] == datetime(2024, 1, 2, 10, 0)
+    assert next_runs["curator_missing_reports"] == datetime(2024, 1, 3, 14, 0)
+    assert set(next_runs) == {
+        "weekly_reminders", "daily_missing_report_reminders", "curator_missing_reports",
+        "curator_digests",
+    }
+    with pytest.raises(ValueError):
+        scheduler.add_job("weekly_reminders", IntervalSchedule(1), AsyncMock())
+
+
+def durable_scheduler(db, now: datetime, func) -> tuple:
+    scheduler, clock = make_scheduler(now, db=db)
+    job = scheduler.add_job("weekly", CronSchedule("0 10 * * 1"), func, misfire_grace=3600, durable=True)
+    return scheduler, clock, job
+
+
+@pytest.mark.asyncio
+async def test_completed_slot_is_not_repeated_after_restart(db):
+    func = AsyncMock(return_value=12)
+    scheduler, clock, _ = durable_scheduler(db, datetime(2024, 1, 1, 9, 59), func)
+    await clock.sleep(60)
+    await scheduler.run_pending()
+    await scheduler.join()
+    func.assert_awaited_once()
+
+    # Перезапуск в 10:30: слот 10:00 уже выполнен
+    restarted, _, job = durable_scheduler(db, datetime(2024, 1, 1, 10, 30), func)
+    assert await restarted.catch_up() == 1
+    await restarted.join()
+
+    func.assert_awaited_once()
+    assert job.skipped == 1
+    runs = await db.get_latest_job_runs()
+    assert runs["weekly"]["slot"] == "2024-01-01 10:00"
+    assert runs["weekly"]["status"] == "ok"
+    assert runs["weekly"]["items"] == 12
+    assert runs["weekly"]["attempts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slot_missed_while_down_is_caught_up_once(db):
+    func = AsyncMock()
+    # Процесс упал в 09:59 и поднялся в 10:30
+    scheduler, clock, job = durable_scheduler(db, datetime(2024, 1, 1, 10, 30), func)
+
+    await scheduler.catch_up()
+    await scheduler.join()
+    # Слот, наверстанный при старте, не запускается еще раз из основного цикла
+    assert await scheduler.run_pending() > 0
+    await scheduler.join()
+
+    func.assert_awaited_once()
+    assert job.next_run == datetime(2024, 1, 8, 10, 0)
+    assert (await db.get_latest_job_runs())["weekly"]["status"] == "ok"
+
+
+@pytest.mark.asyncio
+async def test_slot_older_than_grace_is_not_caught_up(db):
+    func = AsyncMock()
+    scheduler, _, _ = durable_scheduler(db, datetime(2024, 1, 1, 11, 30), func)
+
+    assert await scheduler.catch_up() == 0
+    func.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_failed_or_interrupted_slot_runs_again_on_catch_up(db):
+    failing = AsyncMock(side_effect=RuntimeError("boom"))
+    scheduler, clock, _ = durable_scheduler(db, datetime(2024, 1, 1, 9, 59), failing)
+    await clock.sleep(60)
+    await scheduler.run_pending()
+    await scheduler.join()
+    runs = await db.get_latest_job_runs()
+    assert (runs["weekly"]["status"], runs["weekly"]["error"]) == ("error", "boom")
+
+    func = AsyncMock()
+    restarted, _, _ = durable_scheduler(db, datetime(2024, 1, 1, 10, 5), func)
+    await restarted.catch_up()
+    await restarted.join()
+
+    func.assert_awaited_once()
+    runs = await db.get_latest_job_runs()
+    assert (runs["weekly"]["status"], runs["weekly"]["attempts"]) == ("ok", 2)
@@ -2,20 +2,42 @@ from datetime import datetime
 from types import SimpleNamespace
 
 import pytest
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
 
+from background import BackgroundTasks
 from handlers.student_handlers import register_student_handlers
+from report_submission import CONTEXT_KEY
+from routing import parse_callback
 from states import ReportStates
-from tests.utils import FakeDispatcher, FakeFSMContext, FakeMessage
+from tests.utils import FakeCallbackMessage, FakeCallbackQuery, FakeDispatcher, FakeFSMContext, FakeMessage
 
 
 @pytest.fixture
-def setup_handlers():
+async def setup_handlers():
     dispatcher = FakeDispatcher()
     db = AsyncMock()
-    notification_service = SimpleNamespace(notify_curator_new_report=AsyncMock())
+    notification_service = SimpleNamespace(
+        format_new_report=MagicMock(return_value="new report"),
+        outbox=SimpleNamespace(wake=MagicMock()),
+        background=BackgroundTasks(),
+    )
     register_student_handlers(dispatcher, db, notification_service)
-    return dispatcher, db, notification_service
+    yield dispatcher, db, notification_service
+    await notification_service.background.stop()
+
+
+def report_context(**overrides):
+    context = {
+        "curator_id": 2,
+        "last_stage": None,
+        "has_previous_reports": False,
+        "week_submitted_at": None,
+        "username": "student",
+        "first_name": None,
+        "last_name": None,
+    }
+    context.update(overrides)
+    return context
 
 
 @pytest.mark.asyncio
@@ -24,11 +46,11 @@ async def test_report_handler_without_curator(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = None
+    db.get_report_context.return_value = report_context(curator_id=None)
 
     await handler(message, state)
 
-    assert db.get_student_curator.await_args[0][0] == 1
+    assert db.get_report_context.await_args[0][0] == 1
     assert len(message.answers) == 1
     assert "нет закрепленного куратора" in message.answers[0][0].lower()
 
@@ -39,10 +61,9 @@ async def test_report_handler_weekly_report_exists(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = {"user_id": 2}
-    db.get_reports_for_current_week.return_value = [
-        {"created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-    ]
+    db.get_report_context.return_value = report_context(
+        week_submitted_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
 
     await handler(message, state)
 
@@ -56,13 +77,14 @@ async def test_report_handler_starts_new_report_flow(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = {"user_id": 2}
-    db.get_reports_for_current_week.return_value = []
-    db.get_last_stage_choice.return_value = "stage"
+    db.get_report_context.return_value = report_context(last_stage="stage", has_previous_reports=True)
 
     await handler(message, state)
 
     assert state.state == ReportStates.waiting_for_stage_selection
+    assert state.data[CONTEXT_KEY] == db.get_report_context.return_value
+    db.get_week_status.assert_not_awaited()
+    db.get_last_stage_choice.assert_not_awaited()
     assert len(message.answers) == 1
     assert "начинаем заполнение еженедельного отчета" in message.answers[0][0].lower()
 
@@ -78,16 +100,78 @@ async def test_process_problems_saves_report_and_notifies(setup_handlers):
         "plans": "plans",
         "plans_completed": True,
         "plans_failure_reason": "reason",
+        CONTEXT_KEY: report_context(),
     }
-    db.save_report = AsyncMock()
+    db.submit_report.return_value = {"report_id": 1, "curator_id": 2, "buffered": False, "already_submitted": False}
 
     await handler(message, state)
 
-    db.save_report.assert_awaited_once()
+    db.submit_report.assert_awaited_once_with(
+        user_id=5,
+        current_stage="stage",
+        plans="plans",
+        problems="problem text",
+        plans_completed=True,
+        plans_failure_reason="reason",
+        curator_payload={"text": "new report"},
+    )
+    db.get_report_context.assert_not_awaited()
+    db.save_report.assert_not_awaited()
+    notification_service.outbox.wake.assert_called_once()
     assert state.cleared is True
     assert len(message.answers) == 1
     assert "отчет сохранен" in message.answers[0][0].lower()
-    notification_service.notify_curator_new_report.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_process_problems_rejects_second_report_of_the_week(setup_handlers):
+    dispatcher, db, notification_service = setup_handlers
+    handler = dispatcher.message_handlers["process_problems"]
+    message = FakeMessage(user_id=5, text="problem text")
+    state = FakeFSMContext()
+    # Контекст в FSM сохранен до первой отправки и о ней не знает
+    state.data = {"current_stage": "stage", "plans": "plans", CONTEXT_KEY: report_context()}
+    db.submit_report.return_value = {"report_id": None, "curator_id": None, "buffered": False, "already_submitted": True}
+
+    await handler(message, state)
+
+    notification_service.outbox.wake.assert_not_called()
+    assert state.cleared is True
+    assert len(message.answers) == 1
+    assert "уже отправлен" in message.answers[0][0].lower()
+    assert "отчет сохранен" not in message.answers[0][0].lower()
+
+
+@pytest.mark.asyncio
+async def test_process_problems_leaves_digest_reports_to_the_digest(setup_handlers):
+    dispatcher, db, notification_service = setup_handlers
+    handler = dispatcher.message_handlers["process_problems"]
+    message = FakeMessage(user_id=5, text="problem text")
+    state = FakeFSMContext()
+    state.data = {"current_stage": "stage", "plans": "plans", CONTEXT_KEY: report_context()}
+    db.submit_report.return_value = {"report_id": 1, "curator_id": 2, "buffered": True, "already_submitted": False}
+
+    await handler(message, state)
+
+    db.submit_report.assert_awaited_once()
+    notification_service.outbox.wake.assert_not_called()
+    assert "отчет сохранен" in message.answers[0][0].lower()
+
+
+@pytest.mark.asyncio
+async def test_process_stage_selection_uses_context_from_state(setup_handlers):
+    dispatcher, db, _ = setup_handlers
+    handler = dispatcher.callback_handlers["process_stage_selection"]
+    callback = FakeCallbackQuery(user_id=1, data="stage:legend", message=FakeCallbackMessage())
+    state = FakeFSMContext()
+    state.data = {CONTEXT_KEY: report_context(has_previous_reports=True)}
+
+    await handler(callback, state, parse_callback(callback.data))
+
+    assert state.state == ReportStates.waiting_for_plans_completion
+    assert state.data["current_stage"] == "Изучение легенды"
+    db.has_previous_reports.assert_not_awaited()
+    db.get_report_context.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -127,7 +211,7 @@ async def test_my_reports_handler_shows_reports(setup_handlers):
             "created_at": "2025-11-01 10:00:00"
         }
     ]
-    db.get_reports_for_current_week.return_value = []
+    db.get_week_status.return_value = None
 
     await handler(message)
 
@@ -163,14 +247,10 @@ async def test_my_reports_handler_shows_current_week_status(setup_handlers):
             "created_at": "2025-11-01 10:00:00"
         }
     ]
-    db.get_reports_for_current_week.return_value = [
-        {
-            "current_stage": "Stage 1",
-            "plans": "Plans",
-            "problems": "Problems",
-            "created_at": "2025-11-03 10:00:00"
-        }
-    ]
+    db.get_week_status.return_value = {
+        "report_id": 1,
+        "submitted_at": "2025-11-03 10:00:00",
+    }
 
     await handler(message)
 
@@ -281,10 +361,10 @@ async def test_report_handler_with_existing_weekly_report(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = {"user_id": 10}
-    db.get_reports_for_current_week.return_value = [
-        {"created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-    ]
+    db.get_report_context.return_value = report_context(
+        curator_id=10,
+        week_submitted_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
 
     await handler(message, state)
 
@@ -297,9 +377,7 @@ async def test_report_handler_starts_flow_for_first_report(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = {"user_id": 10}
-    db.get_reports_for_current_week.return_value = []
-    db.get_last_stage_choice.return_value = None
+    db.get_report_context.return_value = report_context(curator_id=10)
 
     await handler(message, state)
 
@@ -313,9 +391,7 @@ async def test_report_handler_shows_last_stage_recommendation(setup_handlers):
     handler = dispatcher.message_handlers["report_handler"]
     message = FakeMessage(user_id=1)
     state = FakeFSMContext()
-    db.get_student_curator.return_value = {"user_id": 10}
-    db.get_reports_for_current_week.return_value = []
-    db.get_last_stage_choice.return_value = "Previous stage"
+    db.get_report_context.return_value = report_context(curator_id=10, last_stage="Previous stage")
 
     await handler(message, state)
 
@@ -392,7 +468,7 @@ async def test_my_reports_handler_truncates_long_text(setup_handlers):
             "created_at": "2025-11-01 10:00:00"
         }
     ]
-    db.get_reports_for_current_week.return_value = []
+    db.get_week_status.return_value = None
 
     await handler(message)
 
@@ -417,7 +493,7 @@ async def test_my_reports_handler_shows_max_5_reports(setup_handlers):
         for i in range(1, 8)
     ]
     db.get_user_reports.return_value = reports
-    db.get_reports_for_current_week.return_value = []
+    db.get_week_status.return_value = None
 
     await handler(message)
 
@@ -18,19 +18,32 @@ class FakeBot:
 
 class FakeDispatcher:
     def __init__(self):
-        self.message_handlers = {}
-        self.callback_handlers = {}
+        self._message_handlers = {}
+        self._callback_handlers = {}
+
+    def _routed_handlers(self) -> Dict[str, Any]:
+        # Кнопки, команды и callback-кнопки регистрируются в routing.Router, а не в диспетчере
+        router = getattr(self, "_button_router", None)
+        return router.handlers if router else {}
+
+    @property
+    def message_handlers(self) -> Dict[str, Any]:
+        return {**self._message_handlers, **self._routed_handlers()}
+
+    @property
+    def callback_handlers(self) -> Dict[str, Any]:
+        return {**self._callback_handlers, **self._routed_handlers()}
 
     def message(self, *filters, **kwargs):
         def decorator(handler):
-            self.message_handlers[handler.__name__] = handler
+            self._message_handlers[handler.__name__] = handler
             return handler
 
         return decorator
 
     def callback_query(self, *filters, **kwargs):
         def decorator(handler):
-            self.callback_handlers[handler.__name__] = handler
+            self._callback_handlers[handler.__name__] = handler
             return handler
 
         return decorator
@@ -58,7 +71,8 @@ class FakeFSMContext:
 
 
 class FakeMessage:
-    def __init__(self, user_id, text="", username=None, first_name=None, last_name=None):
+    def __init__(self, user_id, text="", username=None, first_name=None, last_name=None, message_id=1):
+        self.message_id = message_id
         self.text = text
         self.from_user = SimpleNamespace(id=user_id, username=username, first_name=first_name, last_name=last_name)
         self.answers: List[Tuple[str, Dict]] = []
@@ -74,13 +88,19 @@ class FakeMessage:
 
 
 class FakeCallbackMessage:
-    def __init__(self, text=""):
+    def __init__(self, text="", reply_markup=None):
         self.text = text
+        self.reply_markup = reply_markup
         self.edits: List[Tuple[str, Dict]] = []
+        self.markup_edits: List[Any] = []
         self.answers: List[Tuple[str, Dict]] = []
 
     async def edit_text(self, text, **kwargs):
         self.edits.append((text, kwargs))
+
+    async def edit_reply_markup(self, reply_markup=None, **kwargs):
+        self.markup_edits.append(reply_markup)
+        self.reply_markup = reply_markup
     
     async def answer(self, text, **kwargs):
         self.answers.append((text, kwargs))
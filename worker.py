@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.client.default import DefaultBotProperties
+from database import Database
+from leader import LeaderLease
+from notifications import INTERACTIVE_KINDS, NotificationService
+from scheduler import Scheduler
+import config
+from config import BOT_TOKEN
+
+# Фоновый процесс: задачи по расписанию и массовые рассылки.
+# Бот (bot.py) только обрабатывает обновления; с ним worker связан
+# только через базу: outbox, журнал job_runs и аренду лидерства.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+    db = Database()
+    # Интерактивные уведомления доставляет бот, worker — все остальные
+    notification_service = NotificationService(bot, db, outbox_kinds=INTERACTIVE_KINDS, outbox_exclude=True)
+    lease = LeaderLease(
+        db,
+        ttl=float(config.SCHEDULER_LEASE_TTL_SECONDS),
+        renew_interval=float(config.SCHEDULER_LEASE_RENEW_SECONDS),
+    )
+    scheduler = Scheduler(notification_service, lease=lease)
+    scheduler.register_default_jobs()
+
+    await db.init_db()
+    logger.info(f"Worker {lease.holder} запущен")
+
+    lease_task = asyncio.create_task(lease.run())
+    scheduler_task = asyncio.create_task(scheduler.run())
+    outbox_task = asyncio.create_task(notification_service.outbox.run())
+    stats_task = asyncio.create_task(
+        notification_service.run_delivery_stats(float(config.DELIVERY_STATS_FLUSH_INTERVAL_SECONDS))
+    )
+
+    try:
+        await asyncio.gather(lease_task, scheduler_task, outbox_task, stats_task)
+    finally:
+        scheduler_task.cancel()
+        await scheduler.stop()
+        lease_task.cancel()
+        await lease.release()
+        outbox_task.cancel()
+        await notification_service.background.stop(timeout=float(config.BACKGROUND_SHUTDOWN_TIMEOUT_SECONDS))
+        stats_task.cancel()
+        await notification_service.flush_delivery_stats()
+        await db.close()
+        await bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())